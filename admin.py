@@ -1,16 +1,16 @@
+import time
 import streamlit as st
-import sqlite3
-import pandas as pd
 from search import show_search_page  # Import the search page function
+import db
+import importer
+import pagination
+import perf
+import schema
+import shards
+from db import get_connection  # Shared per-thread connection
 
-# --------------------------------
-# Database connection
-# --------------------------------
-def get_connection():
-    """
-    Returns a connection object to the SQLite database.
-    """
-    return sqlite3.connect("mydatabase.db")
+# Whole reruns are timed as stage 'rerun.admin' (see the Performance page).
+rerun_start = time.perf_counter()
 
 # --------------------------------
 # Refresh the Search table
@@ -19,44 +19,121 @@ def refresh_search_table():
     """
     Re-populates the 'Search' table by joining data from
     Nursery_Tree_Inventory, Trees, and Nurseries.
+
+    Search is normally kept current by triggers, so this is only
+    needed to repair it (see verify_search_table).
+    """
+    conn = get_connection()
+    schema.rebuild_search_table(conn)
+
+def verify_search_table():
+    """
+    Compares the incrementally maintained 'Search' table with a
+    full rebuild. Returns the 'missing' and 'stale' rows, the
+    'unlinked' inventory rows whose names match no tree or nursery,
+    the 'facets' counts that disagree with the Search table and the
+    'heights' index entries that do.
     """
     conn = get_connection()
-    query = '''
-        SELECT
-            nti.tree_common_name,
-            nti.Quantity_in_stock,
-            nti.Min_height,
-            nti.Max_height,
-            nti.Packaging_type,
-            nti.Price,
-            t.Scientific_name,
-            t.Growth_rate,
-            t.Watering_demand,
-            t.shape,
-            t.Care_instructions,
-            t.Main_Photo_url,
-            t.Origin,
-            t.Soil_type,
-            t.Root_type,
-            t.Leaf_Type,
-            n.Address
-        FROM Nursery_Tree_Inventory nti
-        LEFT JOIN Trees t
-            ON nti.tree_common_name = t.Common_name
-        LEFT JOIN Nurseries n
-            ON nti.nursery_name = n.Nursery_name
-    '''
-    df = pd.read_sql_query(query, conn)
-    
-    # Clear existing data in 'Search' table
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM Search")
-    
-    # Insert new data
-    df.to_sql('Search', conn, if_exists='append', index=False)
-    
-    conn.commit()
-    conn.close()
+    diff = schema.verify_search_table(conn)
+    return diff
+
+# --------------------------------
+# Bulk CSV import
+# --------------------------------
+def run_import(table, uploaded_file):
+    """
+    Imports an uploaded CSV into 'table' in the background and shows its
+    progress. Uploads whose contents were already imported are skipped,
+    so reruns with the file still in the uploader do not import it again.
+    Returns True while the import is still running.
+    """
+    job = importer.submit_import(table, uploaded_file.name, uploaded_file.getvalue())
+    if job.skipped:
+        st.info(f"This file was already imported into {table} on {job.report['finished_at']}; skipped.")
+    elif not job.done:
+        st.progress(job.progress, text=f"Importing {job.file_name}: {job.rows_read} row(s) read...")
+        return True
+    elif job.error:
+        st.error(f"Import of {job.file_name} failed: {job.error}")
+    else:
+        show_import_report(job.report)
+    return False
+
+def show_import_report(report):
+    """
+    Shows row counts, throughput and rejected rows of an import.
+    """
+    st.success(
+        f"{report['table']} CSV imported: {report['inserted']} new, {report['updated']} updated, "
+        f"{report['rejected']} rejected of {report['rows_read']} row(s) "
+        f"in {report['seconds']:.2f}s ({report['rows_per_second']:.0f} rows/s)."
+    )
+    if report.get("resumed"):
+        st.info(f"Resumed after the {report['resumed']} row(s) an earlier attempt committed.")
+    if report["ignored_columns"]:
+        st.info("Ignored columns: " + ", ".join(report["ignored_columns"]))
+    if report["rejects"]:
+        st.warning("Rejected rows (line, reason):")
+        st.table(report["rejects"])
+
+# --------------------------------
+# Performance (hidden page)
+# --------------------------------
+def show_performance_page():
+    """
+    Shows the query and rerun timings recorded by perf in this process:
+    the slowest statements, p50/p95 per query fingerprint and per stage,
+    and downloads in JSON and Prometheus text format.
+    """
+    st.title("Performance")
+    data = perf.snapshot()
+    st.write(f"Statements slower than {data['slow_query_ms']:.0f} ms are logged with their query plan "
+             "(set HASAR_SLOW_QUERY_MS to change).")
+
+    col_json, col_prom, col_reset = st.columns(3)
+    col_json.download_button("Download JSON", perf.to_json(), "hasar-perf.json", "application/json")
+    col_prom.download_button("Download Prometheus", perf.to_prometheus(), "hasar-perf.prom", "text/plain")
+    if col_reset.button("Reset"):
+        perf.reset()
+        st.rerun()
+
+    st.subheader("Slowest statements")
+    st.dataframe([
+        {"ms": round(entry["ms"], 2), "rows": entry["rows"], "caller": entry["caller"], "sql": entry["fingerprint"]}
+        for entry in data["slowest"]
+    ])
+
+    st.subheader("Queries by fingerprint")
+    queries = sorted(data["queries"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    st.dataframe([
+        {"count": s["count"], "p50 ms": round(s["p50_ms"], 2), "p95 ms": round(s["p95_ms"], 2),
+         "max ms": round(s["max_ms"], 2), "total ms": round(s["total_ms"], 1), "rows": s["rows"],
+         "top caller": next(iter(s["callers"]), ""), "sql": key}
+        for key, s in queries
+    ])
+
+    st.subheader("Reruns and page stages")
+    st.dataframe([
+        {"stage": key, "count": s["count"], "p50 ms": round(s["p50_ms"], 2),
+         "p95 ms": round(s["p95_ms"], 2), "max ms": round(s["max_ms"], 2)}
+        for key, s in sorted(data["stages"].items())
+    ])
+
+# --------------------------------
+# Browse a table page by page
+# --------------------------------
+def show_table_browser(table):
+    """
+    Shows 'table' one page at a time in key order. Only the visible
+    page is fetched; the row count is cached until the table changes.
+    """
+    key = "browse_" + table
+    page_size = pagination.page_size_select(key, db.PAGE_SIZE)
+    after = pagination.current_cursor(key, page_size)
+    columns, rows, following = db.browse_table(table, page_size, after)
+    st.dataframe([dict(zip(columns, row)) for row in rows], hide_index=True)
+    pagination.pager(key, following, len(rows), db.count_table_rows(table), page_size)
 
 # --------------------------------
 # Helper: Insert single rows
@@ -64,61 +141,73 @@ def refresh_search_table():
 def insert_into_nurseries(Registration_code, Nursery_name, Address,
                           Contact_name, Contact_phone, Google_map_link,
                           Additional_notes):
-    conn = get_connection()
-    cursor = conn.cursor()
-    query = """
-        INSERT INTO Nurseries
-        (Registration_code, Nursery_name, Address, Contact_name,
-         Contact_phone, Google_map_link, Additional_notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
-    cursor.execute(query, (Registration_code, Nursery_name, Address,
-                           Contact_name, Contact_phone, Google_map_link,
-                           Additional_notes))
-    conn.commit()
-    conn.close()
+    with db.using(shards.nursery_database(Nursery_name)), db.transaction() as conn:
+        query = """
+            INSERT INTO Nurseries
+            (Registration_code, Nursery_name, Address, Contact_name,
+             Contact_phone, Google_map_link, Additional_notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        conn.execute(query, (Registration_code, Nursery_name, Address,
+                             Contact_name, Contact_phone, Google_map_link,
+                             Additional_notes))
 
 def insert_into_trees(Common_name, Scientific_name, Growth_rate,
                       Watering_demand, shape, Care_instructions,
                       Main_Photo_url, Origin, Soil_type, Root_type,
                       Leaf_Type):
-    conn = get_connection()
-    cursor = conn.cursor()
     query = """
         INSERT INTO Trees
-        (Common_name, Scientific_name, Growth_rate, Watering_demand,
+        (tree_id, Common_name, Scientific_name, Growth_rate, Watering_demand,
          shape, Care_instructions, Main_Photo_url, Origin, Soil_type,
          Root_type, Leaf_Type)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
-    cursor.execute(query, (Common_name, Scientific_name, Growth_rate,
-                           Watering_demand, shape, Care_instructions,
-                           Main_Photo_url, Origin, Soil_type,
-                           Root_type, Leaf_Type))
-    conn.commit()
-    conn.close()
+    # Every nursery shard keeps the whole Trees catalog: the tree goes
+    # into all of them, under the id the first shard gives it
+    try:
+        with shards.transaction_all() as conns:
+            tree_id = None
+            for conn in conns.values():
+                cursor = conn.cursor()
+                cursor.execute(query, (tree_id, Common_name, Scientific_name, Growth_rate,
+                                       Watering_demand, shape, Care_instructions,
+                                       Main_Photo_url, Origin, Soil_type,
+                                       Root_type, Leaf_Type))
+                tree_id = cursor.lastrowid
+    except Exception:
+        # A commit may have failed after the first shard's went through
+        if shards.ENABLED:
+            shards.sync_trees()
+        raise
 
 def insert_into_nursery_inventory(nursery_name, tree_common_name,
                                   Quantity_in_stock, Min_height,
                                   Max_height, Packaging_type, Price):
-    conn = get_connection()
-    cursor = conn.cursor()
-    query = """
-        INSERT INTO Nursery_Tree_Inventory
-        (nursery_name, tree_common_name, Quantity_in_stock,
-         Min_height, Max_height, Packaging_type, Price)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
-    cursor.execute(query, (nursery_name, tree_common_name, Quantity_in_stock,
-                           Min_height, Max_height, Packaging_type, Price))
-    conn.commit()
-    conn.close()
+    with db.using(shards.nursery_database(nursery_name)), db.transaction() as conn:
+        query = """
+            INSERT INTO Nursery_Tree_Inventory
+            (nursery_name, tree_common_name, Quantity_in_stock,
+             Min_height, Max_height, Packaging_type, Price)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        conn.execute(query, (nursery_name, tree_common_name, Quantity_in_stock,
+                             Min_height, Max_height, Packaging_type, Price))
 
 # --------------------------------
 # Main App
 # --------------------------------
 st.sidebar.title("Navigation")
-page_selection = st.sidebar.selectbox("Go to:", ["Search Page", "Data Entry Page"])
+pages = ["Search Page", "Data Entry Page"]
+if "perf" in st.query_params:
+    # Hidden unless the URL carries ?perf
+    pages.append("Performance")
+page_selection = st.sidebar.selectbox("Go to:", pages)
+if shards.ENABLED:
+    # Every page below reads the chosen nursery shard; rows entered or
+    # imported go to their nursery's shard (trees to every shard)
+    shard = st.sidebar.selectbox("Shard", shards.names())
+    db.use_database(shards.path_of(shard))
 
 # ---------------------------
 # PAGE 1: SEARCH PAGE
@@ -136,8 +225,9 @@ elif page_selection == "Data Entry Page":
     # ------------------------------------
     # TABS for each main table
     # ------------------------------------
-    tab_names = ["Nurseries", "Trees", "Nursery_Tree_Inventory"]
+    tab_names = ["Nurseries", "Trees", "Nursery_Tree_Inventory", "Orders"]
     tabs = st.tabs(tab_names)
+    imports_running = False
 
     # =======================
     # 1) Nurseries Tab
@@ -149,12 +239,7 @@ elif page_selection == "Data Entry Page":
         st.subheader("Bulk Upload CSV")
         nurseries_file = st.file_uploader("Upload CSV for Nurseries", type=["csv"])
         if nurseries_file:
-            df = pd.read_csv(nurseries_file)
-            conn = get_connection()
-            df.to_sql("Nurseries", conn, if_exists="append", index=False)
-            conn.commit()
-            conn.close()
-            st.success("Nurseries CSV uploaded successfully.")
+            imports_running |= run_import("Nurseries", nurseries_file)
 
         # -- Single Entry
         st.subheader("Single Entry Form")
@@ -180,6 +265,10 @@ elif page_selection == "Data Entry Page":
                 )
                 st.success("New row added to Nurseries.")
 
+        # -- Browse
+        st.subheader("Browse")
+        show_table_browser("Nurseries")
+
     # =======================
     # 2) Trees Tab
     # =======================
@@ -190,12 +279,7 @@ elif page_selection == "Data Entry Page":
         st.subheader("Bulk Upload CSV")
         trees_file = st.file_uploader("Upload CSV for Trees", type=["csv"])
         if trees_file:
-            df = pd.read_csv(trees_file)
-            conn = get_connection()
-            df.to_sql("Trees", conn, if_exists="append", index=False)
-            conn.commit()
-            conn.close()
-            st.success("Trees CSV uploaded successfully.")
+            imports_running |= run_import("Trees", trees_file)
 
         # -- Single Entry
         st.subheader("Single Entry Form")
@@ -229,6 +313,10 @@ elif page_selection == "Data Entry Page":
                 )
                 st.success("New row added to Trees.")
 
+        # -- Browse
+        st.subheader("Browse")
+        show_table_browser("Trees")
+
     # ================================
     # 3) Nursery_Tree_Inventory Tab
     # ================================
@@ -239,24 +327,14 @@ elif page_selection == "Data Entry Page":
         st.subheader("Bulk Upload CSV")
         inventory_file = st.file_uploader("Upload CSV for Nursery_Tree_Inventory", type=["csv"])
         if inventory_file:
-            df = pd.read_csv(inventory_file)
-            conn = get_connection()
-            df.to_sql("Nursery_Tree_Inventory", conn, if_exists="append", index=False)
-            conn.commit()
-            conn.close()
-            st.success("Nursery_Tree_Inventory CSV uploaded successfully.")
+            imports_running |= run_import("Nursery_Tree_Inventory", inventory_file)
 
         # -- Single Entry
         st.subheader("Single Entry Form")
         with st.form("inventory_single_entry_form"):
-            # --- Fetch existing nursery names
-            conn = get_connection()
-            nurseries_df = pd.read_sql_query("SELECT Nursery_name FROM Nurseries", conn)
-            trees_df = pd.read_sql_query("SELECT Common_name FROM Trees", conn)
-            conn.close()
-
-            nursery_options = sorted(nurseries_df["Nursery_name"].unique())
-            tree_options = sorted(trees_df["Common_name"].unique())
+            # --- Fetch existing nursery names (cached until the tables change)
+            nursery_options = db.get_nursery_names()
+            tree_options = db.get_tree_names()
 
             nursery_name = st.selectbox("nursery_name", nursery_options)
             tree_common_name = st.selectbox("tree_common_name", tree_options)
@@ -280,11 +358,87 @@ elif page_selection == "Data Entry Page":
                 )
                 st.success("New row added to Nursery_Tree_Inventory.")
 
+        # -- Browse
+        st.subheader("Browse")
+        show_table_browser("Nursery_Tree_Inventory")
+
+    # =======================
+    # 4) Orders Tab
+    # =======================
+    with tabs[3]:
+        st.header("Orders")
+
+        # -- Status updates are appended to the order's history
+        st.subheader("Update Status")
+        with st.form("order_status_form"):
+            order_id = st.number_input("order_id", min_value=1, step=1)
+            new_status = st.selectbox("Status", db.ORDER_STATUSES)
+            note = st.text_input("Note")
+            # The order's shard, whichever one the sidebar shows
+            order_path = shards.order_database(int(order_id)) or db.database_path()
+            if st.form_submit_button("Add Status"):
+                try:
+                    with db.using(order_path):
+                        db.add_order_status(int(order_id), new_status, note)
+                    st.success(f"Order {order_id} is now '{new_status}'.")
+                except ValueError as exc:
+                    st.error(str(exc))
+        with db.using(order_path):
+            history = db.get_order_events(int(order_id))
+        if history:
+            st.write(f"History of order {order_id}:")
+            st.dataframe([
+                {"time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) if ts else "", "status": status, "note": note}
+                for ts, status, note in history
+            ], hide_index=True)
+
+        st.subheader("Orders")
+        show_table_browser("Orders")
+        st.subheader("Status Events")
+        show_table_browser("Order_Status_Events")
+        st.subheader("Customers")
+        show_table_browser("Customers")
+
     # -------------------------------
     # Refresh Search Table Button
     # -------------------------------
     st.subheader("Refresh 'Search' Table")
-    st.write("Refresh the 'Search' table to pull updated data from the Nurseries, Trees, and Nursery_Tree_Inventory tables.")
+    st.write("The 'Search' table is updated automatically whenever the Nurseries, Trees, or Nursery_Tree_Inventory tables change.")
+    st.write("Verify compares it with a full rebuild; Refresh Now rebuilds it from scratch.")
+    if st.button("Verify"):
+        diff = verify_search_table()
+        if not diff["missing"] and not diff["stale"]:
+            st.success("Search table matches a full rebuild.")
+        else:
+            st.warning(f"Search table is out of date: {len(diff['missing'])} missing row(s), {len(diff['stale'])} stale row(s).")
+        if diff["unlinked"]:
+            st.warning(f"{len(diff['unlinked'])} inventory row(s) name a tree or nursery that does not exist "
+                       "(tree_inventory_id, nursery_name, tree_common_name):")
+            st.table(diff["unlinked"][:100])
+        if diff["facets"]:
+            st.warning(f"{len(diff['facets'])} facet count(s) are off; Refresh Now recounts them "
+                       "(facet, value, stored count, actual count):")
+            st.table(diff["facets"][:100])
+        if diff["heights"]:
+            st.warning(f"The height index is out of date for {len(diff['heights'])} row(s); Refresh Now rebuilds it.")
     if st.button("Refresh Now"):
         refresh_search_table()
         st.success("Search table refreshed successfully.")
+
+    # -------------------------------
+    # Poll background imports
+    # -------------------------------
+    # Rerun shortly while an import is running so its progress bar
+    # moves; the rest of the page has already been drawn.
+    if imports_running:
+        perf.record_stage("rerun.admin", time.perf_counter() - rerun_start)
+        time.sleep(0.5)
+        st.rerun()
+
+# ---------------------------
+# PAGE 3: PERFORMANCE (hidden)
+# ---------------------------
+elif page_selection == "Performance":
+    show_performance_page()
+
+perf.record_stage("rerun.admin", time.perf_counter() - rerun_start)
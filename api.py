@@ -0,0 +1,338 @@
+"""
+JSON API over the service layer, as a plain ASGI application.
+
+Reads run on worker threads (asyncio.to_thread), each with its own
+SQLite connection from db.get_connection. Every read carries an ETag
+and Last-Modified derived from the versions of the tables it depends
+on, so clients and proxies can revalidate with If-None-Match /
+If-Modified-Since and get 304 Not Modified until the data changes.
+
+    GET  /api/search?q=red+maple&page=0
+    GET  /api/trees/<tree_inventory_id>
+    GET  /api/inventory?tree=&min_height=&max_height=&height_mode=within|overlaps&packaging=
+                       &min_growth_rate=&max_growth_rate=&min_price=&max_price=&shape=
+                       &leaf_type=&soil_type=&watering_demand=&origin=&page_size=50&after=<cursor>
+    GET  /api/facets?<the same filters>   (counts per value, height/price/growth rate histograms)
+    GET  /api/orders/status?email=&page_size=20&after=<cursor>
+    POST /api/orders   {"tree_inventory_id": 1, "quantity": 2, "email": ..., ...}
+    GET  /api/health
+
+Lists are paged by key: a page carries a 'next' cursor, passed back
+as 'after' for the following page, and a cached 'total'.
+
+Serve with any ASGI server, e.g.
+
+    uvicorn api:app --workers 4
+    python api.py --port 8000   (uses uvicorn)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qsl
+
+import db
+import service
+
+logger = logging.getLogger("hasar.api")
+
+# Public reads may be stored by proxies but must be revalidated;
+# order status is personal and is only cached by the client.
+PUBLIC_CACHE = "public, max-age=0, must-revalidate"
+PRIVATE_CACHE = "private, no-cache"
+
+MAX_BODY_BYTES = 64 * 1024
+
+MAX_PAGE_SIZE = 500
+
+# The last search page whose row offsets still fit an SQLite integer.
+MAX_SEARCH_PAGE = db.MAX_INTEGER // (db.RESULTS_PER_PAGE + 1) - 1
+
+
+class HTTPError(Exception):
+    """
+    Ends a request with an error status and a JSON {"error": message}.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# --------------------------------
+# Request parameters
+# --------------------------------
+def _number(query, name, kind, default=None):
+    """
+    Returns query parameter 'name' converted with 'kind', or 'default'.
+    Integers must fit SQLite's and numbers must be finite.
+    """
+    value = query.get(name, "")
+    if value == "":
+        return default
+    try:
+        number = kind(value)
+    except ValueError:
+        number = None
+    if kind is int and number is not None and abs(number) <= db.MAX_INTEGER:
+        return number
+    if kind is not int and number is not None and math.isfinite(number):
+        return number
+    raise HTTPError(400, f"{name} must be {'an integer' if kind is int else 'a finite number'}")
+
+
+def _choice(query, name, choices):
+    """
+    Returns query parameter 'name' if it is one of 'choices', or the
+    first choice if it is absent.
+    """
+    value = query.get(name) or choices[0]
+    if value not in choices:
+        raise HTTPError(400, f"{name} must be one of: {', '.join(choices)}")
+    return value
+
+
+def _search(query):
+    page = max(0, _number(query, "page", int, 0))
+    if page > MAX_SEARCH_PAGE:
+        raise HTTPError(400, f"page must be at most {MAX_SEARCH_PAGE}")
+    return "search_trees", lambda: service.search_trees(query.get("q", ""), page)
+
+
+def _filters(query):
+    """
+    Returns the db.build_search_filter arguments of an inventory query.
+    """
+    return {
+        "tree_choice": query.get("tree") or "All",
+        "min_height": _number(query, "min_height", float),
+        "max_height": _number(query, "max_height", float),
+        "packaging_choice": query.get("packaging") or "All",
+        "min_growth_rate": _number(query, "min_growth_rate", float),
+        "max_growth_rate": _number(query, "max_growth_rate", float),
+        "shape_choice": query.get("shape") or "All",
+        "leaf_type": query.get("leaf_type") or "All",
+        "soil_type": query.get("soil_type") or "All",
+        "watering_demand": query.get("watering_demand") or "All",
+        "origin": query.get("origin") or "All",
+        "min_price": _number(query, "min_price", float),
+        "max_price": _number(query, "max_price", float),
+        "height_mode": _choice(query, "height_mode", db.HEIGHT_MODES),
+    }
+
+
+def _page_size(query, default):
+    return min(MAX_PAGE_SIZE, max(1, _number(query, "page_size", int, default)))
+
+
+def _inventory(query):
+    filters = _filters(query)
+    page_size = _page_size(query, db.PAGE_SIZE)
+    return "search_inventory", lambda: service.search_inventory(filters, query.get("after"), page_size)
+
+
+def _facets(query):
+    filters = _filters(query)
+    return "facets", lambda: service.facets(filters)
+
+
+def _order_status(query):
+    email = query.get("email", "")
+    if not email:
+        raise HTTPError(400, "email is required")
+    page_size = _page_size(query, db.ORDERS_PAGE_SIZE)
+    return "order_status", lambda: service.order_status(email, query.get("after"), page_size)
+
+
+def _tree(query, tree_inventory_id):
+    tree_inventory_id = int(tree_inventory_id)
+    if tree_inventory_id > db.MAX_INTEGER:
+        raise HTTPError(404, "not found")  # no row can have this id
+    return "tree_details", lambda: service.tree_details(tree_inventory_id)
+
+
+# (path pattern, handler): a handler turns the query (and path groups)
+# into (service read name, function computing the response body).
+READS = [
+    (re.compile(r"/api/search"), _search),
+    (re.compile(r"/api/trees/(\d+)"), _tree),
+    (re.compile(r"/api/inventory"), _inventory),
+    (re.compile(r"/api/facets"), _facets),
+    (re.compile(r"/api/orders/status"), _order_status),
+]
+
+
+# --------------------------------
+# Handlers (run on worker threads)
+# --------------------------------
+def _not_modified(headers, etag, last_modified):
+    """
+    Returns True if the request's validators still match.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _read(name, key, compute, headers):
+    """
+    Answers a GET: 304 if the client's copy is current, else the JSON
+    body with fresh validators. Returns (status, headers, body).
+    """
+    etag, last_modified = service.validators(name, key)
+    response_headers = {
+        "etag": etag,
+        "cache-control": PRIVATE_CACHE if name == "order_status" else PUBLIC_CACHE,
+    }
+    if last_modified is not None:
+        response_headers["last-modified"] = formatdate(last_modified, usegmt=True)
+    if _not_modified(headers, etag, last_modified):
+        return 304, response_headers, None
+    try:
+        body = compute()
+    except ValueError as exc:  # invalid input, e.g. a bad cursor
+        raise HTTPError(400, str(exc))
+    if body is None:
+        raise HTTPError(404, "not found")
+    return 200, response_headers, body
+
+
+def _place_order(payload):
+    """
+    Answers POST /api/orders. Returns (status, headers, body).
+    """
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "expected a JSON object")
+    text_fields = ("username", "customer_full_name", "address", "whatsapp_number", "email",
+                   "payment_preferences")
+    unknown = set(payload) - {"tree_inventory_id", "quantity", *text_fields}
+    if unknown:
+        raise HTTPError(400, "unknown field(s): " + ", ".join(sorted(unknown)))
+    for name in text_fields:
+        if not isinstance(payload.get(name, ""), str):
+            raise HTTPError(400, f"{name} must be a string")
+    try:
+        result = service.place_order(**payload)
+    except (TypeError, ValueError) as exc:
+        raise HTTPError(400, str(exc))
+    status = 201 if result["status"] == db.ORDER_PLACED else 409
+    return status, {"cache-control": "no-store"}, result
+
+
+# --------------------------------
+# ASGI application
+# --------------------------------
+async def _body(receive):
+    """
+    Reads the whole request body.
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, "request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, headers, body):
+    payload = b"" if body is None else json.dumps(body).encode()
+    raw_headers = [(name.encode(), value.encode()) for name, value in headers.items()]
+    if body is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+    raw_headers.append((b"content-length", str(len(payload)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _dispatch(scope, receive):
+    """
+    Routes one request. Returns (status, headers, body).
+    """
+    method = scope["method"]
+    path = scope["path"].rstrip("/") or "/"
+    headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+    query_string = scope.get("query_string", b"").decode()
+    query = dict(parse_qsl(query_string))
+
+    if path == "/api/health":
+        return 200, {"cache-control": "no-store"}, {"status": "ok", "time": time.time()}
+    if path == "/api/orders":
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        try:
+            payload = json.loads(await _body(receive) or b"null")
+        except ValueError:
+            raise HTTPError(400, "invalid JSON")
+        return await asyncio.to_thread(_place_order, payload)
+
+    for pattern, handler in READS:
+        match = pattern.fullmatch(path)
+        if match:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(405, "use GET")
+            name, compute = handler(query, *match.groups())
+            key = path + "?" + "&".join(f"{k}={v}" for k, v in sorted(query.items()))
+            return await asyncio.to_thread(_read, name, key, compute, headers)
+    raise HTTPError(404, "not found")
+
+
+async def app(scope, receive, send):
+    """
+    The ASGI entry point.
+    """
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Open a connection once so the schema is bootstrapped
+                # before the first request.
+                await asyncio.to_thread(db.get_connection)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    try:
+        status, headers, body = await _dispatch(scope, receive)
+    except HTTPError as exc:
+        status, headers, body = exc.status, {"cache-control": "no-store"}, {"error": exc.message}
+    except Exception:  # never leak a traceback to clients
+        logger.exception("%s %s failed", scope["method"], scope["path"])
+        status, headers, body = 500, {"cache-control": "no-store"}, {"error": "internal error"}
+    if scope["method"] == "HEAD":
+        body = None
+    await _send(send, status, headers, body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the nursery JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    import uvicorn  # optional; any ASGI server can serve 'api:app'
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,20 @@
+import time
 import streamlit as st
-import sqlite3
-import os  # <- Added
+import db  # Database path and schema are configured in db.py
+import pagination
+import perf
+import service  # Reads and orders, shared with the JSON API (api.py)
 
-# Connect to the SQLite database inside .streamlit folder
-db_path = os.path.join(".streamlit", "mydatabase.db")
-conn = sqlite3.connect(db_path, check_same_thread=False)
-c = conn.cursor()
+# Whole reruns are timed as stage 'rerun.app' (admin Performance page).
+# Reruns cut short by st.rerun() are not counted.
+rerun_start = time.perf_counter()
 
-# Your existing code remains unchanged...
 
-
-# ---------- Database Functions ----------
-
-
-def search_tree(search_query):
-    query = """
-        SELECT t.tree_id, t.Common_name, t.Scientific_name, t.Growth_rate,
-               t.Watering_demand, t.shape, t.Care_instructions, t.Main_Photo_url,
-               t.Origin, t.Soil_type, t.Root_type, t."Leaf Type",
-               nti.Price, nti.Packaging_type, nti.Planting, nti.Quantity_in_stock
-        FROM Trees t
-        JOIN Nursery_Tree_Inventory nti ON t.tree_id = nti.tree_id
-        WHERE t.Common_name LIKE ? OR t.Scientific_name LIKE ?
+def when(ts):
     """
-    param = f"%{search_query}%"
-    c.execute(query, (param, param))
-    return c.fetchone()
-
-
-def insert_customer(data):
-    query = """
-        INSERT INTO Customers (Quantity, Username, Customer_full_Name, Address, "Whatsapp Number", Email, price, "Payment Preferences")
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    Formats unix seconds for display; unknown (None or 0) as blank.
     """
-    c.execute(query, data)
-    conn.commit()
-
-
-def insert_status(username, email):
-    query = """
-        INSERT INTO status (Username, Email, Status, Note)
-        VALUES (?, ?, ?, ?)
-    """
-    c.execute(query, (username, email, "Order Placed", ""))
-    conn.commit()
-
-
-def get_order_status(email):
-    query = "SELECT Username, Email, Status, Note FROM status WHERE Email = ?"
-    c.execute(query, (email,))
-    return c.fetchall()
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)) if ts else ""
 
 
 # ---------- Session State Initialization ----------
@@ -59,6 +24,15 @@ if 'tree_details' not in st.session_state:
     st.session_state.tree_details = None
 if 'page' not in st.session_state:
     st.session_state.page = "Nursery"
+if 'search_query' not in st.session_state:
+    st.session_state.search_query = ""
+if 'results_page' not in st.session_state:
+    st.session_state.results_page = 0
+
+# Re-read the selected item on every rerun (served from the cache
+# until inventory changes) so price and stock are never stale.
+if st.session_state.tree_details is not None:
+    st.session_state.tree_details = service.tree_details(st.session_state.tree_details["tree_inventory_id"])
 
 
 # ---------- Sidebar as Buttons ----------
@@ -80,28 +54,35 @@ if st.session_state.page == "Nursery":
         # Updated search engine prompt
         search_query = st.text_input("Find Your Ideal Tree (by Common or Scientific Name):")
         if st.button("Search"):
-            result = search_tree(search_query)
-            if result:
-                st.session_state.tree_details = {
-                    "tree_id": result[0],
-                    "common_name": result[1],
-                    "scientific_name": result[2],
-                    "growth_rate": result[3],
-                    "watering_demand": result[4],
-                    "shape": result[5],
-                    "care_instructions": result[6],
-                    "main_photo_url": result[7],
-                    "origin": result[8],
-                    "soil_type": result[9],
-                    "root_type": result[10],
-                    "leaf_type": result[11],
-                    "price": result[12],
-                    "packaging_type": result[13],
-                    "planting": result[14],
-                    "available_quantity": result[15]
-                }
-            else:
+            st.session_state.search_query = search_query
+            st.session_state.results_page = 0
+            st.session_state.tree_details = None
+
+        if st.session_state.search_query and st.session_state.tree_details is None:
+            found = service.search_trees(st.session_state.search_query, st.session_state.results_page)
+            has_next = found["has_next"]
+            if not found["results"]:
                 st.warning("No tree found with that search criteria.")
+            else:
+                if found["fuzzy"]:
+                    st.info("No exact matches; showing the closest names.")
+                st.subheader(f"Results (page {st.session_state.results_page + 1})")
+                for tree in found["results"]:
+                    col_name, col_offer, col_view = st.columns([3, 3, 1])
+                    col_name.write(f"**{tree['common_name']}** — *{tree['scientific_name']}*")
+                    col_offer.write(f"{tree['packaging_type']} · {tree['price']} IQD · "
+                                    f"{tree['available_quantity']} in stock at {tree['nursery_name']}")
+                    if col_view.button("View", key=f"view_{tree['tree_inventory_id']}"):
+                        st.session_state.tree_details = tree
+                        st.rerun()
+
+                col_prev, col_next = st.columns(2)
+                if st.session_state.results_page > 0 and col_prev.button("Previous"):
+                    st.session_state.results_page -= 1
+                    st.rerun()
+                if has_next and col_next.button("Next"):
+                    st.session_state.results_page += 1
+                    st.rerun()
 
 
         if st.session_state.tree_details is not None:
@@ -120,14 +101,22 @@ if st.session_state.page == "Nursery":
             st.write("**Leaf Type:**", details["leaf_type"])
             st.write("**Price (IQD):**", details["price"])
             st.write("**Packaging Type:**", details["packaging_type"])
-            st.write("**Planting:**", details["planting"])
+            st.write("**Nursery:**", details["nursery_name"])
             st.write("**Available Quantity:**", details["available_quantity"])
 
 
-            if st.button("Purchase"):
+            col_back, col_buy = st.columns(2)
+            if col_back.button("Back to results"):
+                st.session_state.tree_details = None
+                st.rerun()
+            if col_buy.button("Purchase"):
                 st.session_state.purchase_clicked = True
 
 
+    if st.session_state.purchase_clicked and not (st.session_state.tree_details or {}).get("available_quantity"):
+        st.warning("Sorry, this item is sold out.")
+        st.session_state.purchase_clicked = False
+
     if st.session_state.purchase_clicked:
         details = st.session_state.tree_details
         st.subheader("Purchase Form")
@@ -143,12 +132,19 @@ if st.session_state.page == "Nursery":
         payment_preferences = st.selectbox("Payment Preferences", ["Credit Card", "Bank Transfer", "Cash on Delivery"])
        
         if st.button("Order"):
-            customer_data = (quantity, username, customer_full_name, address, whatsapp_number, email, total_price, payment_preferences)
-            insert_customer(customer_data)
-            insert_status(username, email)
-            st.success("Order placed successfully!")
-            st.session_state.purchase_clicked = False
-            st.session_state.tree_details = None
+            result = service.place_order(
+                details["tree_inventory_id"], quantity, username, customer_full_name,
+                address, whatsapp_number, email, payment_preferences
+            )
+            if result["status"] == db.SOLD_OUT:
+                if result["available"]:
+                    st.error(f"Sorry, only {result['available']} left in stock. Please lower the quantity.")
+                else:
+                    st.error("Sorry, this item just sold out.")
+            else:
+                st.success("Order placed successfully!")
+                st.session_state.purchase_clicked = False
+                st.session_state.tree_details = None
 
 
 elif st.session_state.page == "Order Status":
@@ -156,15 +152,25 @@ elif st.session_state.page == "Order Status":
     st.write("Enter your email to check the status of your order.")
     email_status = st.text_input("Email for Order Status")
     if st.button("Check Status"):
-        orders = get_order_status(email_status)
-        if orders:
-            for order in orders:
-                st.write("**Username:**", order[0])
-                st.write("**Email:**", order[1])
-                st.write("**Status:**", order[2])
-                st.write("**Note:**", order[3])
-                st.markdown("---")
+        st.session_state.status_email = email_status
+    # Kept in the session so the pager's reruns keep showing the orders
+    if st.session_state.get("status_email"):
+        email = st.session_state.status_email
+        page_size = pagination.page_size_select("order_status", db.ORDERS_PAGE_SIZE)
+        after = pagination.current_cursor("order_status", (email, page_size))
+        found = service.order_status(email, after, page_size)
+        if found["total"]:
+            # One table per page instead of a widget per field
+            st.dataframe([
+                {"Order": order["order_id"], "Placed": when(order["placed_at"]),
+                 "Tree": order["tree_common_name"], "Nursery": order["nursery_name"],
+                 "Quantity": order["quantity"], "Price": order["price"],
+                 "Status": order["status"], "Note": order["note"], "Updated": when(order["status_at"])}
+                for order in found["orders"]
+            ], hide_index=True)
+            pagination.pager("order_status", found["next"], len(found["orders"]), found["total"], page_size)
         else:
             st.info("No orders found for this email.")
 
 
+perf.record_stage("rerun.app", time.perf_counter() - rerun_start)
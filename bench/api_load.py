@@ -0,0 +1,146 @@
+"""
+Load test for the JSON API (api.py) against a running server.
+
+Many client threads issue a mix of search, inventory, facet and
+order-status reads (and optionally orders) and report latency
+percentiles and throughput per endpoint. With --revalidate each client
+keeps the ETags it has seen and sends If-None-Match, as a browser or
+proxy cache would; the share of 304 responses is reported.
+
+    uvicorn api:app --workers 4 &
+    python -m bench.api_load --url http://127.0.0.1:8000 --requests 5000 --threads 32 --revalidate
+
+Point the server at a scratch database (HASAR_DB_PATH) when --orders
+is used: orders change stock.
+"""
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from bench.order_load import percentile
+
+SEARCH_WORDS = ["oak", "maple", "pine", "red", "mapel", "europe", "weeping", "birch"]
+
+
+def _requests(rng, count, orders, items):
+    """
+    Yields (endpoint name, method, path, body) for a mixed workload.
+    """
+    for _ in range(count):
+        roll = rng.random()
+        if orders and roll < 0.05:
+            body = {"tree_inventory_id": rng.choice(items), "quantity": 1, "username": "load",
+                    "email": f"load{rng.randint(0, 99)}@example.com", "payment_preferences": "Cash on Delivery"}
+            yield "order", "POST", "/api/orders", body
+        elif roll < 0.45:
+            query = {"q": rng.choice(SEARCH_WORDS), "page": rng.choice([0, 0, 0, 1])}
+            yield "search", "GET", "/api/search?" + urlencode(query), None
+        elif roll < 0.75:
+            query = rng.choice([
+                {}, {"packaging": "Potted"}, {"shape": "Conical"}, {"min_height": 100, "max_height": 300},
+                {"min_height": 150, "max_height": 160, "height_mode": "overlaps"},
+                {"min_price": 10000, "max_price": 20000},
+            ])
+            yield "inventory", "GET", "/api/inventory?" + urlencode(query), None
+        elif roll < 0.85:
+            yield "facets", "GET", "/api/facets", None
+        else:
+            query = {"email": f"customer{rng.randint(0, 50)}@example.com"}
+            yield "order_status", "GET", "/api/orders/status?" + urlencode(query), None
+
+
+def _client(url, work, revalidate):
+    """
+    Runs one client's share of the workload.
+    Returns [(endpoint, status, latency in seconds)].
+    """
+    etags = {}
+    results = []
+    for name, method, path, body in work:
+        request = urllib.request.Request(url + path, method=method)
+        if body is not None:
+            request.data = json.dumps(body).encode()
+            request.add_header("Content-Type", "application/json")
+        if revalidate and path in etags:
+            request.add_header("If-None-Match", etags[path])
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                status = response.status
+                if response.headers.get("ETag"):
+                    etags[path] = response.headers["ETag"]
+        except urllib.error.HTTPError as exc:  # 304, 404, 409, ...
+            exc.read()
+            status = exc.code
+        except OSError:
+            status = 0
+        results.append((name, status, time.perf_counter() - start))
+    return results
+
+
+def run(url, count, threads, revalidate, orders, seed):
+    """
+    Spreads 'count' requests over 'threads' clients.
+    Returns {endpoint: summary} plus an "all" entry.
+    """
+    items = []
+    if orders:
+        for word in SEARCH_WORDS:
+            found = json.load(urllib.request.urlopen(url + "/api/search?" + urlencode({"q": word})))
+            items += [tree["tree_inventory_id"] for tree in found["results"]]
+        items = items or [1]
+    rng = random.Random(seed)
+    work = list(_requests(rng, count, orders, items))
+    shares = [work[i::threads] for i in range(threads)]
+    # Every client starts with its own revalidation cache.
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = [r for chunk in pool.map(lambda share: _client(url, share, revalidate), shares) for r in chunk]
+    elapsed = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for name, status, latency in results:
+        by_endpoint[name].append((status, latency))
+        by_endpoint["all"].append((status, latency))
+    summary = {}
+    for name, entries in sorted(by_endpoint.items()):
+        latencies = [latency for status, latency in entries]
+        statuses = defaultdict(int)
+        for status, _ in entries:
+            statuses[status] += 1
+        summary[name] = {
+            "requests": len(entries),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "not_modified": statuses.get(304, 0) / len(entries),
+            "errors": sum(n for status, n in statuses.items() if status == 0 or status >= 500),
+            "statuses": dict(statuses),
+        }
+    summary["all"]["requests_per_s"] = len(results) / elapsed if elapsed else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--revalidate", action="store_true", help="send If-None-Match with known ETags")
+    parser.add_argument("--orders", action="store_true", help="mix in 5%% order placements")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    summary = run(args.url.rstrip("/"), args.requests, args.threads, args.revalidate, args.orders, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark for the in-memory catalog (catalog.py).
+
+Generates a synthetic database (bench.datagen), builds a Catalog of it
+and checks that it answers every read exactly as SQL does. Then it
+times the storefront's catalog reads three ways:
+- SQL with the read caches bypassed
+- the Catalog with its remembered results dropped before each call
+- the Catalog as a rerun finds it, with its results kept
+Last, it measures a reader thread while the watcher rebuilds and swaps
+catalogs behind it, with a write every --write-every seconds.
+
+    python -m bench.catalog --rows 100000 --repeat 20
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import catalog
+import db
+from bench import datagen
+from bench.run import SEARCH_PAGE_FILTERS, _summary, _timed
+
+CACHED_READS = ["get_tree_details", "get_facet_options", "get_facet_counts", "get_histogram",
+                "count_search_rows"]
+
+# Filters checked on top of bench.run.SEARCH_PAGE_FILTERS: no matches,
+# open-ended ranges, a bound above the other.
+CHECK_FILTERS = [
+    {"tree_choice": "No Such Tree"},
+    {"max_height": 200.0, "height_mode": db.HEIGHT_OVERLAPS},
+    {"min_height": 100.0, "height_mode": db.HEIGHT_OVERLAPS},
+    {"min_height": 400.0, "max_height": 100.0},
+    {"max_price": 3000.0},
+    {"packaging_choice": "Potted", "min_growth_rate": 10.0},
+]
+
+
+class SQL:
+    """
+    The catalog reads of catalog.Catalog, answered by SQL.
+    """
+
+    def search_page_rows(self, filters, limit=db.PAGE_SIZE, after=None):
+        where, params = db.build_search_filter(**filters)
+        return db.search_page_rows(where, tuple(params), limit, after)
+
+    def count(self, filters):
+        where, params = db.build_search_filter(**filters)
+        return db.count_search_rows(where, tuple(params))
+
+    def facet_options(self, column):
+        return db.get_facet_options(column)
+
+    def facet_counts(self, column, filters=None):
+        where, params = db.build_search_filter(**(filters or {}))
+        return db.get_facet_counts(column, where, tuple(params))
+
+    def histogram(self, name, filters=None):
+        where, params = db.build_search_filter(**(filters or {}))
+        return db.get_histogram(name, where, tuple(params))
+
+    def tree_details(self, tree_inventory_id):
+        return db.get_tree_details(tree_inventory_id)
+
+
+def _clear_sql():
+    for name in CACHED_READS:
+        getattr(db, name).cache_clear()
+
+
+def check(built, items):
+    """
+    Compares every read of 'built' with SQL. Returns the mismatches.
+    """
+    sql = SQL()
+    mismatches = []
+
+    def compare(name, *args):
+        expected, found = getattr(sql, name)(*args), getattr(built, name)(*args)
+        if expected != found:
+            mismatches.append([name, repr(args)])
+        return expected
+
+    for filters in SEARCH_PAGE_FILTERS + CHECK_FILTERS:
+        compare("count", filters)
+        after = None
+        for _ in range(5):
+            _, after = compare("search_page_rows", filters, 37, after)
+            if after is None:
+                break
+        for column in db.FACET_COLUMNS:
+            compare("facet_counts", column, filters)
+        for name in db.HISTOGRAMS:
+            compare("histogram", name, filters)
+    for column in db.FACET_COLUMNS:
+        compare("facet_options", column)
+    for item in items + [0]:
+        compare("tree_details", item)
+    return mismatches
+
+
+def time_reads(reader, items, repeat, before=lambda: None):
+    """
+    Times the catalog reads through 'reader' (SQL() or a Catalog),
+    calling before() ahead of each call. Returns {read: summary}.
+    """
+    rng = random.Random(0)
+    deep = None
+    for _ in range(20):
+        _, deep = reader.search_page_rows({}, db.PAGE_SIZE, deep)
+
+    def call(func):
+        def timed():
+            before()
+            func()
+        return timed
+
+    def facets(filters):
+        for column in db.FACET_COLUMNS:
+            reader.facet_counts(column, filters)
+        for name in db.HISTOGRAMS:
+            reader.histogram(name, filters)
+
+    def search_page(filters, after=None):
+        reader.count(filters)
+        reader.search_page_rows(filters, db.PAGE_SIZE, after)
+
+    return {
+        "tree_details": _summary(_timed(call(lambda: reader.tree_details(rng.choice(items))), repeat)),
+        "facet_options": _summary(_timed(call(lambda: reader.facet_options("tree_common_name")), repeat)),
+        "facets": _summary(_timed(call(lambda: facets({})), repeat)),
+        "facets_filtered": _summary(_timed(call(lambda: facets({"packaging_choice": "Potted"})), repeat)),
+        "search_page": _summary([t for filters in SEARCH_PAGE_FILTERS
+                                 for t in _timed(call(lambda: search_page(filters)), repeat)]),
+        "search_page_21": _summary(_timed(call(lambda: search_page({}, deep)), repeat)),
+    }
+
+
+def time_swaps(path, seconds, write_every):
+    """
+    Reads the first Search page and the facets in a loop for 'seconds'
+    while another connection writes a price every 'write_every' seconds
+    and the watcher swaps in new catalogs. Returns the reader's
+    latencies, the swaps seen and how long writes took to show.
+    """
+    catalog.ENABLED, catalog.INTERVAL = True, write_every / 5
+    first = catalog.current()
+    latencies, swaps, visible = [], [], []
+    done = threading.Event()
+
+    def read():
+        seen = first
+        while not done.is_set():
+            start = time.perf_counter()
+            built = catalog.current()
+            built.search_page_rows({"packaging_choice": "Potted"})
+            built.count({"packaging_choice": "Potted"})
+            for column in db.FACET_COLUMNS:
+                built.facet_counts(column, {})
+            latencies.append(time.perf_counter() - start)
+            if built is not seen:
+                swaps.append(built)
+                seen = built
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    conn = sqlite3.connect(path)
+    stop = time.perf_counter() + seconds
+    price = 1.0
+    while time.perf_counter() < stop:
+        price += 1
+        conn.execute("UPDATE Nursery_Tree_Inventory SET Price = ? WHERE tree_inventory_id = 1", (price,))
+        conn.commit()
+        written = time.perf_counter()
+        while catalog.current().tree_details(1)[12] != price:
+            time.sleep(0.005)
+        visible.append(time.perf_counter() - written)
+        time.sleep(max(0.0, write_every - visible[-1]))
+    done.set()
+    reader.join()
+    conn.close()
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "read_p50_ms": statistics.median(latencies) * 1000,
+        "read_p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+        "read_max_ms": latencies[-1] * 1000,
+        "swaps": len(swaps),
+        "visible_after_median_s": statistics.median(visible),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the swap run")
+    parser.add_argument("--write-every", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.db")
+        datagen.generate(path, args.rows)
+        db.configure(path)
+
+        builds = []
+        for _ in range(3):
+            start = time.perf_counter()
+            built = catalog.build()
+            builds.append(time.perf_counter() - start)
+        tracemalloc.start()
+        built = catalog.build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        items = [row[0] for row in db.get_connection().execute(
+            "SELECT tree_inventory_id FROM Search ORDER BY random() LIMIT 200"
+        )]
+        mismatches = check(built, items)
+        results = {
+            "rows": built.size,
+            "build_s": statistics.median(builds),
+            "catalog_mb": size / 1e6,
+            "mismatches": mismatches,
+            "sql": time_reads(SQL(), items, args.repeat, _clear_sql),
+            "catalog": time_reads(built, items, args.repeat, built.clear_results),
+            "catalog_warm": time_reads(built, items, args.repeat),
+            "swaps": time_swaps(path, args.seconds, args.write_every),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Seeded synthetic data for the nursery workload.
+
+Builds a database with the full schema (schema.bootstrap) and fills
+Nurseries, Trees, Nursery_Tree_Inventory and orders. 'rows' is the
+number of inventory rows; the other tables scale with it:
+
+    trees     = rows / 10   (at least 50)
+    nurseries = rows / 100  (at least 5)
+    orders    = rows / 10
+
+The same seed and size always produce the same data. Rows go in
+through the regular triggers (Search, full-text, table versions), so
+generation speed is also the bulk-insert speed of the live schema.
+
+    python -m bench.datagen out.db --rows 100000 --seed 1
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import schema
+
+BATCH_ROWS = 10000
+
+GENERA = [
+    ("Maple", "Acer"), ("Oak", "Quercus"), ("Pine", "Pinus"), ("Birch", "Betula"),
+    ("Willow", "Salix"), ("Poplar", "Populus"), ("Ash", "Fraxinus"), ("Elm", "Ulmus"),
+    ("Cedar", "Cedrus"), ("Cypress", "Cupressus"), ("Olive", "Olea"), ("Fig", "Ficus"),
+    ("Walnut", "Juglans"), ("Plane", "Platanus"), ("Lime", "Tilia"), ("Spruce", "Picea"),
+    ("Fir", "Abies"), ("Juniper", "Juniperus"), ("Pomegranate", "Punica"), ("Almond", "Prunus"),
+]
+ADJECTIVES = [
+    "Red", "Silver", "Golden", "Weeping", "Dwarf", "Giant", "Mountain", "River",
+    "Desert", "Black", "White", "Sweet", "Scarlet", "Blue", "Japanese", "Kurdish",
+]
+EPITHETS = ["alba", "rubra", "nigra", "major", "minor", "orientalis", "montana", "glauca"]
+SHAPES = ["Spherical", "Broad", "Columnar", "Conical", "Weeping", "Vase", "Oval", "Spreading"]
+PACKAGING = ["Potted", "Bare-root", "Packaged in a nylon bag", "Root-ball", "Container"]
+WATERING = ["Low", "Medium", "High"]
+SOILS = ["Loamy", "Clay", "Sandy", "Silty", "Chalky", "Peaty"]
+ROOTS = ["Taproot", "Fibrous", "Adventitious"]
+LEAVES = ["Deciduous", "Evergreen", "ovate", "lanceolate", "linear"]
+ORIGINS = ["North America", "Europe", "Asia", "Middle East", "Africa", "South America"]
+CARE = ["Prune annually", "Water moderately", "Avoid overwatering", "Full sun", "Partial shade"]
+CITIES = ["Erbil", "Sulaymaniyah", "Duhok", "Halabja", "Kirkuk", "Zakho"]
+STATUSES = ["Order Placed", "Confirmed", "Shipped", "Delivered", "Cancelled"]
+
+
+def _batches(rows, size=BATCH_ROWS):
+    """
+    Splits a generator of rows into lists of at most 'size'.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _nurseries(rng, count):
+    for i in range(count):
+        city = rng.choice(CITIES)
+        yield (f"REG-{i:06d}", f"{rng.choice(ADJECTIVES)} {city} Nursery {i}", f"{rng.randint(1, 999)} {city} Rd",
+               f"Contact {i}", f"07{rng.randint(100000000, 999999999)}", f"http://maps.google.com/?q=nursery+{i}",
+               "")
+
+
+def _trees(rng, count):
+    for i in range(count):
+        common, genus = GENERA[i % len(GENERA)]
+        adjective = ADJECTIVES[(i // len(GENERA)) % len(ADJECTIVES)]
+        suffix = i // (len(GENERA) * len(ADJECTIVES))
+        name = f"{adjective} {common}" + (f" {suffix}" if suffix else "")
+        yield (name, f"{genus} {rng.choice(EPITHETS)}", round(rng.uniform(5, 120), 1), rng.choice(WATERING),
+               rng.choice(SHAPES), rng.choice(CARE), f"http://example.com/tree{i}.jpg", rng.choice(ORIGINS),
+               rng.choice(SOILS), rng.choice(ROOTS), rng.choice(LEAVES))
+
+
+def _inventory(rng, count, nursery_names, tree_names):
+    for _ in range(count):
+        low = round(rng.uniform(20, 400), 0)
+        yield (rng.choice(nursery_names), rng.choice(tree_names), rng.randint(0, 500), low,
+               low + round(rng.uniform(10, 300), 0), rng.choice(PACKAGING),
+               float(rng.randrange(5000, 500000, 250)))
+
+
+def _orders(rng, count, inventory_count):
+    for i in range(count):
+        quantity = rng.randint(1, 5)
+        email = f"customer{rng.randint(0, max(1, count // 3))}@example.com"
+        yield (quantity, f"user{i}", f"Customer {i}", f"{rng.randint(1, 999)} {rng.choice(CITIES)} St",
+               f"07{rng.randint(100000000, 999999999)}", email, quantity * float(rng.randrange(5000, 500000, 250)),
+               rng.choice(["Credit Card", "Bank Transfer", "Cash on Delivery"]), rng.randint(1, inventory_count))
+
+
+def generate(path, rows, seed=0):
+    """
+    Creates (or replaces) the database at 'path' with 'rows' inventory
+    rows and proportional nurseries, trees and orders. Returns the row
+    counts per table.
+    """
+    for stale in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    rng = random.Random(seed)
+    counts = {
+        "Nurseries": max(5, rows // 100),
+        "Trees": max(50, rows // 10),
+        "Nursery_Tree_Inventory": rows,
+        "Customers": rows // 10,
+    }
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")  # scratch data; speed over durability
+    schema.bootstrap(conn)
+
+    nurseries = list(_nurseries(rng, counts["Nurseries"]))
+    trees = list(_trees(rng, counts["Trees"]))
+    steps = [
+        ("""INSERT INTO Nurseries (Registration_code, Nursery_name, Address, Contact_name,
+                                   Contact_phone, Google_map_link, Additional_notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""", nurseries),
+        ("""INSERT INTO Trees (Common_name, Scientific_name, Growth_rate, Watering_demand, shape,
+                               Care_instructions, Main_Photo_url, Origin, Soil_type, Root_type, Leaf_Type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", trees),
+        ("""INSERT INTO Nursery_Tree_Inventory (nursery_name, tree_common_name, Quantity_in_stock,
+                                                Min_height, Max_height, Packaging_type, Price)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+         _inventory(rng, rows, [n[1] for n in nurseries], [t[0] for t in trees])),
+        ("""INSERT INTO Customers (Quantity, Username, Customer_full_Name, Address, "Whatsapp Number",
+                                   Email, price, "Payment Preferences", tree_inventory_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", _orders(rng, counts["Customers"], max(1, rows))),
+    ]
+    for sql, data in steps:
+        for batch in _batches(data):
+            conn.execute("BEGIN")
+            conn.executemany(sql, batch)
+            conn.commit()
+
+    # One order per customer row, placed over 90 days, and a status
+    # history walking part of the way through STATUSES; some orders
+    # end up cancelled.
+    now = 1700000000.0
+    customers = conn.execute(
+        "SELECT customer_id, tree_inventory_id, Quantity, price FROM Customers ORDER BY customer_id"
+    ).fetchall()
+    # Orders keep their customer row's id, as db.place_order does.
+    orders = [(customer_id, customer_id, item, quantity, price, now - rng.uniform(0, 90 * 86400))
+              for customer_id, item, quantity, price in customers]
+    events = []
+    for order_id, _, _, _, _, placed_at in orders:
+        ts = placed_at
+        steps = STATUSES[:rng.randint(1, 4)]
+        if rng.random() < 0.1:
+            steps.append("Cancelled")
+        for status in steps:
+            events.append((order_id, ts, status, ""))
+            ts += rng.uniform(3600, 5 * 86400)
+    for sql, data in (
+        ("INSERT INTO Orders (order_id, customer_id, tree_inventory_id, Quantity, price, placed_at) "
+         "VALUES (?, ?, ?, ?, ?, ?)", orders),
+        ("INSERT INTO Order_Status_Events (order_id, ts, Status, Note) VALUES (?, ?, ?, ?)", events),
+    ):
+        for batch in _batches(data):
+            conn.execute("BEGIN")
+            conn.executemany(sql, batch)
+            conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="database file to create (replaced if it exists)")
+    parser.add_argument("--rows", type=int, default=10000, help="inventory rows (10k to 10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.path, args.rows, args.seed)
+    elapsed = time.perf_counter() - start
+    print(", ".join(f"{table}: {count}" for table, count in counts.items()) + f" in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
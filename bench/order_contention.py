@@ -0,0 +1,119 @@
+"""
+Contention benchmark for db.place_order.
+
+Many threads (and optionally processes) race to buy the same inventory
+item with limited stock. Checks that stock never goes negative and that
+every unit sold has exactly one order, and reports sold-out results and
+latency.
+
+    python -m bench.order_contention --stock 100 --orders 1000 --threads 32
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from bench.order_load import percentile
+
+
+def _buy(args):
+    """
+    Tries to buy 'quantity' units; returns (latency, result or error).
+    """
+    item, quantity, n = args
+    start = time.perf_counter()
+    try:
+        result = db.place_order(item, quantity, f"user{n}", f"Buyer {n}", "Test St",
+                                "0000", f"user{n}@example.com", "Cash on Delivery")
+    except sqlite3.OperationalError as exc:
+        result = {"status": "error", "error": str(exc)}
+    return time.perf_counter() - start, result
+
+
+def _worker(path, attempts, threads):
+    """
+    Runs a list of (item, quantity, n) purchase attempts over 'threads' threads.
+    """
+    db.configure(path)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(_buy, attempts))
+
+
+def run(path, stock, orders, threads, processes, max_quantity, seed=0):
+    """
+    Races 'orders' purchases of one item holding 'stock' units.
+    Returns a dict of summary statistics.
+    """
+    db.configure(path)
+    with db.transaction() as conn:
+        item = conn.execute(
+            """
+            INSERT INTO Nursery_Tree_Inventory (nursery_name, tree_common_name, Quantity_in_stock, Packaging_type, Price)
+            VALUES ('Benchmark Nursery', 'Benchmark Tree', ?, 'Potted', 100.0)
+            """,
+            (stock,),
+        ).lastrowid
+
+    rng = random.Random(seed)
+    attempts = [(item, rng.randint(1, max_quantity), n) for n in range(orders)]
+    chunks = [attempts[i::processes] for i in range(processes)]
+    start = time.perf_counter()
+    if processes == 1:
+        results = _worker(path, chunks[0], threads)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.starmap(_worker, [(path, chunk, threads) for chunk in chunks])
+        results = [result for part in parts for result in part]
+    elapsed = time.perf_counter() - start
+
+    conn = db.get_connection()
+    left = conn.execute(
+        "SELECT Quantity_in_stock FROM Nursery_Tree_Inventory WHERE tree_inventory_id = ?", (item,)
+    ).fetchone()[0]
+    ordered = conn.execute(
+        "SELECT COALESCE(SUM(Quantity), 0), COUNT(*) FROM Customers WHERE tree_inventory_id = ?", (item,)
+    ).fetchone()
+
+    placed = [r for latency, r in results if r["status"] == db.ORDER_PLACED]
+    latencies = [latency for latency, r in results if r["status"] != "error"]
+    return {
+        "attempts": len(results),
+        "placed": len(placed),
+        "sold_out": sum(r["status"] == db.SOLD_OUT for latency, r in results),
+        "errors": sum(r["status"] == "error" for latency, r in results),
+        "stock_left": left,
+        "units_ordered": ordered[0],
+        "consistent": left >= 0 and left + ordered[0] == stock and ordered[1] == len(placed),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "attempts_per_s": len(results) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="mydatabase.db", help="database to copy for the test")
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--max-quantity", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "contention.db")
+        shutil.copy(args.db, path)
+        stats = run(path, args.stock, args.orders, args.threads, args.processes, args.max_quantity)
+
+    for key, value in stats.items():
+        print(f"{key:>14}: {value:.2f}" if isinstance(value, float) else f"{key:>14}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Load test for the order write path.
+
+Fires many concurrent orders at a scratch copy of the database through
+db.place_order and reports latency percentiles and lock errors.
+
+    python -m bench.order_load --orders 500 --threads 32 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which 'fraction' of 'values' fall.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _one_order(item, n):
+    """
+    Places one order; returns (latency in seconds, error text or None).
+    """
+    start = time.perf_counter()
+    try:
+        db.place_order(item, 1, f"user{n}", f"Load Test {n}", "Test St",
+                       "0000", f"user{n}@example.com", "Cash on Delivery")
+        error = None
+    except sqlite3.OperationalError as exc:
+        error = str(exc)
+    return time.perf_counter() - start, error
+
+
+def _worker(path, item, orders, threads, offset):
+    """
+    Runs 'orders' orders over 'threads' threads in this process.
+    """
+    db.configure(path)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda n: _one_order(item, n), range(offset, offset + orders)))
+
+
+def run(path, orders, threads, processes):
+    """
+    Spreads 'orders' over 'processes' processes of 'threads' threads each.
+    Returns a dict of summary statistics.
+    """
+    db.configure(path)
+    # An item with enough stock that no order is refused.
+    with db.transaction() as conn:
+        item = conn.execute(
+            """
+            INSERT INTO Nursery_Tree_Inventory (nursery_name, tree_common_name, Quantity_in_stock, Packaging_type, Price)
+            VALUES ('Benchmark Nursery', 'Benchmark Tree', ?, 'Potted', 100.0)
+            """,
+            (orders,),
+        ).lastrowid
+    per_process = orders // processes
+    start = time.perf_counter()
+    if processes == 1:
+        results = _worker(path, item, per_process, threads, 0)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            chunks = pool.starmap(
+                _worker, [(path, item, per_process, threads, i * per_process) for i in range(processes)]
+            )
+        results = [result for chunk in chunks for result in chunk]
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, error in results if error is None]
+    errors = [error for latency, error in results if error is not None]
+    return {
+        "orders": len(results),
+        "ok": len(latencies),
+        "lock_errors": sum("locked" in error for error in errors),
+        "other_errors": sum("locked" not in error for error in errors),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": (statistics.mean(latencies) * 1000) if latencies else 0.0,
+        "orders_per_s": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="mydatabase.db", help="database to copy for the test")
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "load.db")
+        shutil.copy(args.db, path)
+        stats = run(path, args.orders, args.threads, args.processes)
+
+    for key, value in stats.items():
+        print(f"{key:>14}: {value:.2f}" if isinstance(value, float) else f"{key:>14}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark harness for the nursery code paths, headless (no Streamlit).
+
+For every scale it generates (or reuses) a synthetic database with
+bench.datagen, then times the storefront search, the Search page
+queries, facet lists and counts, order status, the full Search
+rebuild, CSV import and order placement. Reads bypass the db caches
+so every call reaches SQLite. Results are written as JSON and compared
+with a stored baseline; a code path whose median slows down by more
+than the tolerance is flagged and the exit status is 1. No baseline is
+committed, since timings only compare on one machine: save one with
+--save-baseline first. A --baseline that does not exist is an error;
+without --baseline, bench/baseline.json is used when it exists.
+
+    python -m bench.run --scales 10000 100000 --output results.json
+    python -m bench.run --scales 10000 --save-baseline
+    python -m bench.run --scales 10000 --baseline bench/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import db
+import importer
+import schema
+from bench import datagen
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SEARCH_QUERIES = ["oak", "red map", "kurdish pine", "mapel", "europe"]
+
+SEARCH_PAGE_FILTERS = [
+    {},
+    {"packaging_choice": "Potted"},
+    {"tree_choice": "Red Maple"},
+    {"shape_choice": "Conical", "min_height": 100.0, "max_height": 300.0},
+    {"min_height": 150.0, "max_height": 160.0, "height_mode": db.HEIGHT_OVERLAPS},
+    {"min_price": 10000.0, "max_price": 20000.0, "min_growth_rate": 20.0, "max_growth_rate": 40.0},
+]
+
+
+def _timed(func, repeat):
+    """
+    Calls func() 'repeat' times; returns its timings in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _summary(samples):
+    """
+    Returns min / median / p95 / max of a list of timings.
+    """
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0],
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max_ms": ordered[-1],
+    }
+
+
+def _inventory_csv(rows, seed):
+    """
+    Returns a CSV upload (bytes) of 'rows' new inventory rows.
+    """
+    buffer = io.StringIO()
+    buffer.write("nursery_name,tree_common_name,Quantity_in_stock,Min_height,Max_height,Packaging_type,Price\n")
+    for i in range(rows):
+        buffer.write(f"Import Nursery {seed},Red Maple,{i % 50},100,200,Crate {i},1000\n")
+    return buffer.getvalue().encode()
+
+
+def bench_scale(path, rows, repeat):
+    """
+    Times every code path against the database at 'path'.
+    Returns {code path: summary}.
+    """
+    db.configure(path)
+    conn = db.get_connection()
+    results = {}
+
+    search = db.search_tree.__wrapped__
+    results["search_tree"] = _summary(
+        [t for query in SEARCH_QUERIES for t in _timed(lambda: search(query, 0), repeat)]
+    )
+
+    count = db.count_search_rows.__wrapped__
+
+    def search_page(filters):
+        where, params = db.build_search_filter(**filters)
+        count(where, tuple(params))
+        db.search_page_rows(where, params)
+
+    results["search_page"] = _summary(
+        [t for filters in SEARCH_PAGE_FILTERS for t in _timed(lambda: search_page(filters), repeat)]
+    )
+
+    # A page halfway through the unfiltered results, reached by key.
+    middle = conn.execute(
+        "SELECT tree_common_name, tree_inventory_id FROM Search "
+        "ORDER BY tree_common_name, tree_inventory_id LIMIT 1 OFFSET ?",
+        (rows // 2,),
+    ).fetchone()
+    results["search_page_deep"] = _summary(
+        _timed(lambda: db.search_page_rows("1", [], db.PAGE_SIZE, tuple(middle)), repeat)
+    )
+
+    browse = db.browse_table.__wrapped__
+    results["browse_table"] = _summary(
+        _timed(lambda: browse("Nursery_Tree_Inventory", db.PAGE_SIZE, rows // 2), repeat)
+    )
+
+    facets = db.get_facet_options.__wrapped__
+    results["facet_options"] = _summary(
+        _timed(lambda: [facets(column) for column in db.FACET_COLUMNS], repeat)
+    )
+
+    counts = db.get_facet_counts.__wrapped__
+    histogram = db.get_histogram.__wrapped__
+
+    def facet_counts(where, params):
+        for column in db.FACET_COLUMNS:
+            counts(column, where, params)
+        for name in db.HISTOGRAMS:
+            histogram(name, where, params)
+
+    results["facet_counts"] = _summary(_timed(lambda: facet_counts("1", ()), repeat))
+    results["facet_counts_filtered"] = _summary(
+        _timed(lambda: facet_counts("Packaging_type = ?", ("Potted",)), repeat)
+    )
+
+    status = db.get_order_status.__wrapped__
+    results["order_status"] = _summary(_timed(lambda: status("customer1@example.com"), repeat))
+
+    results["refresh_search_table"] = _summary(
+        _timed(lambda: schema.rebuild_search_table(conn), max(1, repeat // 5))
+    )
+
+    import_rows = min(10000, max(100, rows // 10))
+    uploads = [_inventory_csv(import_rows, n) for n in range(max(1, repeat // 5))]
+    results["csv_import"] = _summary(
+        [t for data in uploads for t in _timed(lambda: importer.import_csv("Nursery_Tree_Inventory", io.BytesIO(data)), 1)]
+    )
+    results["csv_import"]["rows"] = import_rows
+
+    item = conn.execute("SELECT MAX(tree_inventory_id) FROM Nursery_Tree_Inventory").fetchone()[0]
+    conn.execute("UPDATE Nursery_Tree_Inventory SET Quantity_in_stock = 1000000 WHERE tree_inventory_id = ?", (item,))
+    conn.commit()
+    results["place_order"] = _summary(_timed(
+        lambda: db.place_order(item, 1, "bench", "Bench", "Bench St", "0", "bench@example.com", "Cash on Delivery"),
+        repeat,
+    ))
+    return results
+
+
+def compare(results, baseline, tolerance, floor_ms=1.0):
+    """
+    Returns a list of regression messages: code paths whose median is
+    more than 'tolerance' (fraction) and 'floor_ms' above the baseline.
+    """
+    regressions = []
+    for scale, paths in results["scales"].items():
+        for name, summary in paths.items():
+            before = baseline.get("scales", {}).get(scale, {}).get(name)
+            if not before:
+                continue
+            now, then = summary["median_ms"], before["median_ms"]
+            if now > then * (1 + tolerance) and now - then > floor_ms:
+                regressions.append(f"{name} @ {scale} rows: {then:.2f} ms -> {now:.2f} ms (+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000], help="inventory rows per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per code path")
+    parser.add_argument("--data-dir", help="keep generated databases here and reuse them")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help=f"baseline JSON to compare against (default: {DEFAULT_BASELINE} if present)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    args = parser.parse_args()
+    # An explicit baseline must exist, or a CI run would pass without comparing.
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} does not exist (create it with --save-baseline)")
+    baseline = args.baseline or DEFAULT_BASELINE
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        for rows in args.scales:
+            source = os.path.join(data_dir, f"bench-{rows}-{args.seed}.db")
+            if not os.path.exists(source):
+                print(f"generating {rows} rows...", file=sys.stderr)
+                datagen.generate(source, rows, args.seed)
+            # Work on a copy: the write paths change the data.
+            path = os.path.join(tmp, f"run-{rows}.db")
+            shutil.copy(source, path)
+            print(f"benchmarking {rows} rows...", file=sys.stderr)
+            results["scales"][str(rows)] = bench_scale(path, rows, args.repeat)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(baseline, "w") as f:
+            f.write(text)
+        print(f"baseline saved to {baseline}", file=sys.stderr)
+        return
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark for nursery shards (shards.py).
+
+Generates a synthetic database (bench.datagen), splits it by nursery
+into --shards shard files and checks that the reads merged over the
+shards answer exactly as the single database does. Then it compares
+the two on the same data: reads (ranked search, a Search page with
+its count, filtered facet counts, order status; caches bypassed)
+fanned out over the shards, then order throughput with --threads
+threads buying random items of every nursery.
+
+    python -m bench.shards --rows 100000 --shards 4 --threads 8
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import shards
+from bench import datagen
+from bench.catalog import CHECK_FILTERS
+from bench.run import SEARCH_PAGE_FILTERS, SEARCH_QUERIES, _summary, _timed
+
+CACHED_READS = ["search_tree", "search_tree_ranked", "get_tree_details", "count_search_rows",
+                "get_facet_counts", "get_histogram", "get_order_status", "count_orders"]
+
+
+def _uncached(func):
+    """
+    Wraps a read so every call reaches SQLite, also on the shard threads.
+    """
+    def call(*args):
+        for name in CACHED_READS:
+            getattr(db, name).cache_clear()
+        return func(*args)
+    return call
+
+
+def _filter(store, filters):
+    """
+    Returns the arguments the Search reads of 'store' take for
+    build_search_filter arguments 'filters' (see service._filter).
+    """
+    if store is not db:
+        return (filters,)
+    where, params = db.build_search_filter(**filters)
+    return where, tuple(params)
+
+
+def check(sharded, items, emails):
+    """
+    Compares every merged read of 'sharded' (the shards module) with
+    the same read of the single database. Returns the mismatches.
+    """
+    mismatches = []
+
+    def compare(name, *args, filters=None, more=()):
+        # 'filters' go between 'args' and 'more', as each store takes them
+        if filters is None:
+            expected, found = getattr(db, name)(*args, *more), getattr(sharded, name)(*args, *more)
+        else:
+            expected = getattr(db, name)(*args, *_filter(db, filters), *more)
+            found = getattr(sharded, name)(*args, *_filter(sharded, filters), *more)
+        if expected != found:
+            mismatches.append([name, repr(args + (filters,) + more)])
+        return expected
+
+    for query in SEARCH_QUERIES:
+        for page in range(3):
+            compare("search_tree", query, page)
+    for filters in SEARCH_PAGE_FILTERS + CHECK_FILTERS:
+        compare("count_search_rows", filters=filters)
+        after = None
+        for _ in range(5):
+            _, after = compare("search_page_rows", filters=filters, more=(37, after))
+            if after is None:
+                break
+        for column in db.FACET_COLUMNS:
+            compare("get_facet_counts", column, filters=filters)
+        for name in db.HISTOGRAMS:
+            compare("get_histogram", name, filters=filters)
+    for column in db.FACET_COLUMNS:
+        compare("get_facet_options", column)
+    for item in items + [0]:
+        compare("get_tree_details", item)
+    for email in emails + ["nobody@example.com"]:
+        compare("count_orders", email)
+        after = None
+        for _ in range(5):
+            _, after = compare("get_order_status", email, 3, after)
+            if after is None:
+                break
+    return mismatches
+
+
+def time_reads(store, repeat):
+    """
+    Times the storefront reads through 'store' (db, or shards).
+    Returns {read: summary}.
+    """
+    results = {}
+    search = _uncached(store.search_tree)
+    results["search_tree"] = _summary(
+        [t for query in SEARCH_QUERIES for t in _timed(lambda: search(query, 0), repeat)]
+    )
+
+    rows, count = _uncached(store.search_page_rows), _uncached(store.count_search_rows)
+
+    def search_page(filters):
+        count(*_filter(store, filters))
+        rows(*_filter(store, filters))
+
+    results["search_page"] = _summary(
+        [t for filters in SEARCH_PAGE_FILTERS for t in _timed(lambda: search_page(filters), repeat)]
+    )
+    counts, histogram = _uncached(store.get_facet_counts), _uncached(store.get_histogram)
+
+    def facet_counts():
+        for column in db.FACET_COLUMNS:
+            counts(column, *_filter(store, {"packaging_choice": "Potted"}))
+        for name in db.HISTOGRAMS:
+            histogram(name, *_filter(store, {"packaging_choice": "Potted"}))
+
+    results["facet_counts_filtered"] = _summary(_timed(facet_counts, repeat))
+    status = _uncached(store.get_order_status)
+    results["order_status"] = _summary(_timed(lambda: status("customer1@example.com"), repeat))
+    return results
+
+
+def time_orders(store, items, orders, threads):
+    """
+    Places 'orders' one-unit orders for random 'items' over 'threads'
+    threads. Returns orders per second and latency percentiles.
+    """
+    rng = random.Random(0)
+    work = [rng.choice(items) for _ in range(orders)]
+
+    def buy(item):
+        start = time.perf_counter()
+        store.place_order(item, 1, "bench", "Bench", "Bench St", "0", "bench@example.com", "Cash on Delivery")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(buy, work))
+    elapsed = time.perf_counter() - start
+    return {
+        "orders_per_s": orders / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.db")
+        datagen.generate(source, args.rows)
+        db.configure(source)
+        with db.transaction() as conn:
+            nurseries = [row[0] for row in conn.execute("SELECT Nursery_name FROM Nurseries ORDER BY nursery_id")]
+            items = [row[0] for row in conn.execute(
+                "SELECT tree_inventory_id FROM Nursery_Tree_Inventory ORDER BY random() LIMIT 500"
+            )]
+            conn.execute(
+                "UPDATE Nursery_Tree_Inventory SET Quantity_in_stock = 1000000 WHERE tree_inventory_id IN ({})".format(
+                    ", ".join(map(str, items))
+                )
+            )
+            emails = [row[0] for row in conn.execute(
+                "SELECT c.Email FROM Customers c JOIN Orders o ON o.customer_id = c.customer_id "
+                "GROUP BY c.Email ORDER BY COUNT(*) DESC LIMIT 20"
+            )]
+        shard_map = os.path.join(tmp, "shards.json")
+        with open(shard_map, "w") as f:
+            json.dump({"shards": [
+                {"name": f"shard{n}", "path": f"shard{n}.db", "nurseries": nurseries[n::args.shards]}
+                for n in range(args.shards)
+            ]}, f)
+        # What setting HASAR_SHARDS before the import would do
+        shards.SHARDS, shards.ENABLED = shards.load_shard_map(shard_map), True
+        shards.split(source)
+
+        mismatches = check(shards, items[:200], emails)
+        single = time_reads(db, args.repeat)
+        single["place_order"] = time_orders(db, items, args.orders, args.threads)
+        sharded = time_reads(shards, args.repeat)
+        sharded["place_order"] = time_orders(shards, items, args.orders, args.threads)
+
+    print(json.dumps({"rows": args.rows, "shards": args.shards, "threads": args.threads,
+                      "mismatches": mismatches, "single": single, "sharded": sharded}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
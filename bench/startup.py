@@ -0,0 +1,108 @@
+"""
+Startup and rerun timing for the Streamlit pages.
+
+Measures, in fresh interpreters, the cold import time of the data-layer
+modules and of pandas, and, when Streamlit is installed, the time of a
+first script run and of later reruns of app.py and admin.py headless
+(streamlit.testing AppTest). Run it on two checkouts to compare.
+
+    python -m bench.startup --repeat 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODULES = ["schema", "db", "importer", "pandas", "streamlit"]
+PAGES = ["app.py", "admin.py"]
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+
+_RERUN_SNIPPET = """
+import json, time
+from streamlit.testing.v1 import AppTest
+t = time.perf_counter()
+at = AppTest.from_file({page!r}, default_timeout=60)
+at.run()
+first = time.perf_counter() - t
+reruns = []
+for _ in range({reruns}):
+    t = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - t)
+print(json.dumps({{"first": first, "reruns": reruns}}))
+"""
+
+
+def _python(code, env=None):
+    """
+    Runs 'code' in a fresh interpreter and returns its stdout, or None
+    if it failed (e.g. the module is not installed).
+    """
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def time_imports(repeat):
+    """
+    Returns {module: median cold import seconds or None}.
+    """
+    timings = {}
+    for module in MODULES:
+        samples = [_python(_IMPORT_SNIPPET.format(module)) for _ in range(repeat)]
+        samples = [float(sample) for sample in samples if sample]
+        timings[module] = statistics.median(samples) if samples else None
+    return timings
+
+
+def time_pages(reruns, database):
+    """
+    Returns {page: {'first': seconds, 'rerun_median': seconds}} for the
+    pages that can run headless here. Each page runs against a scratch
+    copy of 'database'.
+    """
+    timings = {}
+    for page in PAGES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, HASAR_DB_PATH=os.path.join(tmp, "startup.db"))
+            shutil.copy(database, env["HASAR_DB_PATH"])
+            output = _python(_RERUN_SNIPPET.format(page=page, reruns=reruns), env)
+        if output:
+            data = json.loads(output.splitlines()[-1])
+            timings[page] = {"first": data["first"], "rerun_median": statistics.median(data["reruns"])}
+        else:
+            timings[page] = None
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="mydatabase.db", help="database to copy for the page runs")
+    parser.add_argument("--repeat", type=int, default=5, help="cold imports per module")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns per page")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = {"imports": time_imports(args.repeat), "pages": time_pages(args.reruns, args.db)}
+    results["total_seconds"] = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for module, seconds in results["imports"].items():
+        print(f"import {module:<10} " + (f"{seconds * 1000:8.1f} ms" if seconds is not None else "   n/a"))
+    for page, timing in results["pages"].items():
+        if timing is None:
+            print(f"{page:<17}    n/a (streamlit not installed or page failed)")
+        else:
+            print(f"{page:<17} first {timing['first'] * 1000:8.1f} ms, rerun {timing['rerun_median'] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""
+Optional in-memory copy of the catalog the storefront browses (the
+Search rows, with the nursery name of each item), so that filtered
+searches, facet lists and tree lookups run without SQL.
+
+The copy is off unless HASAR_CATALOG=<seconds> is set. The first
+storefront read then loads every Search row (of every shard) into a
+Catalog:
+- one array per column, in result order (tree_common_name,
+  tree_inventory_id)
+- text columns dictionary-encoded, with the row positions of every
+  facet value
+- the numeric filter columns sorted once, so a range is two bisections
+- the ids sorted, for lookups
+
+A Catalog is never changed once built. A watcher thread looks at the
+databases every <seconds>: PRAGMA data_version first, then the
+Table_Versions of Search and Nursery_Tree_Inventory. When they moved,
+it builds a new Catalog and swaps it in with one assignment. Readers
+use whichever Catalog was current when they started and never wait on
+a rebuild.
+
+Reads may lag the database by up to <seconds> plus a rebuild. Stock
+is still checked on the database when an order is placed. Ranked text
+search stays on FTS5 (db.search_tree). Not for admin.py, which must
+read its own writes.
+
+    HASAR_CATALOG=2 streamlit run app.py
+"""
+import array
+import bisect
+import heapq
+import inspect
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import db
+import shards
+
+logger = logging.getLogger("hasar.catalog")
+
+INTERVAL = float(os.environ["HASAR_CATALOG"]) if os.environ.get("HASAR_CATALOG") else None
+ENABLED = INTERVAL is not None
+
+# Tables whose writes change the catalog: the triggers rewrite Search
+# on every catalog write, the inventory rows hold the nursery names.
+TABLES = ("Search", "Nursery_Tree_Inventory")
+
+# Columns of a Catalog: the result columns, then the keys.
+COLUMNS = db.RESULT_COLUMNS + ["tree_inventory_id", "tree_id", "nursery_id", "nursery_name"]
+ID = COLUMNS.index("tree_inventory_id")
+
+# Columns kept as float arrays (NaN for NULL) for the range filters;
+# every other column is dictionary-encoded.
+RANGE_COLUMNS = ("Min_height", "Max_height", "Growth_rate", "Price")
+
+# db.TREE_RESULT_COLUMNS, as Catalog columns.
+TREE_COLUMNS = [
+    "tree_id", "tree_common_name", "Scientific_name", "Growth_rate",
+    "Watering_demand", "shape", "Care_instructions", "Main_Photo_url",
+    "Origin", "Soil_type", "Root_type", "Leaf_Type",
+    "Price", "Packaging_type", "nursery_name", "Quantity_in_stock",
+    "tree_inventory_id",
+]
+
+# The code of NULL in a dictionary-encoded column.
+NULL = -1
+
+BUILD_CHUNK_ROWS = 10000
+
+# Filter results and counts each Catalog keeps (the storefront asks
+# for the same few filter sets on every rerun).
+RESULT_CACHE_SIZE = 256
+
+FILTER_DEFAULTS = {
+    name: parameter.default for name, parameter in inspect.signature(db.build_search_filter).parameters.items()
+    if parameter.kind is not parameter.KEYWORD_ONLY  # conn
+}
+
+_sql_order = shards._sql_order
+
+
+# --------------------------------
+# Snapshots
+# --------------------------------
+class Catalog:
+    """
+    An immutable copy of the Search rows, built from rows in result
+    order. 'state' holds (database, table versions) of every database
+    read, 'last_modified' when any of TABLES was last written.
+
+    The reads take build_search_filter arguments and return what the
+    db reads of the same name return for that filter.
+    """
+
+    def __init__(self, rows, state, last_modified):
+        self.state = state
+        self.last_modified = last_modified
+        self.values = {}  # dictionary-encoded column -> sorted distinct values
+        self.codes = {}  # dictionary-encoded column -> array of value indexes
+        pending = {column: ({}, array.array("i")) for column in COLUMNS
+                   if column not in RANGE_COLUMNS and column != "tree_inventory_id"}
+        numbers = {column: array.array("d") for column in RANGE_COLUMNS}
+        ids = array.array("q")
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, BUILD_CHUNK_ROWS))
+            if not chunk:
+                break
+            for column, cells in zip(COLUMNS, zip(*chunk)):
+                if column in numbers:
+                    for value in cells:
+                        if value is not None and not (isinstance(value, float) and math.isfinite(value)):
+                            raise ValueError(f"{column} holds {value!r}, which SQLite does not compare as a number")
+                    numbers[column].extend(math.nan if value is None else value for value in cells)
+                elif column == "tree_inventory_id":
+                    ids.extend(cells)
+                else:
+                    found, codes = pending[column]
+                    for value in set(cells).difference(found):
+                        found[value] = len(found)
+                    codes.extend(map(found.__getitem__, cells))
+        self.size = len(ids)
+        self.ids = ids
+        self.numbers = numbers  # range column -> array of floats
+
+        # Codes in value order, so comparing codes compares values.
+        for column, (found, codes) in pending.items():
+            values = sorted((value for value in found if value is not None), key=_sql_order)
+            position = {value: code for code, value in enumerate(values)}
+            position[None] = NULL
+            remap = [0] * len(found)
+            for value, code in found.items():
+                remap[code] = position[value]
+            self.values[column] = values
+            self.codes[column] = array.array("i", map(remap.__getitem__, codes))
+
+        # Row positions of every facet value, in result order.
+        self.postings = {}
+        for column in db.FACET_COLUMNS:
+            postings = [array.array("i") for _ in self.values[column]]
+            for row, code in enumerate(self.codes[column]):
+                if code != NULL:
+                    postings[code].append(row)
+            self.postings[column] = postings
+        self.code_of = {column: {value: code for code, value in enumerate(self.values[column])}
+                        for column in db.FACET_COLUMNS}
+
+        # Range columns in value order (NULLs left out).
+        self.sorted_numbers = {}
+        for column, floats in numbers.items():
+            order = sorted((row for row in range(self.size) if not math.isnan(floats[row])), key=floats.__getitem__)
+            self.sorted_numbers[column] = (array.array("d", map(floats.__getitem__, order)), array.array("i", order))
+
+        # Histogram bucket of every row, as schema.bucket computes it,
+        # and the unfiltered histograms.
+        self.buckets, self.histograms = {}, {}
+        for name, (column, width) in db.HISTOGRAMS.items():
+            floats = numbers[column]
+            self.buckets[name] = [None if math.isnan(value) else int(value / width) * width for value in floats]
+            counts = Counter(self.buckets[name])
+            counts.pop(None, None)
+            self.histograms[name] = sorted(counts.items())
+
+        by_id = sorted(range(self.size), key=ids.__getitem__)
+        self.sorted_ids = array.array("q", map(ids.__getitem__, by_id))
+        self.id_rows = array.array("i", by_id)
+        self.name_keys = [_sql_order(value) for value in self.values["tree_common_name"]]
+
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+
+    # ---- Cells
+    def cell(self, column, row):
+        floats = self.numbers.get(column)
+        if floats is not None:
+            value = floats[row]
+            return None if math.isnan(value) else value
+        if column == "tree_inventory_id":
+            return self.ids[row]
+        code = self.codes[column][row]
+        return None if code == NULL else self.values[column][code]
+
+    def _row(self, row, columns):
+        return tuple(self.cell(column, row) for column in columns)
+
+    # ---- Filters
+    def _equal(self, column, value):
+        """
+        Returns the condition 'column = value' as (rows matching it,
+        function returning those rows, function keeping the matching
+        rows of a list).
+        """
+        code = self.code_of[column].get(value)
+        if code is None:
+            return 0, list, lambda rows: []
+        codes = self.codes[column]
+        posting = self.postings[column][code]
+        return len(posting), posting.tolist, lambda rows: [row for row in rows if codes[row] == code]
+
+    def _between(self, column, low, high):
+        """
+        Returns the condition 'low <= column <= high' like _equal. NULL
+        (NaN) fails it, as in SQL.
+        """
+        floats = self.numbers[column]
+        values, order = self.sorted_numbers[column]
+        start, stop = bisect.bisect_left(values, low), bisect.bisect_right(values, high)
+        return (stop - start, lambda: sorted(order[start:stop]),
+                lambda rows: [row for row in rows if low <= floats[row] <= high])
+
+    def _conditions(self, filters):
+        args = dict(FILTER_DEFAULTS)
+        for name, value in filters.items():
+            if name not in args:
+                raise TypeError(f"Unknown filter: {name}")
+            args[name] = value
+        if args["height_mode"] not in db.HEIGHT_MODES:
+            raise ValueError(f"Unknown height mode: {args['height_mode']}")
+        conditions = [self._equal(column, args[name]) for column, name in db.FACET_FILTERS.items()
+                      if args[name] != "All"]
+        inf = float("inf")
+        low, high = args["min_height"], args["max_height"]
+        if args["height_mode"] == db.HEIGHT_OVERLAPS and (low is not None or high is not None):
+            low = -inf if low is None else low
+            high = inf if high is None else high
+            conditions += [self._between("Max_height", low, inf), self._between("Min_height", -inf, high)]
+        else:
+            if low is not None:
+                conditions.append(self._between("Min_height", low, inf))
+            if high is not None:
+                conditions.append(self._between("Max_height", -inf, high))
+        for column, low, high in (("Growth_rate", args["min_growth_rate"], args["max_growth_rate"]),
+                                  ("Price", args["min_price"], args["max_price"])):
+            if low is not None or high is not None:
+                conditions.append(self._between(column, -inf if low is None else low, inf if high is None else high))
+        return conditions
+
+    def _remember(self, key, compute):
+        """
+        Returns compute(), kept under 'key' while this Catalog is in
+        use (LRU). Returned values must not be mutated.
+        """
+        with self._results_lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        value = compute()
+        with self._results_lock:
+            self._results[key] = value
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return value
+
+    def clear_results(self):
+        with self._results_lock:
+            self._results.clear()
+
+    def matches(self, filters):
+        """
+        Returns the ascending row positions matching 'filters', or None
+        for all rows.
+        """
+        return self._remember(("matches",) + tuple(sorted(filters.items())), lambda: self._match(filters))
+
+    def _match(self, filters):
+        # Starts from the condition matching the fewest rows and checks
+        # the others on those.
+        conditions = sorted(self._conditions(filters), key=lambda condition: condition[0])
+        if not conditions:
+            return None
+        rows = conditions[0][1]()
+        for _, _, keep in conditions[1:]:
+            if not rows:
+                break
+            rows = keep(rows)
+        return rows
+
+    def _after(self, after):
+        """
+        Returns the position of the first row following the keyset key
+        'after' (tree_common_name, tree_inventory_id).
+        """
+        name, item = after
+        if name is None:
+            target = (NULL, item)
+        else:
+            code = bisect.bisect_left(self.name_keys, _sql_order(name))
+            names = self.values["tree_common_name"]
+            # A name no longer in the catalog: every row of the names
+            # sorting after it follows.
+            target = (code, item) if code < len(names) and names[code] == name else (code - 0.5, 0)
+        names, ids = self.codes["tree_common_name"], self.ids
+        return bisect.bisect_right(range(self.size), target, key=lambda row: (names[row], ids[row]))
+
+    # ---- Reads
+    def search_page_rows(self, filters, limit=db.PAGE_SIZE, after=None):
+        """
+        Returns (rows, next) like db.search_page_rows.
+        """
+        rows = self.matches(filters)
+        start = 0 if after is None else self._after(after)
+        if rows is None:
+            page = range(start, min(self.size, start + limit + 1))
+        else:
+            first = bisect.bisect_left(rows, start)
+            page = rows[first:first + limit + 1]
+        found = [self._row(row, db.RESULT_COLUMNS) for row in page[:limit]]
+        following = (found[-1][0], self.ids[page[limit - 1]]) if len(page) > limit else None
+        return found, following
+
+    def count(self, filters):
+        """
+        Returns how many rows match 'filters' (db.count_search_rows).
+        """
+        rows = self.matches(filters)
+        return self.size if rows is None else len(rows)
+
+    def facet_options(self, column):
+        """
+        Returns the sorted distinct values of a facet column.
+        """
+        if column not in db.FACET_COLUMNS:
+            raise ValueError(f"Unknown facet column: {column}")
+        return list(self.values[column])
+
+    def facet_counts(self, column, filters=None):
+        """
+        Returns [(value, rows)] of a facet column over the rows matching
+        'filters' (db.get_facet_counts).
+        """
+        if column not in db.FACET_COLUMNS:
+            raise ValueError(f"Unknown facet column: {column}")
+        filters = filters or {}
+        return self._remember(("facet", column) + tuple(sorted(filters.items())),
+                              lambda: self._facet_counts(column, self.matches(filters)))
+
+    def _facet_counts(self, column, rows):
+        values = self.values[column]
+        if rows is None:
+            return [(value, len(posting)) for value, posting in zip(values, self.postings[column]) if posting]
+        counts = Counter(map(self.codes[column].__getitem__, rows))
+        return [(values[code], counts[code]) for code in sorted(counts) if code != NULL]
+
+    def histogram(self, name, filters=None):
+        """
+        Returns [(bucket lower bound, rows)] of a histogram over the rows
+        matching 'filters' (db.get_histogram).
+        """
+        if name not in db.HISTOGRAMS:
+            raise ValueError(f"Unknown histogram: {name}")
+        filters = filters or {}
+        return self._remember(("histogram", name) + tuple(sorted(filters.items())),
+                              lambda: self._histogram(name, self.matches(filters)))
+
+    def _histogram(self, name, rows):
+        if rows is None:
+            return self.histograms[name]
+        counts = Counter(map(self.buckets[name].__getitem__, rows))
+        counts.pop(None, None)
+        return sorted(counts.items())
+
+    def tree_details(self, tree_inventory_id):
+        """
+        Returns the search-result row of one inventory item
+        (db.get_tree_details), or None if it is not in the catalog or
+        not linked to a tree.
+        """
+        index = bisect.bisect_left(self.sorted_ids, tree_inventory_id)
+        if index == self.size or self.sorted_ids[index] != tree_inventory_id:
+            return None
+        row = self.id_rows[index]
+        if self.codes["tree_id"][row] == NULL:
+            return None
+        return self._row(row, TREE_COLUMNS)
+
+
+# --------------------------------
+# Building and swapping
+# --------------------------------
+CATALOG_QUERY = """
+    SELECT {}, nti.nursery_name
+    FROM Search s
+    LEFT JOIN Nursery_Tree_Inventory nti ON nti.tree_inventory_id = s.tree_inventory_id
+    ORDER BY s.tree_common_name, s.tree_inventory_id
+""".format(", ".join("s." + column for column in COLUMNS[:-1]))
+
+
+def _fetch_all(cursor):
+    return itertools.chain.from_iterable(iter(lambda: cursor.fetchmany(BUILD_CHUNK_ROWS), []))
+
+
+def _versions():
+    return tuple(db.table_versions().get(table, 0) for table in TABLES)
+
+
+def state():
+    """
+    Returns (database, versions of TABLES) of every database holding
+    nursery data; cheap while nothing changed (see db.table_versions).
+    """
+    found = []
+    for path in shards.databases():
+        with db.using(path):
+            found.append((path, _versions()))
+    return tuple(found)
+
+
+def build():
+    """
+    Reads the Search rows of every database into a new Catalog, each
+    database in one read transaction. Raises ValueError if a range
+    column holds text, which SQL compares differently.
+    """
+    cursors, found, modified = [], [], []
+    try:
+        for path in shards.databases():
+            with db.using(path):
+                conn = db.get_connection()
+                conn.execute("SAVEPOINT catalog")
+                cursors.append(conn)
+                placeholders = ", ".join("?" for _ in TABLES)
+                versions = dict(conn.execute(
+                    f"SELECT table_name, version FROM Table_Versions WHERE table_name IN ({placeholders})", TABLES
+                ))
+                found.append((path, tuple(versions.get(table, 0) for table in TABLES)))
+                modified.append(db.last_modified(TABLES))
+        rows = [_fetch_all(conn.execute(CATALOG_QUERY)) for conn in cursors]
+        if len(rows) > 1:
+            rows = [heapq.merge(*rows, key=lambda row: (_sql_order(row[0]), row[ID]))]
+        return Catalog(rows[0], tuple(found), max((ts for ts in modified if ts is not None), default=None))
+    finally:
+        for conn in cursors:
+            conn.execute("RELEASE catalog")
+
+
+_current = None
+_built_state = None
+_watcher = None
+_lock = threading.Lock()
+
+
+def refresh():
+    """
+    Builds a new Catalog if the databases changed since the last build
+    and swaps it in. Returns the current Catalog (None if it could not
+    be built; reads then go to SQL).
+    """
+    global _current, _built_state
+    with _lock:
+        now = state()
+        if now != _built_state:
+            start = time.perf_counter()
+            try:
+                catalog = build()
+            except ValueError as error:
+                logger.warning("reading the catalog from SQL: %s", error)
+                catalog = None
+            # The build records the versions it read, which a write
+            # since state() may have moved already.
+            _current, _built_state = catalog, catalog.state if catalog is not None else now
+            if catalog is not None:
+                logger.info("catalog of %d rows built in %.2fs", catalog.size, time.perf_counter() - start)
+    return _current
+
+
+def _start_watcher():
+    global _watcher
+
+    def watch_forever():
+        while True:
+            time.sleep(INTERVAL)
+            try:
+                refresh()
+            except Exception:
+                logger.exception("refreshing the catalog failed")
+
+    _watcher = threading.Thread(target=watch_forever, name="catalog-watcher", daemon=True)
+    _watcher.start()
+
+
+def current():
+    """
+    Returns the Catalog to read from, or None if HASAR_CATALOG is off
+    or the catalog could not be built. The first call builds it and
+    starts the watcher.
+    """
+    if not ENABLED:
+        return None
+    if _watcher is None:
+        with _lock:
+            if _watcher is None:
+                _start_watcher()
+    if _built_state is None:
+        return refresh()
+    return _current
@@ -0,0 +1,940 @@
+import functools
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import perf
+import schema
+
+logger = logging.getLogger("hasar.db")
+
+# --------------------------------
+# Connections
+# --------------------------------
+# The one database file used by app.py, admin.py and search.py.
+DB_PATH = os.environ.get("HASAR_DB_PATH", "mydatabase.db")
+
+# Applied to every new connection (WAL mode itself is persistent and
+# set by schema.bootstrap). Writers wait up to busy_timeout ms for the
+# lock instead of failing with 'database is locked'. synchronous=NORMAL
+# is durable against application crashes in WAL mode and avoids an
+# fsync per commit.
+CONNECTION_PRAGMAS = [
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",
+]
+
+# One connection per thread, so threads never share a cursor.
+# Streamlit runs each script rerun on a new thread: a session does not
+# keep its connection from one rerun to the next, and a thread's
+# connection outlives the rerun that opened it.
+_local = threading.local()
+
+# Serialize the writers of each database file inside this process;
+# BEGIN IMMEDIATE serializes them across processes.
+_write_locks = {}
+
+# Database files already bootstrapped by this process.
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def configure(path):
+    """
+    Points the data layer at another database file. Call before the
+    first query; connections already opened keep their file.
+    """
+    global DB_PATH
+    DB_PATH = path
+
+
+def database_path():
+    """
+    Returns the database file this thread works on: the one chosen with
+    use_database, or DB_PATH.
+    """
+    return getattr(_local, "path", None) or DB_PATH
+
+
+def use_database(path):
+    """
+    Points this thread at another database file (None: back to
+    DB_PATH), e.g. the nursery shard an admin page works on.
+    """
+    _local.path = path
+
+
+@contextmanager
+def using(path):
+    """
+    Context manager running the block's queries against database file
+    'path' on this thread:
+
+        with db.using(shard_path):
+            db.place_order(...)
+    """
+    previous = getattr(_local, "path", None)
+    _local.path = path
+    try:
+        yield
+    finally:
+        _local.path = previous
+
+
+def get_connection(write=False):
+    """
+    Returns this thread's connection to the SQLite database, opening it
+    on first use. The first connection of the process to a database
+    also runs schema.bootstrap. Do not close it.
+
+    With READ_REPLICA set, reads outside a transaction are served from
+    the database's read replica; pass write=True for a connection to
+    the database itself.
+
+    Unless perf is disabled, every statement run on it is timed (see
+    the admin Performance page).
+    """
+    path = database_path()
+    if READ_REPLICA is not None and not write and not getattr(_local, "writing", False):
+        return _replica_connection(path)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = _connect(path)
+        if path not in _bootstrapped:
+            with _bootstrap_lock:
+                if path not in _bootstrapped:
+                    schema.bootstrap(conn)
+                    _bootstrapped.add(path)
+        connections[path] = conn
+    return conn
+
+
+def _connect(target, uri=False):
+    _local.opened = getattr(_local, "opened", 0) + 1
+    conn = sqlite3.connect(
+        target, uri=uri, factory=perf.InstrumentedConnection if perf.ENABLED else sqlite3.Connection
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Context manager for a short write transaction:
+
+        with db.transaction() as conn:
+            conn.execute(...)
+
+    Takes the write lock up front (BEGIN IMMEDIATE), so the statements
+    inside never fail half-way on a lock, and commits on success or
+    rolls back on error. Reads inside the block see the database
+    itself, never the read replica.
+    """
+    conn = get_connection(write=True)
+    with _write_locks.setdefault(database_path(), threading.Lock()):
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        writing, _local.writing = getattr(_local, "writing", False), True
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.writing = writing  # still True inside another database's transaction
+        conn.commit()
+
+
+# --------------------------------
+# Read replicas
+# --------------------------------
+# A storefront process started with HASAR_READ_REPLICA=<seconds> reads
+# from a private copy of each database ("<file>.replica") and only
+# writes (orders) to the database itself, so its reads never wait on
+# the admin's writes. A background thread refreshes the copies every
+# <seconds> through the SQLite backup API; with 0 they are refreshed
+# from outside, e.g. by 'python shards.py replicate --every 5'.
+# Reads may lag the database by up to that interval (stock is still
+# checked on the database when an order is placed). Not for admin.py,
+# which must read its own writes.
+READ_REPLICA = float(os.environ["HASAR_READ_REPLICA"]) if os.environ.get("HASAR_READ_REPLICA") else None
+
+REPLICA_SUFFIX = ".replica"
+
+# Databases read through a replica by this process: the ones the
+# refresher thread keeps current.
+_replicated = set()
+_refresher = None
+_replica_lock = threading.Lock()
+
+
+def replica_path(path):
+    return path + REPLICA_SUFFIX
+
+
+def snapshot(target, path=None):
+    """
+    Copies a database (default: this thread's) to file 'target' with the
+    SQLite backup API: one consistent copy, taken in a single read
+    transaction, so writers carry on meanwhile (WAL). The copy is a
+    plain rollback-journal database. The source is opened read-only,
+    so it is copied as it is: never bootstrapped or migrated.
+    """
+    path = path or database_path()
+    source = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+    conn = sqlite3.connect(target)
+    try:
+        source.backup(conn)
+        conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conn.close()
+        source.close()
+
+
+def refresh_replica(path=None):
+    """
+    Copies a database (default: this thread's) to its read replica
+    (see snapshot), then swaps the copy in with one rename. Readers
+    move to the new copy at their next query; queries already running
+    finish on the old one.
+    """
+    path = path or database_path()
+    with using(path):
+        get_connection(write=True)  # replicas have the current schema
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    os.close(handle)
+    try:
+        snapshot(temporary, path)
+        os.replace(temporary, replica_path(path))
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _replica_connection(path):
+    """
+    Returns this thread's connection to the read replica of 'path',
+    creating the replica on first use and reopening it after a refresh.
+    """
+    replica = replica_path(path)
+    with _replica_lock:
+        if path not in _replicated:
+            if not os.path.exists(replica):
+                refresh_replica(path)
+            _replicated.add(path)
+            _start_refresher()
+    stat = os.stat(replica)
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    replicas = getattr(_local, "replicas", None)
+    if replicas is None:
+        replicas = _local.replicas = {}
+    conn, opened = replicas.get(replica, (None, None))
+    if opened != stamp:
+        if conn is not None:
+            conn.close()
+        # immutable: no locks and no change checks, the file is only
+        # ever replaced, never written.
+        conn = _connect(pathlib.Path(replica).absolute().as_uri() + "?immutable=1", uri=True)
+        replicas[replica] = (conn, stamp)
+    return conn
+
+
+def _start_refresher():
+    global _refresher
+    if _refresher is not None or not READ_REPLICA:
+        return
+
+    def refresh_forever():
+        while True:
+            time.sleep(READ_REPLICA)
+            for path in list(_replicated):
+                try:
+                    refresh_replica(path)
+                except Exception:
+                    logger.exception("refreshing the replica of %s failed", path)
+
+    _refresher = threading.Thread(target=refresh_forever, name="replica-refresher", daemon=True)
+    _refresher.start()
+
+
+# --------------------------------
+# Table versions and read caches
+# --------------------------------
+def table_versions():
+    """
+    Returns {table name: version}. Triggers bump a table's version on
+    every write, whoever makes it.
+
+    The versions are only re-read when the database changed since this
+    thread last looked: 'PRAGMA data_version' moves when another
+    connection commits, total_changes when this one writes, and the
+    count of opened connections when a refreshed replica is reopened.
+    """
+    conn = get_connection()
+    state = (
+        database_path(), getattr(_local, "opened", 0),
+        conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes,
+    )
+    if getattr(_local, "version_state", None) != state:
+        _local.versions = dict(conn.execute("SELECT table_name, version FROM Table_Versions"))
+        _local.version_state = state
+    return _local.versions
+
+
+def last_modified(tables):
+    """
+    Returns when any of 'tables' was last written (unix seconds), or
+    None if none of them has been written since timestamps were kept.
+    """
+    placeholders = ", ".join("?" for _ in tables)
+    return get_connection().execute(
+        f"SELECT MAX(updated_at) FROM Table_Versions WHERE table_name IN ({placeholders})",
+        tuple(tables),
+    ).fetchone()[0]
+
+
+def cached(*tables, maxsize=256):
+    """
+    Decorator: LRU-caches a read function (positional, hashable
+    arguments) until one of 'tables' changes. The cache is shared by
+    all threads, so returned values must not be mutated.
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            versions = table_versions()
+            key = (database_path(), args, tuple(versions.get(table, 0) for table in tables))
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            value = func(*args)
+            with lock:
+                cache[key] = value
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+# --------------------------------
+# Tree search (storefront)
+# --------------------------------
+RESULTS_PER_PAGE = 10
+
+# Columns returned for each search result, one row per inventory item.
+TREE_RESULT_COLUMNS = """
+    t.tree_id, t.Common_name, t.Scientific_name, t.Growth_rate,
+    t.Watering_demand, t.shape, t.Care_instructions, t.Main_Photo_url,
+    t.Origin, t.Soil_type, t.Root_type, t.Leaf_Type,
+    nti.Price, nti.Packaging_type, nti.nursery_name, nti.Quantity_in_stock,
+    nti.tree_inventory_id
+"""
+
+
+def _prefix_query(search_query):
+    """
+    Turns free text into an FTS5 query matching every word as a prefix,
+    e.g. 'red map' -> '"red"* "map"*'.
+    """
+    words = re.findall(r"\w+", search_query.lower())
+    return " ".join('"{}"*'.format(word) for word in words)
+
+
+def _trigram_query(search_query):
+    """
+    Turns free text into an FTS5 query on the trigram index matching any
+    three-letter piece of any word, so 'mapel' still finds 'maple'.
+    """
+    words = re.findall(r"\w+", search_query.lower())
+    grams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+    return " OR ".join('"{}"'.format(gram) for gram in sorted(grams))
+
+
+def _has_match(index, match):
+    """
+    Returns True if any tree matches 'match' in the FTS5 table 'index'.
+    """
+    row = get_connection().execute(
+        f"SELECT 1 FROM {index} WHERE {index} MATCH ? LIMIT 1", (match,)
+    ).fetchone()
+    return row is not None
+
+
+# BM25 column weights of each FTS5 table a tree search may use. Name
+# matches outrank matches in the care instructions or origin.
+FTS_WEIGHTS = {"Trees_fts": "10.0, 5.0, 1.0, 2.0", "Trees_trigram": "10.0, 5.0"}
+
+
+def ranked_query(index, with_rank=False):
+    """
+    Returns the SQL of one page of inventory rows for the trees matching
+    an FTS5 query (parameters: match, limit, offset) in the FTS5 table
+    'index', best BM25 rank first; with_rank appends the rank to each
+    row.
+    """
+    return f"""
+        SELECT {TREE_RESULT_COLUMNS}{", m.rank" if with_rank else ""}
+        FROM (
+            SELECT rowid AS tree_id, bm25({index}, {FTS_WEIGHTS[index]}) AS rank
+            FROM {index}
+            WHERE {index} MATCH ?
+        ) m
+        JOIN Trees t ON t.tree_id = m.tree_id
+        JOIN Nursery_Tree_Inventory nti ON nti.tree_id = t.tree_id
+        ORDER BY m.rank, nti.Price, nti.tree_inventory_id
+        LIMIT ? OFFSET ?
+    """
+
+
+def _ranked_results(index, match, limit, offset, with_rank=False):
+    return get_connection().execute(ranked_query(index, with_rank), (match, limit, offset)).fetchall()
+
+
+def _tree_matches(search_query):
+    """
+    Returns (index, match, fuzzy) of the FTS5 query answering a
+    tree search, or None for a query without words. Words are matched as
+    prefixes against the names, care instructions and origin; if nothing
+    matches, misspellings are tolerated through the trigram index.
+    """
+    match = _prefix_query(search_query)
+    if not match:
+        return None
+    if _has_match("Trees_fts", match):
+        return "Trees_fts", match, False
+    match = _trigram_query(search_query)
+    if not match:
+        return None
+    return "Trees_trigram", match, True
+
+
+@cached("Trees", "Nursery_Tree_Inventory")
+def search_tree(search_query, page=0, per_page=RESULTS_PER_PAGE):
+    """
+    Ranked tree search (see _tree_matches).
+
+    Returns (rows, fuzzy): one page of result rows, and whether the
+    trigram fallback produced them. One extra row is fetched so the
+    caller can tell whether a next page exists.
+    """
+    found = _tree_matches(search_query)
+    if found is None:
+        return [], False
+    index, match, fuzzy = found
+    return _ranked_results(index, match, per_page + 1, page * per_page), fuzzy
+
+
+@cached("Trees", "Nursery_Tree_Inventory")
+def search_tree_ranked(search_query, limit):
+    """
+    Returns (rows, fuzzy) like search_tree, for the first 'limit' rows,
+    each with its BM25 rank appended: for merging the results of
+    several nursery shards (see shards.search_tree).
+    """
+    found = _tree_matches(search_query)
+    if found is None:
+        return [], False
+    index, match, fuzzy = found
+    return _ranked_results(index, match, limit, 0, with_rank=True), fuzzy
+
+
+TREE_DETAILS_QUERY = f"""
+    SELECT {TREE_RESULT_COLUMNS}
+    FROM Nursery_Tree_Inventory nti
+    JOIN Trees t ON t.tree_id = nti.tree_id
+    WHERE nti.tree_inventory_id = ?
+"""
+
+
+@cached("Trees", "Nursery_Tree_Inventory")
+def get_tree_details(tree_inventory_id):
+    """
+    Returns the search-result row of one inventory item, or None.
+    """
+    return get_connection().execute(TREE_DETAILS_QUERY, (tree_inventory_id,)).fetchone()
+
+
+@cached("Nurseries")
+def get_nursery_names():
+    """
+    Returns the sorted distinct nursery names.
+    """
+    rows = get_connection().execute(
+        "SELECT DISTINCT Nursery_name FROM Nurseries WHERE Nursery_name IS NOT NULL ORDER BY Nursery_name"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+@cached("Trees")
+def get_tree_names():
+    """
+    Returns the sorted distinct tree common names.
+    """
+    rows = get_connection().execute(
+        "SELECT DISTINCT Common_name FROM Trees WHERE Common_name IS NOT NULL ORDER BY Common_name"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+# --------------------------------
+# Search page (filters, facets and counts)
+# --------------------------------
+PAGE_SIZE = 50
+
+# Columns shown in the results table.
+RESULT_COLUMNS = [column for column in schema.SEARCH_COLUMNS if column not in schema.SEARCH_KEY_COLUMNS]
+
+
+# Facet column -> the build_search_filter argument selecting one of
+# its values ("All" for no selection).
+FACET_FILTERS = {
+    "tree_common_name": "tree_choice",
+    "Packaging_type": "packaging_choice",
+    "shape": "shape_choice",
+    "Leaf_Type": "leaf_type",
+    "Soil_type": "soil_type",
+    "Watering_demand": "watering_demand",
+    "Origin": "origin",
+}
+
+# Histogram -> the build_search_filter arguments bounding its column.
+HISTOGRAM_FILTERS = {
+    "height": ("min_height", "max_height"),
+    "price": ("min_price", "max_price"),
+    "growth_rate": ("min_growth_rate", "max_growth_rate"),
+}
+
+# Ways to match a height range against an item's [Min_height, Max_height].
+HEIGHT_WITHIN = "within"  # the item's whole range lies inside it
+HEIGHT_OVERLAPS = "overlaps"  # the ranges share at least one height
+HEIGHT_MODES = (HEIGHT_WITHIN, HEIGHT_OVERLAPS)
+
+# An overlap filter reads its candidates from the Search_heights R*Tree
+# when it matches at most this many rows. Broader ranges match densely,
+# and scanning Search in result order reaches a page of them sooner
+# than fetching every candidate.
+RTREE_MAX_CANDIDATES = 1000
+
+
+def _height_overlap_filter(low, high, conn=None):
+    """
+    Returns (clause, params) matching Search rows whose height range
+    shares at least one height with [low, high]. The R*Tree is probed
+    on 'conn' (default: this thread's connection).
+    """
+    exact = "Max_height >= ? AND Min_height <= ?"
+    candidates = "SELECT id FROM Search_heights WHERE max_height >= ? AND min_height <= ?"
+    probe = (conn or get_connection()).execute(
+        f"SELECT COUNT(*) FROM ({candidates} LIMIT ?)", (low, high, RTREE_MAX_CANDIDATES + 1)
+    ).fetchone()[0]
+    if probe > RTREE_MAX_CANDIDATES:
+        return exact, [low, high]
+    # The R*Tree rounds outwards to 32-bit floats: re-check exactly.
+    return f"tree_inventory_id IN ({candidates}) AND {exact}", [low, high, low, high]
+
+
+def build_search_filter(tree_choice="All", min_height=None, max_height=None,
+                        packaging_choice="All", min_growth_rate=None, max_growth_rate=None,
+                        shape_choice="All", leaf_type="All", soil_type="All", watering_demand="All",
+                        origin="All", min_price=None, max_price=None, height_mode=HEIGHT_WITHIN, *,
+                        conn=None):
+    """
+    Turns the filter widget values into one parameterized WHERE clause;
+    arguments left at their defaults add no condition. Numeric bounds
+    are inclusive. With height_mode HEIGHT_OVERLAPS an item matches if
+    any height it comes in lies between min_height and max_height;
+    narrow ranges are looked up in the Search_heights R*Tree, probed on
+    'conn' (default: this thread's connection). Returns (where, params).
+    """
+    if height_mode not in HEIGHT_MODES:
+        raise ValueError(f"Unknown height mode: {height_mode}")
+    clauses = []
+    params = []
+    if tree_choice != "All":
+        clauses.append("tree_common_name = ?")
+        params.append(tree_choice)
+    if height_mode == HEIGHT_OVERLAPS and (min_height is not None or max_height is not None):
+        low = float("-inf") if min_height is None else min_height
+        high = float("inf") if max_height is None else max_height
+        clause, clause_params = _height_overlap_filter(low, high, conn)
+        clauses.append(clause)
+        params += clause_params
+    else:
+        if min_height is not None:
+            clauses.append("Min_height >= ?")
+            params.append(min_height)
+        if max_height is not None:
+            clauses.append("Max_height <= ?")
+            params.append(max_height)
+    if packaging_choice != "All":
+        clauses.append("Packaging_type = ?")
+        params.append(packaging_choice)
+    for column, low, high in (("Growth_rate", min_growth_rate, max_growth_rate), ("Price", min_price, max_price)):
+        if low is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(high)
+    if shape_choice != "All":
+        clauses.append("shape = ?")
+        params.append(shape_choice)
+    for column, choice in (("Leaf_Type", leaf_type), ("Soil_type", soil_type),
+                           ("Watering_demand", watering_demand), ("Origin", origin)):
+        if choice != "All":
+            clauses.append(f"{column} = ?")
+            params.append(choice)
+    return " AND ".join(clauses) or "1", params
+
+
+def build_search_query(where, params, limit=PAGE_SIZE, after=None):
+    """
+    Returns (sql, params) selecting one page of Search rows matching a
+    clause from build_search_filter, in (tree_common_name,
+    tree_inventory_id) order: RESULT_COLUMNS, then tree_inventory_id.
+    'after' is the sort key of the last row of the previous page, or
+    None for the first page (keyset pagination: no rows are skipped
+    over, however deep the page).
+    """
+    params = list(params)
+    if after is not None:
+        name, item = after
+        if name is None:
+            # NULL names sort first
+            where = f"({where}) AND (tree_common_name IS NOT NULL OR tree_inventory_id > ?)"
+            params.append(item)
+        else:
+            where = f"({where}) AND (tree_common_name, tree_inventory_id) > (?, ?)"
+            params += [name, item]
+    sql = "SELECT {}, tree_inventory_id FROM Search WHERE {} ORDER BY tree_common_name, tree_inventory_id LIMIT ?".format(
+        ", ".join(RESULT_COLUMNS), where
+    )
+    return sql, params + [limit]
+
+
+def search_page_rows(where, params, limit=PAGE_SIZE, after=None):
+    """
+    Returns (rows, next) for one page of Search rows (RESULT_COLUMNS)
+    matching a clause from build_search_filter. 'next' is the 'after'
+    key of the following page, or None on the last page.
+    """
+    sql, page_params = build_search_query(where, params, limit + 1, after)
+    rows = get_connection().execute(sql, page_params).fetchall()
+    return _keyset_page(rows, limit, lambda row: (row[0], row[-1]))
+
+
+def _keyset_page(rows, limit, key):
+    """
+    Splits 'limit' + 1 fetched rows into (page rows without their last
+    column, key of the last page row or None if nothing follows).
+    """
+    following = key(rows[limit - 1]) if len(rows) > limit else None
+    return [tuple(row[:-1]) for row in rows[:limit]], following
+
+
+# Search columns that dropdowns may be built from, and the histograms
+# {name: (column, bucket width)} drawn next to them.
+FACET_COLUMNS = schema.FACET_COLUMNS
+HISTOGRAMS = schema.HISTOGRAMS
+
+
+@cached("Search")
+def get_facet_options(column):
+    """
+    Returns the sorted distinct values of a Search column.
+    """
+    if column not in FACET_COLUMNS:
+        raise ValueError(f"Unknown facet column: {column}")
+    return [value for value, count in _counts(column, column, "1", ())]
+
+
+@cached("Search")
+def get_facet_counts(column, where="1", params=()):
+    """
+    Returns [(value, rows)] of a facet column, sorted by value, over the
+    Search rows matching a clause from build_search_filter. Unfiltered
+    counts are read from the precomputed Facet_Counts table.
+    'params' must be a tuple.
+    """
+    if column not in FACET_COLUMNS:
+        raise ValueError(f"Unknown facet column: {column}")
+    return _counts(column, column, where, params)
+
+
+@cached("Search")
+def get_histogram(name, where="1", params=()):
+    """
+    Returns [(bucket lower bound, rows)] of a histogram (see
+    HISTOGRAMS), like get_facet_counts.
+    """
+    if name not in HISTOGRAMS:
+        raise ValueError(f"Unknown histogram: {name}")
+    column, width = HISTOGRAMS[name]
+    return _counts("histogram:" + name, schema.bucket(column, width), where, params)
+
+
+STORED_COUNTS_QUERY = "SELECT value, count FROM Facet_Counts WHERE facet = ? AND count > 0 ORDER BY value"
+
+
+def counts_query(expression, where):
+    """
+    Returns the SQL counting the Search rows matching 'where' by the
+    value of 'expression' (a facet column or histogram bucket).
+    """
+    return (f"SELECT {expression} AS value, COUNT(*) FROM Search WHERE ({where}) AND value IS NOT NULL "
+            "GROUP BY value ORDER BY value")
+
+
+def _counts(facet, expression, where, params):
+    conn = get_connection()
+    if where == "1":
+        rows = conn.execute(STORED_COUNTS_QUERY, (facet,)).fetchall()
+    else:
+        rows = conn.execute(counts_query(expression, where), params).fetchall()
+    return [tuple(row) for row in rows]
+
+
+COUNT_SEARCH_QUERY = "SELECT COUNT(*) FROM Search WHERE {}"
+
+
+@cached("Search")
+def count_search_rows(where, params):
+    """
+    Returns how many Search rows match a WHERE clause.
+    'params' must be a tuple.
+    """
+    return get_connection().execute(COUNT_SEARCH_QUERY.format(where), params).fetchone()[0]
+
+
+# --------------------------------
+# Table browsing (admin)
+# --------------------------------
+# Tables the admin pages can page through, by their integer key.
+BROWSE_KEYS = {
+    "Nurseries": "nursery_id",
+    "Trees": "tree_id",
+    "Nursery_Tree_Inventory": "tree_inventory_id",
+    "Customers": "customer_id",
+    "Orders": "order_id",
+    "Order_Status_Events": "event_id",
+}
+
+
+def browse_query(table):
+    """
+    Returns the SQL of one page of a BROWSE_KEYS table in key order
+    (parameters: the key to start after, limit), with the key appended.
+    """
+    key = BROWSE_KEYS[table]
+    return f'SELECT *, "{key}" FROM "{table}" WHERE "{key}" > ? ORDER BY "{key}" LIMIT ?'
+
+
+@cached(*BROWSE_KEYS)
+def browse_table(table, limit=PAGE_SIZE, after=None):
+    """
+    Returns (columns, rows, next) for one page of a table in key order.
+    'after' is the key of the last row of the previous page; 'next'
+    that of this page, or None on the last page.
+    """
+    if table not in BROWSE_KEYS:
+        raise ValueError(f"Unknown table: {table}")
+    cursor = get_connection().execute(browse_query(table), (after if after is not None else -2 ** 63, limit + 1))
+    columns = [column[0] for column in cursor.description[:-1]]
+    rows, following = _keyset_page(cursor.fetchall(), limit, lambda row: row[-1])
+    return columns, rows, following
+
+
+@cached(*BROWSE_KEYS)
+def count_table_rows(table):
+    """
+    Returns the number of rows of a table in BROWSE_KEYS.
+    """
+    if table not in BROWSE_KEYS:
+        raise ValueError(f"Unknown table: {table}")
+    return get_connection().execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+
+# --------------------------------
+# Orders
+# --------------------------------
+ORDERS_PAGE_SIZE = 20
+
+# Statuses an order moves through; every order starts as the first.
+ORDER_STATUSES = ["Order Placed", "Confirmed", "Shipped", "Delivered", "Cancelled"]
+
+# Tables an order summary is read from.
+ORDER_SUMMARY_TABLES = ("Customers", "Orders", "Order_Latest_Status", "Nursery_Tree_Inventory")
+
+# Columns of an order summary (get_order_status).
+ORDER_SUMMARY_COLUMNS = [
+    "order_id", "placed_at", "username", "email", "tree_inventory_id", "tree_common_name",
+    "nursery_name", "packaging_type", "quantity", "price", "status", "note", "status_at",
+]
+
+
+ORDER_STATUS_QUERY = """
+    SELECT o.order_id, o.placed_at, c.Username, c.Email, o.tree_inventory_id, nti.tree_common_name,
+           nti.nursery_name, nti.Packaging_type, o.Quantity, o.price, l.Status, l.Note, l.ts,
+           COALESCE(o.placed_at, 0)
+    FROM Customers c
+    JOIN Orders o ON o.customer_id = c.customer_id
+    LEFT JOIN Order_Latest_Status l ON l.order_id = o.order_id
+    LEFT JOIN Nursery_Tree_Inventory nti ON nti.tree_inventory_id = o.tree_inventory_id
+    WHERE c.Email = ? AND (COALESCE(o.placed_at, 0), o.order_id) < (?, ?)
+    ORDER BY COALESCE(o.placed_at, 0) DESC, o.order_id DESC LIMIT ?
+"""
+
+
+@cached(*ORDER_SUMMARY_TABLES)
+def get_order_status(email, limit=ORDERS_PAGE_SIZE, after=None):
+    """
+    Returns (rows, next) for one page of an email's orders, newest
+    first: ORDER_SUMMARY_COLUMNS rows with the current status, and the
+    'after' key (placed_at, order_id) of the following page or None.
+    Orders from before placed_at was recorded sort as placed at 0, and
+    order_id breaks ties (ids are not in placement order across
+    shards). One query: an index seek on the email, then primary-key
+    joins and a sort of that email's orders.
+    """
+    placed_at, order_id = after if after is not None else (float("inf"), MAX_INTEGER)
+    rows = get_connection().execute(ORDER_STATUS_QUERY, (email, placed_at, order_id, limit + 1)).fetchall()
+    return _keyset_page(rows, limit, lambda row: (row[-1], row[0]))
+
+
+@cached("Customers", "Orders")
+def count_orders(email):
+    """
+    Returns how many orders an email has placed.
+    """
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM Customers c JOIN Orders o ON o.customer_id = c.customer_id WHERE c.Email = ?",
+        (email,),
+    ).fetchone()[0]
+
+
+ORDER_EVENTS_QUERY = "SELECT ts, Status, Note FROM Order_Status_Events WHERE order_id = ? ORDER BY ts, event_id"
+
+
+@cached("Order_Status_Events")
+def get_order_events(order_id):
+    """
+    Returns the status history of an order, oldest first, as
+    (ts, Status, Note) rows; ts is unix seconds.
+    """
+    return get_connection().execute(ORDER_EVENTS_QUERY, (order_id,)).fetchall()
+
+
+def add_order_status(order_id, status, note=""):
+    """
+    Appends a status event to an order; the order's current status
+    follows. Raises ValueError for an unknown order or status.
+    """
+    if status not in ORDER_STATUSES:
+        raise ValueError(f"Unknown order status: {status}")
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM Orders WHERE order_id = ?", (order_id,)).fetchone() is None:
+            raise ValueError(f"Unknown order: {order_id}")
+        conn.execute(
+            "INSERT INTO Order_Status_Events (order_id, ts, Status, Note) VALUES (?, ?, ?, ?)",
+            (order_id, time.time(), status, note),
+        )
+
+
+ORDER_PLACED = "placed"
+SOLD_OUT = "sold_out"
+
+
+# The largest integer SQLite stores; binding a larger one fails.
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def check_order_quantity(quantity):
+    """
+    Raises ValueError unless 'quantity' is a positive int SQLite can
+    store.
+    """
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or not 1 <= quantity <= MAX_INTEGER:
+        raise ValueError("quantity must be a positive integer")
+
+
+def place_order(tree_inventory_id, quantity, username, customer_full_name,
+                address, whatsapp_number, email, payment_preferences):
+    """
+    Places an order in one short transaction: reserves the stock with a
+    conditional UPDATE, then records the customer, the order and its
+    first status event. The price is taken from the inventory row, not
+    the caller.
+
+    Returns a dict:
+        {"status": ORDER_PLACED, "order_id": ..., "price": total}
+        {"status": SOLD_OUT, "available": units left}
+    A sold-out attempt writes nothing. Raises ValueError for a quantity
+    that is not a positive int.
+    """
+    check_order_quantity(quantity)
+    with transaction() as conn:
+        reserved = conn.execute(
+            """
+            UPDATE Nursery_Tree_Inventory
+            SET Quantity_in_stock = Quantity_in_stock - ?
+            WHERE tree_inventory_id = ? AND Quantity_in_stock >= ?
+            """,
+            (quantity, tree_inventory_id, quantity),
+        ).rowcount
+        if not reserved:
+            row = conn.execute(
+                "SELECT Quantity_in_stock FROM Nursery_Tree_Inventory WHERE tree_inventory_id = ?",
+                (tree_inventory_id,),
+            ).fetchone()
+            return {"status": SOLD_OUT, "available": row[0] if row and row[0] else 0}
+
+        unit_price = conn.execute(
+            "SELECT Price FROM Nursery_Tree_Inventory WHERE tree_inventory_id = ?",
+            (tree_inventory_id,),
+        ).fetchone()[0]
+        total_price = (unit_price or 0) * quantity
+        customer_id = conn.execute(
+            """
+            INSERT INTO Customers (Quantity, Username, Customer_full_Name, Address, "Whatsapp Number", Email, price, "Payment Preferences", tree_inventory_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (quantity, username, customer_full_name, address, whatsapp_number,
+             email, total_price, payment_preferences, tree_inventory_id),
+        ).lastrowid
+        placed_at = time.time()
+        # An order keeps its customer row's id, as backfilled orders do;
+        # ids then stay unique across nursery shards (see shards.py).
+        order_id = customer_id
+        conn.execute(
+            """
+            INSERT INTO Orders (order_id, customer_id, tree_inventory_id, Quantity, price, placed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (order_id, customer_id, tree_inventory_id, quantity, total_price, placed_at),
+        )
+        conn.execute(
+            "INSERT INTO Order_Status_Events (order_id, ts, Status, Note) VALUES (?, ?, ?, ?)",
+            (order_id, placed_at, ORDER_STATUSES[0], ""),
+        )
+    return {"status": ORDER_PLACED, "order_id": order_id, "price": total_price}
@@ -0,0 +1,365 @@
+"""
+Bulk export of the catalog and orders to columnar files, for reporting
+jobs that should not query the live database.
+
+Each run first copies the database with the SQLite backup API (one
+consistent snapshot; the storefront keeps writing meanwhile), then
+streams every table from the copy in chunks into Parquet (default) or
+Arrow IPC files, and records what it wrote in 'manifest.json' next to
+them:
+
+    out/manifest.json
+    out/Orders/part-00001.parquet
+    out/Orders/part-00002.parquet   (rows added since run 1)
+    out/Trees/part-00002.parquet    (Trees changed since run 1)
+    ...
+
+Runs are incremental. The order tables are append-only, so a run only
+exports their rows with a key above the last one exported, as a new
+part. Catalog tables change in place: a run exports them whole, as a
+part replacing the previous one, only if their Table_Versions version
+moved since the last run. Readers take the parts listed in the
+manifest, which is replaced in one rename at the end of a run.
+
+Parquet and Arrow need pyarrow (optional); 'csv' writes gzipped CSV
+parts without it. With nursery shards, export each shard file to its
+own directory.
+
+    python export.py out/                       # mydatabase.db, Parquet
+    python export.py out/ --db other.db --format arrow
+    python export.py out/ --full                # start over
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+
+import db
+import schema
+
+# --------------------------------
+# What is exported
+# --------------------------------
+# {table: incremental key}: tables with a key only ever get rows with
+# a higher key (append-only); tables without one are exported whole
+# when their version changes.
+EXPORT_TABLES = {
+    "Nurseries": None,
+    "Trees": None,
+    "Nursery_Tree_Inventory": None,
+    "Search": None,
+    "Customers": "customer_id",
+    "Orders": "order_id",
+    "Order_Status_Events": "event_id",
+    "Order_Latest_Status": None,
+}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv.gz"}
+
+CHUNK_ROWS = 50000
+
+MANIFEST = "manifest.json"
+
+
+# --------------------------------
+# Column types
+# --------------------------------
+# SQLite stores whatever a row holds, whatever the declared type, so a
+# column's Arrow type is taken from the storage classes it actually
+# holds in the snapshot; the declared type only decides for empty
+# columns. An append-only table keeps the types of its first part for
+# every later part (see _table_types), so its parts read as one
+# dataset.
+ARROW_TYPES = {"integer": "int64", "real": "float64", "text": "string", "blob": "binary"}
+
+
+def _declared_type(declared):
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "int64"
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return "float64"
+    return "binary" if "BLOB" in declared else "string"
+
+
+def column_types(conn, table, where="1", params=()):
+    """
+    Returns [(column, type)] of a table for the rows matching 'where',
+    the type being one of int64, float64, string or binary.
+    """
+    columns = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    classes = conn.execute(
+        "SELECT {} FROM \"{}\" WHERE {}".format(
+            ", ".join(f'group_concat(DISTINCT typeof("{column[1]}"))' for column in columns), table, where
+        ),
+        params,
+    ).fetchone()
+    types = []
+    for column, found in zip(columns, classes):
+        found = set((found or "").split(",")) - {"", "null"}
+        if not found:
+            kind = _declared_type(column[2])
+        elif len(found) == 1:
+            kind = ARROW_TYPES[found.pop()]
+        elif found == {"integer", "real"}:
+            kind = "float64"
+        else:
+            kind = "string"  # mixed: numbers are written as text
+        types.append((column[1], kind))
+    return types
+
+
+def _table_types(first, found):
+    """
+    Returns the column types of a new part of an append-only table:
+    those of its first part ('first', from the manifest) for the
+    columns it had, 'found' (column_types of the new rows) for columns
+    added since.
+    """
+    fixed = dict(first)
+    return [(name, fixed.get(name, kind)) for name, kind in found]
+
+
+def _to_int(value):
+    if isinstance(value, int) or value is None:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"{value!r} does not fit an int64 column (export with --full to retype it)")
+
+
+def _to_float(value):
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} does not fit a float64 column (export with --full to retype it)")
+
+
+def _convert(kind):
+    """
+    Returns the function turning a stored value into one of type 'kind'.
+    Raises ValueError for a value that has no such form.
+    """
+    if kind == "int64":
+        return _to_int
+    if kind == "float64":
+        return _to_float
+    if kind == "string":
+        return lambda value: value if value is None or isinstance(value, str) else str(value)
+    return lambda value: value if value is None or isinstance(value, bytes) else str(value).encode()
+
+
+# --------------------------------
+# Part writers
+# --------------------------------
+def _arrow_schema(types):
+    import pyarrow as pa  # optional; only the Parquet and Arrow formats need it
+    return pa.schema([(name, getattr(pa, kind)()) for name, kind in types])
+
+
+def write_part(path, fmt, types, chunks):
+    """
+    Writes an iterable of row chunks (lists of tuples in 'types' column
+    order) to one part file. Returns the number of rows written.
+    """
+    converters = [_convert(kind) for _, kind in types]
+    rows = 0
+    if fmt == "csv":
+        with gzip.open(path, "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([name for name, _ in types])
+            for chunk in chunks:
+                writer.writerows(chunk)
+                rows += len(chunk)
+        return rows
+
+    import pyarrow as pa
+    arrow_schema = _arrow_schema(types)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, arrow_schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(path, arrow_schema)
+    try:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            batch = pa.record_batch(
+                [pa.array([convert(value) for value in column], type=field.type)
+                 for convert, column, field in zip(converters, columns, arrow_schema)],
+                schema=arrow_schema,
+            )
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            rows += len(chunk)
+    finally:
+        writer.close()
+    return rows
+
+
+def _chunks(cursor, size):
+    while True:
+        chunk = cursor.fetchmany(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+# --------------------------------
+# Export runs
+# --------------------------------
+def load_manifest(out_dir):
+    """
+    Returns the manifest of an export directory, or an empty one.
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"run": 0, "tables": {}}
+
+
+def _save_manifest(out_dir, manifest):
+    temporary = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, os.path.join(out_dir, MANIFEST))
+
+
+def _export_table(conn, table, key, previous, out_dir, run, fmt, chunk_rows):
+    """
+    Exports one table of the snapshot. Returns its new manifest entry
+    and the part files that entry no longer lists.
+    """
+    version = conn.execute("SELECT version FROM Table_Versions WHERE table_name = ?", (table,)).fetchone()
+    version = version[0] if version else None
+    if key is None:
+        if previous and version is not None and previous["version"] == version:
+            return previous, []
+        where, params = "1", ()
+        entry = {"key": None, "version": version, "files": []}
+        dropped = [part["file"] for part in previous["files"]] if previous else []
+    else:
+        last_key = previous["last_key"] if previous else None
+        entry = {"key": key, "version": version, "files": list(previous["files"]) if previous else [],
+                 "last_key": conn.execute(f'SELECT MAX("{key}") FROM "{table}"').fetchone()[0]}
+        dropped = []
+        if entry["last_key"] is None or entry["last_key"] == last_key:
+            entry["last_key"] = last_key
+            return entry, dropped
+        where, params = (f'"{key}" > ?', (last_key,)) if last_key is not None else ("1", ())
+
+    types = column_types(conn, table, where, params)
+    if key is not None and entry["files"]:
+        types = _table_types(entry["files"][0]["columns"], types)
+    cursor = conn.execute(
+        "SELECT {} FROM \"{}\" WHERE {}{}".format(
+            ", ".join(f'"{name}"' for name, _ in types), table, where, f' ORDER BY "{key}"' if key else ""
+        ),
+        params,
+    )
+    os.makedirs(os.path.join(out_dir, table), exist_ok=True)
+    name = os.path.join(table, f"part-{run:05d}{FORMATS[fmt]}")
+    rows = write_part(os.path.join(out_dir, name), fmt, types, _chunks(cursor, chunk_rows))
+    part = {"file": name, "run": run, "rows": rows, "columns": types}
+    if key is not None:
+        part["last_key"] = entry["last_key"]
+    entry["files"].append(part)
+    return entry, dropped
+
+
+def export(out_dir, path=None, fmt="parquet", tables=None, full=False, chunk_rows=CHUNK_ROWS,
+           keep_snapshot=False):
+    """
+    Snapshots a database (default: this thread's) and exports 'tables'
+    (default: EXPORT_TABLES) into 'out_dir', incrementally unless
+    'full' or the format or database changed. Returns the new
+    manifest.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    for table in tables or ():
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown table: {table}")
+    if fmt != "csv":
+        _arrow_schema([])  # fail early if pyarrow is missing
+    os.makedirs(out_dir, exist_ok=True)
+    source = os.path.abspath(path or db.database_path())
+    manifest = load_manifest(out_dir)
+    dropped = []
+    if full or manifest.get("format", fmt) != fmt or manifest.get("source", source) != source:
+        dropped = [part["file"] for entry in manifest["tables"].values() for part in entry["files"]]
+        manifest = {"run": manifest["run"], "tables": {}}
+    run = manifest["run"] + 1
+
+    snapshot = os.path.join(out_dir, f"snapshot-{run:05d}.db")
+    started = time.time()
+    try:
+        db.snapshot(snapshot, path)
+        conn = sqlite3.connect(snapshot)
+        try:
+            for table, key in EXPORT_TABLES.items():
+                if tables and table not in tables:
+                    continue
+                entry, unlisted = _export_table(conn, table, key, manifest["tables"].get(table),
+                                                out_dir, run, fmt, chunk_rows)
+                manifest["tables"][table] = entry
+                dropped += unlisted
+        finally:
+            conn.close()
+        manifest.update({
+            "run": run,
+            "format": fmt,
+            "source": source,
+            "schema_version": schema.SCHEMA_VERSION,
+            "snapshot_at": started,
+            "finished_at": time.time(),
+        })
+        if keep_snapshot:
+            manifest["snapshot"] = os.path.basename(snapshot)
+        _save_manifest(out_dir, manifest)
+    except BaseException:
+        # No manifest lists this run's parts; the next run reuses its number.
+        for table in EXPORT_TABLES:
+            part = os.path.join(out_dir, table, f"part-{run:05d}{FORMATS[fmt]}")
+            if os.path.exists(part):
+                os.remove(part)
+        raise
+    finally:
+        if not keep_snapshot and os.path.exists(snapshot):
+            os.remove(snapshot)
+    # Parts of earlier runs stay readable until the new manifest is in.
+    for name in dropped:
+        if os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file to export (default: %(default)s)")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES))
+    parser.add_argument("--full", action="store_true", help="ignore earlier runs and export everything")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--keep-snapshot", action="store_true", help="keep the database snapshot next to the parts")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = export(args.out_dir, args.db, args.format, args.tables, args.full, args.chunk_rows,
+                      args.keep_snapshot)
+    for table, entry in manifest["tables"].items():
+        written = sum(part["rows"] for part in entry["files"] if part["run"] == manifest["run"])
+        print(f"{table}: {written} row(s) written, {len(entry['files'])} part(s)")
+    print(f"Run {manifest['run']} done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
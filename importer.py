@@ -0,0 +1,474 @@
+import csv
+import hashlib
+import io
+import itertools
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import shards
+
+# --------------------------------
+# Import specifications
+# --------------------------------
+# For each admin table: the columns a CSV may fill and their types, and
+# the natural key used to decide between updating and inserting a row.
+IMPORT_TABLES = {
+    "Nurseries": {
+        "columns": {
+            "Registration_code": str,
+            "Nursery_name": str,
+            "Address": str,
+            "Contact_name": str,
+            "Contact_phone": str,
+            "Google_map_link": str,
+            "Additional_notes": str,
+        },
+        "key": ["Registration_code"],
+    },
+    "Trees": {
+        "columns": {
+            "Common_name": str,
+            "Scientific_name": str,
+            "Growth_rate": float,
+            "Watering_demand": str,
+            "shape": str,
+            "Care_instructions": str,
+            "Main_Photo_url": str,
+            "Origin": str,
+            "Soil_type": str,
+            "Root_type": str,
+            "Leaf_Type": str,
+        },
+        "key": ["Common_name"],
+    },
+    "Nursery_Tree_Inventory": {
+        "columns": {
+            "nursery_name": str,
+            "tree_common_name": str,
+            "Quantity_in_stock": int,
+            "Min_height": float,
+            "Max_height": float,
+            "Packaging_type": str,
+            "Price": float,
+        },
+        "key": ["nursery_name", "tree_common_name", "Packaging_type"],
+    },
+}
+
+CHUNK_ROWS = 5000
+
+# Rejected rows kept in a report; the count is always exact.
+MAX_REPORTED_REJECTS = 100
+
+
+def _normalize(name):
+    """
+    Normalizes a header for matching: 'Leaf Type ' -> 'leaf_type'.
+    """
+    return re.sub(r"[\s\-]+", "_", name.strip()).lower()
+
+
+def map_columns(table, header):
+    """
+    Maps CSV header names onto the columns of 'table', ignoring case,
+    spaces and hyphens. Returns (mapping {csv name: column}, ignored names).
+    Raises ValueError if a natural-key column is missing.
+    """
+    spec = IMPORT_TABLES[table]
+    by_normalized = {_normalize(column): column for column in spec["columns"]}
+    mapping = {}
+    ignored = []
+    for name in header:
+        column = by_normalized.get(_normalize(name or ""))
+        if column and column not in mapping.values():
+            mapping[name] = column
+        else:
+            ignored.append(name)
+    missing = [column for column in spec["key"] if column not in mapping.values()]
+    if missing:
+        raise ValueError(f"CSV for {table} is missing column(s): {', '.join(missing)}")
+    return mapping, ignored
+
+
+def _convert(value, kind):
+    """
+    Converts one CSV cell; empty cells become NULL.
+    """
+    value = value.strip() if value is not None else ""
+    if value == "":
+        return None
+    if kind is int:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{value!r} is not a whole number")
+        return int(number)
+    if kind is float:
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(f"{value!r} is not a finite number")
+        return number
+    return kind(value)
+
+
+def validate_row(table, row, mapping):
+    """
+    Returns the row as {column: value} with typed values.
+    Raises ValueError describing the first problem found.
+    """
+    spec = IMPORT_TABLES[table]
+    record = {}
+    for name, column in mapping.items():
+        try:
+            record[column] = _convert(row.get(name), spec["columns"][column])
+        except ValueError:
+            raise ValueError(f"{column}: {row.get(name)!r} is not a valid {spec['columns'][column].__name__}")
+    for column in spec["key"]:
+        # Packaging_type may legitimately be empty; names may not.
+        if record.get(column) is None and column != "Packaging_type":
+            raise ValueError(f"{column} is empty")
+    for column, value in record.items():
+        if isinstance(value, (int, float)) and value < 0:
+            raise ValueError(f"{column} is negative")
+    return record
+
+
+def _upsert_chunk(conn, table, columns, records):
+    """
+    Updates the rows whose natural key already exists and inserts the
+    rest, with one executemany per statement. Returns (inserted, updated).
+    """
+    key = IMPORT_TABLES[table]["key"]
+    # Later rows win over earlier rows with the same key.
+    latest = {}
+    for record in records:
+        latest[tuple(record.get(column) for column in key)] = record
+    rows = [[record.get(column) for column in columns] for record in latest.values()]
+    keys = [list(k) for k in latest]
+
+    match = " AND ".join(f'"{column}" IS ?' for column in key)
+    values = [column for column in columns if column not in key]
+    updated = 0
+    if values:
+        assignments = ", ".join(f'"{column}" = ?' for column in values)
+        updated = conn.executemany(
+            f"UPDATE {table} SET {assignments} WHERE {match}",
+            [[record.get(column) for column in values] + k for record, k in zip(latest.values(), keys)],
+        ).rowcount
+
+    names = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    inserted = conn.executemany(
+        f"INSERT INTO {table} ({names}) SELECT {placeholders} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})",
+        [row + k for row, k in zip(rows, keys)],
+    ).rowcount
+    return inserted, updated
+
+
+# Column naming the nursery a row belongs to, so its shard (see
+# shards.nursery_database). Tables without one, the Trees catalog, are
+# copied to every shard.
+ROUTE_COLUMNS = {"Nurseries": "Nursery_name", "Nursery_Tree_Inventory": "nursery_name"}
+
+
+def _route(table, records, paths):
+    """
+    Groups a chunk's records by the database file each is written to.
+    Returns {path: records}.
+    """
+    column = ROUTE_COLUMNS.get(table)
+    if not records:
+        return {}
+    if column is None:
+        return {path: records for path in paths}
+    if len(paths) == 1:
+        return {paths[0]: records}
+    groups = {}
+    for record in records:
+        groups.setdefault(shards.nursery_database(record.get(column)), []).append(record)
+    return groups
+
+
+# --------------------------------
+# Streaming import
+# --------------------------------
+def import_csv(table, file, chunk_rows=CHUNK_ROWS, on_chunk=None, databases=None, digest=None):
+    """
+    Streams a CSV file (text or binary file object, e.g. a Streamlit
+    upload) into 'table' in chunks of 'chunk_rows', upserting on the
+    table's natural key. Each chunk is committed on its own, so orders
+    wait for one chunk at most, never for the whole file. Invalid rows
+    are skipped and reported; the Search table follows through its
+    triggers. 'on_chunk(rows_read)' is called after every chunk.
+
+    With shards, nursery and inventory rows go to their nursery's shard
+    and Trees rows to every shard ('databases', default
+    shards.databases()); each chunk commits on all of them together
+    (shards.transaction_all). Inserted and updated Trees rows are
+    counted once.
+
+    With 'digest' (the upload's content_hash), every chunk also records
+    its progress in the upload's Import_Ledger entry, and an import
+    that stopped part way resumes after the rows committed before.
+    Rejects of those rows are counted but no longer listed.
+
+    Returns a report dict: rows_read, inserted, updated, rejected,
+    rejects [(line, reason)], ignored_columns, resumed (rows committed
+    earlier), seconds, rows_per_second.
+    """
+    if table not in IMPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    wrapped = not isinstance(file, io.TextIOBase)
+    if wrapped:
+        file = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+    start = time.perf_counter()
+    reader = csv.DictReader(file)
+    mapping, ignored = map_columns(table, reader.fieldnames or [])
+    columns = list(mapping.values())
+    paths = list(databases or shards.databases())
+    route = ROUTE_COLUMNS.get(table)
+    if len(paths) > 1 and route is not None and route not in columns:
+        raise ValueError(f"CSV for {table} is missing column {route}, which picks each row's shard")
+    report = {
+        "table": table,
+        "rows_read": 0,
+        "inserted": 0,
+        "updated": 0,
+        "rejected": 0,
+        "rejects": [],
+        "ignored_columns": ignored,
+        "resumed": 0,
+    }
+
+    if digest is not None:
+        progress = _ledger_progress(paths, table, digest)
+        if progress is not None:
+            # Every shard committed at least this far (a chunk's commit
+            # can fail between shards); upserting a chunk again is safe.
+            report["resumed"], report["inserted"], report["updated"], report["rejected"] = progress
+            if route is None and len(paths) > 1:
+                # Trees rows a shard committed alone keep their tree_id
+                shards.sync_trees(paths)
+            report["rows_read"] = report["resumed"]
+            for _ in itertools.islice(reader, report["resumed"]):
+                pass
+
+    while True:
+        chunk = list(itertools.islice(reader, chunk_rows))
+        if not chunk:
+            break
+        records = []
+        for row in chunk:
+            report["rows_read"] += 1
+            try:
+                records.append(validate_row(table, row, mapping))
+            except ValueError as exc:
+                report["rejected"] += 1
+                if len(report["rejects"]) < MAX_REPORTED_REJECTS:
+                    # Line in the file, counting the header as line 1
+                    report["rejects"].append((report["rows_read"] + 1, str(exc)))
+        with shards.transaction_all(paths) as conns:
+            for path, group in _route(table, records, paths).items():
+                inserted, updated = _upsert_chunk(conns[path], table, columns, group)
+                if route is not None or path == paths[0]:
+                    report["inserted"] += inserted
+                    report["updated"] += updated
+            if digest is not None:
+                for conn in conns.values():
+                    conn.execute(
+                        """
+                        UPDATE Import_Ledger
+                        SET rows_committed = ?, rows_read = ?, inserted = ?, updated = ?, rejected = ?
+                        WHERE table_name = ? AND content_hash = ?
+                        """,
+                        (report["rows_read"], report["rows_read"], report["inserted"], report["updated"],
+                         report["rejected"], table, digest),
+                    )
+        if on_chunk:
+            on_chunk(report["rows_read"])
+
+    if wrapped:
+        file.detach()  # leave the caller's file open
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_second"] = report["rows_read"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+# --------------------------------
+# Background import jobs
+# --------------------------------
+class ImportJob:
+    """
+    One upload being imported in the background. The admin page polls
+    'progress' (0.0 to 1.0) and 'done' on each rerun.
+    """
+
+    def __init__(self, table, file_name, content_hash, total_rows, databases):
+        self.table = table
+        self.file_name = file_name
+        self.content_hash = content_hash
+        self.total_rows = max(1, total_rows)
+        self.rows_read = 0
+        self.done = False
+        self.skipped = False  # already imported earlier, per the ledger
+        self.report = None
+        self.error = None
+        self.databases = databases  # every shard, see shards.databases()
+
+    @property
+    def progress(self):
+        return 1.0 if self.done else min(0.99, self.rows_read / self.total_rows)
+
+
+# A single worker: imports run one at a time, off the Streamlit thread.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-import")
+
+# Jobs of this process by (database files, table, content hash).
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def content_hash(data):
+    """
+    Returns the SHA-256 hex digest identifying an upload.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ledger_entry(table, digest):
+    """
+    Returns (status, rows_read, inserted, updated, rejected, finished_at)
+    for an upload from this thread's database's Import_Ledger, or None.
+    """
+    return db.get_connection().execute(
+        """
+        SELECT status, rows_read, inserted, updated, rejected, finished_at
+        FROM Import_Ledger WHERE table_name = ? AND content_hash = ?
+        """,
+        (table, digest),
+    ).fetchone()
+
+
+def _ledger_progress(paths, table, digest):
+    """
+    Returns (rows_committed, inserted, updated, rejected) of an upload's
+    Import_Ledger entries in 'paths': the fewest rows committed in any
+    of them, with the first one's counts. None if nothing was committed
+    or an entry is missing.
+    """
+    entries = []
+    for path in paths:
+        with db.using(path):
+            entries.append(db.get_connection().execute(
+                """
+                SELECT rows_committed, inserted, updated, rejected
+                FROM Import_Ledger WHERE table_name = ? AND content_hash = ?
+                """,
+                (table, digest),
+            ).fetchone())
+    if any(entry is None for entry in entries):
+        return None
+    committed = min(entry[0] for entry in entries)
+    if not committed:
+        return None
+    return (committed,) + tuple(count or 0 for count in entries[0][1:])
+
+
+def _start_ledger(paths, table, digest, file_name):
+    """
+    Marks an upload as running in the Import_Ledger of every database
+    of 'paths', keeping the progress of an earlier attempt.
+    """
+    with shards.transaction_all(paths) as conns:
+        for conn in conns.values():
+            conn.execute(
+                """
+                INSERT INTO Import_Ledger (table_name, content_hash, file_name, status, started_at)
+                VALUES (?, ?, ?, 'running', datetime('now'))
+                ON CONFLICT (table_name, content_hash) DO UPDATE SET
+                    file_name = excluded.file_name, status = 'running', started_at = excluded.started_at,
+                    finished_at = NULL
+                """,
+                (table, digest, file_name),
+            )
+
+
+def _run_job(job, data):
+    """
+    Worker body: imports the upload into the databases it was submitted
+    for and records the outcome in the ledger of each.
+    """
+    def on_chunk(rows_read):
+        job.rows_read = rows_read
+
+    try:
+        try:
+            job.report = import_csv(job.table, io.BytesIO(data), on_chunk=on_chunk, databases=job.databases,
+                                    digest=job.content_hash)
+            status = "done"
+        except Exception as exc:  # reported on the admin page
+            job.error = str(exc)
+            status = "failed"
+        report = job.report or {}
+        with shards.transaction_all(job.databases) as conns:
+            for conn in conns.values():
+                conn.execute(
+                    """
+                    UPDATE Import_Ledger
+                    SET status = ?, rows_read = ?, inserted = ?, updated = ?, rejected = ?,
+                        finished_at = datetime('now')
+                    WHERE table_name = ? AND content_hash = ?
+                    """,
+                    (status, report.get("rows_read"), report.get("inserted"), report.get("updated"),
+                     report.get("rejected"), job.table, job.content_hash),
+                )
+    except Exception as exc:  # the ledger could not be updated
+        job.error = job.error or f"recording the import failed: {exc}"
+    finally:
+        job.done = True
+
+
+def submit_import(table, file_name, data):
+    """
+    Starts importing an upload (bytes) into 'table' in the background,
+    unless the same contents were already imported into that table.
+    Safe to call on every rerun: returns the existing job for an upload
+    that is running or was imported in this process. A failed job is
+    forgotten once reported, so uploading the file again retries it.
+
+    With shards, every shard's Import_Ledger records the upload, and it
+    counts as imported only if all of them say so.
+    """
+    digest = content_hash(data)
+    paths = tuple(shards.databases())
+    key = (paths, table, digest)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None:
+            if job.done and job.error:
+                # Reported now; the next submit of the file retries it.
+                del _jobs[key]
+            return job
+
+        job = ImportJob(table, file_name, digest, data.count(b"\n") - 1, paths)
+        entries = []
+        for path in paths:
+            with db.using(path):
+                entries.append(_ledger_entry(table, digest))
+        entry = entries[0]
+        if all(found is not None and found[0] == "done" for found in entries):
+            # Imported earlier, possibly by another process. A 'running'
+            # or 'failed' entry is resumed after its committed rows.
+            job.skipped = True
+            job.done = True
+            job.report = dict(zip(("status", "rows_read", "inserted", "updated", "rejected", "finished_at"), entry))
+        else:
+            _start_ledger(paths, table, digest, file_name)
+            _executor.submit(_run_job, job, data)
+        _jobs[key] = job
+        return job
@@ -0,0 +1,51 @@
+import streamlit as st
+
+# Choices offered by the "Rows per page" controls.
+PAGE_SIZES = [10, 20, 50, 100, 250]
+
+
+# --------------------------------
+# Keyset pager
+# --------------------------------
+# A listing shows one page at a time and only fetches that page. The
+# pager keeps, in the session, the cursors of the pages before the one
+# shown: "Next" pushes the shown page's 'next' cursor, "Previous" pops.
+def page_size_select(key, default):
+    """
+    Draws a "Rows per page" dropdown and returns the chosen size.
+    """
+    sizes = sorted(set(PAGE_SIZES) | {default})
+    return st.selectbox("Rows per page", sizes, index=sizes.index(default), key=key + "_size")
+
+
+def current_cursor(key, reset_on):
+    """
+    Returns the cursor of the page to fetch for pager 'key' (None for
+    the first page). The pager starts over whenever 'reset_on' (e.g.
+    the filters and page size) differs from the previous rerun.
+    """
+    state = st.session_state.setdefault(key, {"cursors": [], "reset_on": reset_on})
+    if state["reset_on"] != reset_on:
+        state["cursors"] = []
+        state["reset_on"] = reset_on
+    return state["cursors"][-1] if state["cursors"] else None
+
+
+def pager(key, next_cursor, shown, total, page_size):
+    """
+    Draws the position ("Showing 51-100 of 1234") and the Previous /
+    Next buttons of pager 'key' below a page of 'shown' rows.
+    """
+    cursors = st.session_state[key]["cursors"]
+    first = len(cursors) * page_size + 1
+    if shown:
+        st.write(f"Showing {first}-{first + shown - 1} of {total}")
+    else:
+        st.write(f"Showing 0 of {total}")
+    previous_column, next_column = st.columns(2)
+    if previous_column.button("Previous", key=key + "_previous", disabled=not cursors):
+        cursors.pop()
+        st.rerun()
+    if next_column.button("Next", key=key + "_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
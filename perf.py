@@ -0,0 +1,355 @@
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("hasar.perf")
+
+# Set HASAR_PERF=0 to open plain, uninstrumented connections (each
+# recorded statement costs roughly 10-15 microseconds).
+ENABLED = os.environ.get("HASAR_PERF", "1") != "0"
+
+# Statements slower than this (milliseconds) are logged with their
+# EXPLAIN QUERY PLAN.
+SLOW_QUERY_MS = float(os.environ.get("HASAR_SLOW_QUERY_MS", "100"))
+
+# Recent durations kept per fingerprint / stage for percentiles.
+SAMPLES = 512
+
+# Individual slowest statements kept for the Performance page.
+SLOWEST = 20
+
+# A query's caller is named by the first frame outside this module,
+# followed by the first frame outside the data layer (the page code).
+_DATA_LAYER = {"db", "schema", "importer"}
+
+
+# --------------------------------
+# Statistics store
+# --------------------------------
+class _Stats:
+    """
+    Running statistics of one query fingerprint or one timed stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES)
+        self.callers = Counter()
+
+    def add(self, seconds, caller=None):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        if caller:
+            self.callers[caller] += 1
+
+    def percentile(self, fraction):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+            "callers": dict(self.callers.most_common(5)),
+        }
+
+
+_lock = threading.Lock()
+_queries = {}  # fingerprint -> _Stats
+_stages = {}  # stage name -> _Stats
+_slowest = []  # [(ms, fingerprint, sql, rows, caller, unix time)]
+
+
+def reset():
+    """
+    Forgets everything recorded so far.
+    """
+    with _lock:
+        _queries.clear()
+        _stages.clear()
+        del _slowest[:]
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """
+    Normalizes a statement so that executions differing only in literal
+    values or whitespace share statistics.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _caller():
+    """
+    Returns who issued the current statement, e.g.
+    'db.search_tree <- app:<module>:152'.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    if _module(frame) not in _DATA_LAYER:
+        return f"{_module(frame)}:{frame.f_code.co_name}:{frame.f_lineno}"
+    name = f"{_module(frame)}.{frame.f_code.co_name}"
+    while frame is not None and _module(frame) in _DATA_LAYER:
+        frame = frame.f_back
+    if frame is None:
+        return name
+    return f"{name} <- {_module(frame)}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+def _module(frame):
+    return os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+
+
+def _record_query(sql, seconds, rows, caller):
+    """
+    Adds one execution to its fingerprint.
+    """
+    key = fingerprint(sql)
+    with _lock:
+        stats = _queries.get(key)
+        if stats is None:
+            stats = _queries[key] = _Stats()
+        stats.add(seconds, caller)
+        stats.rows += rows
+        ms = seconds * 1000
+        if len(_slowest) < SLOWEST or ms > _slowest[-1][0]:
+            _slowest.append((ms, key, sql.strip(), rows, caller, time.time()))
+            _slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del _slowest[SLOWEST:]
+
+
+def record_stage(name, seconds):
+    """
+    Adds one timing of a named stage, e.g. a whole Streamlit rerun.
+    """
+    with _lock:
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = _Stats()
+        stats.add(seconds)
+
+
+@contextmanager
+def timed(name):
+    """
+    Times the body of a 'with' block as stage 'name'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+# --------------------------------
+# Instrumented connection
+# --------------------------------
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that records the duration, fingerprint, caller and row count
+    of every statement it runs. A statement returning rows is timed
+    until its rows are exhausted (execute plus every fetch), or until
+    the cursor runs the next statement, is closed or is dropped, so
+    rows streamed out of a slow SELECT are counted too.
+    """
+
+    _pending = None  # [sql, parameters, caller, seconds, rows] of the open statement
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        caller = _caller()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, caller, time.perf_counter() - start, 0]
+        if self.description is None:
+            self._pending[4] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        caller = _caller()
+        first = []
+
+        def remember(rows):
+            # The first parameters, for the query plan of a slow call.
+            for row in rows:
+                if not first:
+                    first.append(row)
+                yield row
+
+        start = time.perf_counter()
+        super().executemany(sql, remember(seq_of_parameters))
+        self._pending = [sql, first[0] if first else (), caller, time.perf_counter() - start, max(self.rowcount, 0)]
+        self._finish()
+        return self
+
+    def _fetched(self, start, rows, exhausted):
+        pending = self._pending
+        if pending is not None:
+            pending[3] += time.perf_counter() - start
+            pending[4] += rows
+            if exhausted:
+                self._finish()
+
+    def _finish(self):
+        """
+        Records the open statement, if any.
+        """
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, parameters, caller, seconds, rows = pending
+        _record_query(sql, seconds, rows, caller)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            _log_slow(self.connection, sql, parameters, seconds)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:  # the connection may be gone already
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors are InstrumentedCursors. Pass as
+    sqlite3.connect(..., factory=InstrumentedConnection).
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _log_slow(conn, sql, parameters, seconds):
+    """
+    Logs a slow statement together with its query plan.
+    """
+    try:
+        plan = sqlite3.Cursor.execute(
+            sqlite3.Connection.cursor(conn), "EXPLAIN QUERY PLAN " + sql, parameters
+        ).fetchall()
+        plan = "\n".join("  " + row[3] for row in plan)
+    except sqlite3.Error as exc:
+        plan = f"  (no plan: {exc})"
+    logger.warning("slow query (%.1f ms): %s\n%s", seconds * 1000, fingerprint(sql), plan)
+
+
+# --------------------------------
+# Reports and exports
+# --------------------------------
+def snapshot():
+    """
+    Returns everything recorded as plain data: per-fingerprint and
+    per-stage summaries and the slowest individual statements.
+    """
+    with _lock:
+        return {
+            "queries": {key: stats.summary() for key, stats in _queries.items()},
+            "stages": {key: stats.summary() for key, stats in _stages.items()},
+            "slowest": [
+                {"ms": ms, "fingerprint": key, "sql": sql, "rows": rows, "caller": caller, "at": at}
+                for ms, key, sql, rows, caller, at in _slowest
+            ],
+            "slow_query_ms": SLOW_QUERY_MS,
+        }
+
+
+def to_json():
+    """
+    Returns snapshot() as a JSON document.
+    """
+    return json.dumps(snapshot(), indent=2)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def to_prometheus():
+    """
+    Returns the statistics in the Prometheus text exposition format,
+    as summaries of durations in seconds.
+    """
+    data = snapshot()
+    lines = []
+    for metric, label, entries in (
+        ("hasar_query_duration_seconds", "fingerprint", data["queries"]),
+        ("hasar_stage_duration_seconds", "stage", data["stages"]),
+    ):
+        lines.append(f"# TYPE {metric} summary")
+        for key, summary in entries.items():
+            name = f'{label}="{_label(key)}"'
+            lines.append(f'{metric}{{{name},quantile="0.5"}} {summary["p50_ms"] / 1000:.6f}')
+            lines.append(f'{metric}{{{name},quantile="0.95"}} {summary["p95_ms"] / 1000:.6f}')
+            lines.append(f"{metric}_sum{{{name}}} {summary['total_ms'] / 1000:.6f}")
+            lines.append(f"{metric}_count{{{name}}} {summary['count']}")
+    lines.append("# TYPE hasar_query_rows_total counter")
+    for key, summary in data["queries"].items():
+        lines.append(f'hasar_query_rows_total{{fingerprint="{_label(key)}"}} {summary["rows"]}')
+    return "\n".join(lines) + "\n"
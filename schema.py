@@ -0,0 +1,1246 @@
+# --------------------------------
+# Catalog tables
+# --------------------------------
+BASE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Nurseries (
+        nursery_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Registration_code TEXT,
+        Nursery_name TEXT,
+        Address TEXT,
+        Contact_name TEXT,
+        Contact_phone TEXT,
+        Google_map_link TEXT,
+        Additional_notes TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Trees (
+        tree_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Common_name TEXT,
+        Scientific_name TEXT,
+        Growth_rate REAL,  -- Unit: Cm/yr
+        Watering_demand TEXT,  -- Dropdown
+        shape TEXT,  -- Dropdown
+        Care_instructions TEXT,  -- Dropdown
+        Main_Photo_url TEXT,  -- URL
+        Origin TEXT,  -- Name of region
+        Soil_type TEXT,  -- Dropdown
+        Root_type TEXT,  -- Dropdown
+        Leaf_Type TEXT  -- Dropdown: ovate, lanceolate, linear, Deciduous, Evergreen
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Nursery_Tree_Inventory (
+        tree_inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nursery_name TEXT,  -- Foreign key: Nurseries.Nursery_name
+        tree_common_name TEXT,  -- Foreign key: Trees.Common_name
+        Quantity_in_stock INTEGER,
+        Min_height REAL,
+        Max_height REAL,
+        Packaging_type TEXT,  -- Dropdown (e.g., "potted", "bare-root", etc.)
+        Price REAL  -- IQD
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Search (
+        tree_common_name TEXT,
+        Quantity_in_stock INTEGER,
+        Min_height REAL,
+        Max_height REAL,
+        Packaging_type TEXT,
+        Price REAL,
+        Scientific_name TEXT,
+        Growth_rate REAL,
+        Watering_demand TEXT,
+        shape TEXT,
+        Care_instructions TEXT,
+        Main_Photo_url TEXT,
+        Origin TEXT,
+        Soil_type TEXT,
+        Root_type TEXT,
+        Leaf_Type TEXT,
+        Address TEXT
+    )
+    """,
+]
+
+# --------------------------------
+# Search table definition
+# --------------------------------
+# Columns of the denormalized 'Search' table, in table order.
+# 'tree_inventory_id' is the primary key: every Search row belongs to
+# the Nursery_Tree_Inventory row it was built from, so single rows
+# are replaced in place when the underlying data changes. 'tree_id'
+# and 'nursery_id' say which Trees and Nurseries rows it was built
+# from.
+SEARCH_COLUMNS = [
+    "tree_common_name",
+    "Quantity_in_stock",
+    "Min_height",
+    "Max_height",
+    "Packaging_type",
+    "Price",
+    "Scientific_name",
+    "Growth_rate",
+    "Watering_demand",
+    "shape",
+    "Care_instructions",
+    "Main_Photo_url",
+    "Origin",
+    "Soil_type",
+    "Root_type",
+    "Leaf_Type",
+    "Address",
+    "tree_inventory_id",
+    "tree_id",
+    "nursery_id",
+]
+
+# Key columns of Search, not shown to users.
+SEARCH_KEY_COLUMNS = ["tree_inventory_id", "tree_id", "nursery_id"]
+
+SEARCH_TABLE = """
+    CREATE TABLE IF NOT EXISTS Search (
+        tree_common_name TEXT,
+        Quantity_in_stock INTEGER,
+        Min_height REAL,
+        Max_height REAL,
+        Packaging_type TEXT,
+        Price REAL,
+        Scientific_name TEXT,
+        Growth_rate REAL,
+        Watering_demand TEXT,
+        shape TEXT,
+        Care_instructions TEXT,
+        Main_Photo_url TEXT,
+        Origin TEXT,
+        Soil_type TEXT,
+        Root_type TEXT,
+        Leaf_Type TEXT,
+        Address TEXT,
+        tree_inventory_id INTEGER PRIMARY KEY,  -- Nursery_Tree_Inventory row
+        tree_id INTEGER,  -- Trees row
+        nursery_id INTEGER  -- Nurseries row
+    )
+"""
+
+# Inventory rows name their tree and nursery; the integer keys
+# Nursery_Tree_Inventory.tree_id / nursery_id are derived from those
+# names by the triggers below. If a name appears more than once the
+# oldest row wins, so a join never multiplies inventory rows. A name
+# that matches nothing leaves the key NULL (see verify_search_table).
+TREE_ID_FOR = "(SELECT MIN(tree_id) FROM Trees WHERE Common_name = {})"
+NURSERY_ID_FOR = "(SELECT MIN(nursery_id) FROM Nurseries WHERE Nursery_name = {})"
+
+# One Search row per inventory row, joined through the integer keys.
+SEARCH_SELECT = """
+    SELECT
+        nti.tree_common_name,
+        nti.Quantity_in_stock,
+        nti.Min_height,
+        nti.Max_height,
+        nti.Packaging_type,
+        nti.Price,
+        t.Scientific_name,
+        t.Growth_rate,
+        t.Watering_demand,
+        t.shape,
+        t.Care_instructions,
+        t.Main_Photo_url,
+        t.Origin,
+        t.Soil_type,
+        t.Root_type,
+        t.Leaf_Type,
+        n.Address,
+        nti.tree_inventory_id,
+        nti.tree_id,
+        nti.nursery_id
+    FROM Nursery_Tree_Inventory nti
+    LEFT JOIN Trees t ON t.tree_id = nti.tree_id
+    LEFT JOIN Nurseries n ON n.nursery_id = nti.nursery_id
+"""
+
+# Re-derives the keys of the inventory rows matching a WHERE clause.
+LINK_INVENTORY = """
+    UPDATE Nursery_Tree_Inventory
+    SET tree_id = {},
+        nursery_id = {}
+    WHERE {{}}
+""".format(
+    TREE_ID_FOR.format("Nursery_Tree_Inventory.tree_common_name"),
+    NURSERY_ID_FOR.format("Nursery_Tree_Inventory.nursery_name"),
+)
+
+
+def _search_upsert(where):
+    """
+    Returns an upsert that (re)builds the Search rows of the inventory
+    rows matching 'where'. Existing rows are updated in place, so the
+    Search UPDATE triggers see the old and new values.
+    """
+    return "INSERT INTO Search ({}) {} WHERE {} ON CONFLICT(tree_inventory_id) DO UPDATE SET {};".format(
+        ", ".join(SEARCH_COLUMNS), SEARCH_SELECT, where,
+        ", ".join("{0} = excluded.{0}".format(column) for column in SEARCH_COLUMNS if column != "tree_inventory_id"),
+    )
+
+
+# --------------------------------
+# Triggers keeping keys and Search current
+# --------------------------------
+# Each write to one of the three source tables re-derives the keys of
+# the affected inventory rows and replaces only their Search rows. The
+# inventory triggers fire on every column except the derived keys, so
+# setting those never triggers a second rebuild. Since keys follow
+# names, the rows that lose their link to a renamed or deleted tree or
+# nursery are found through the old name.
+INVENTORY_COLUMNS = [
+    "tree_inventory_id", "nursery_name", "tree_common_name", "Quantity_in_stock",
+    "Min_height", "Max_height", "Packaging_type", "Price",
+]
+
+SEARCH_TRIGGERS = {
+    "search_inventory_insert": (
+        "AFTER INSERT ON Nursery_Tree_Inventory",
+        [
+            LINK_INVENTORY.format("tree_inventory_id = NEW.tree_inventory_id") + ";",
+            _search_upsert("nti.tree_inventory_id = NEW.tree_inventory_id"),
+        ],
+    ),
+    "search_inventory_update": (
+        "AFTER UPDATE OF {} ON Nursery_Tree_Inventory".format(", ".join(INVENTORY_COLUMNS)),
+        [
+            LINK_INVENTORY.format(
+                "tree_inventory_id = NEW.tree_inventory_id AND (NEW.tree_common_name IS NOT OLD.tree_common_name "
+                "OR NEW.nursery_name IS NOT OLD.nursery_name)"
+            ) + ";",
+            "DELETE FROM Search WHERE tree_inventory_id = OLD.tree_inventory_id "
+            "AND OLD.tree_inventory_id IS NOT NEW.tree_inventory_id;",
+            _search_upsert("nti.tree_inventory_id = NEW.tree_inventory_id"),
+        ],
+    ),
+    "search_inventory_delete": (
+        "AFTER DELETE ON Nursery_Tree_Inventory",
+        ["DELETE FROM Search WHERE tree_inventory_id = OLD.tree_inventory_id;"],
+    ),
+    "search_trees_insert": (
+        "AFTER INSERT ON Trees",
+        [
+            # Only an older tree of the same name keeps its inventory.
+            "UPDATE Nursery_Tree_Inventory SET tree_id = NEW.tree_id "
+            "WHERE tree_common_name = NEW.Common_name AND (tree_id IS NULL OR tree_id > NEW.tree_id);",
+            _search_upsert("nti.tree_id = NEW.tree_id"),
+        ],
+    ),
+    "search_trees_update": (
+        "AFTER UPDATE ON Trees",
+        [
+            LINK_INVENTORY.format(
+                "tree_common_name IN (OLD.Common_name, NEW.Common_name) "
+                "AND (OLD.Common_name IS NOT NEW.Common_name OR OLD.tree_id IS NOT NEW.tree_id)"
+            ) + ";",
+            _search_upsert("nti.tree_id = NEW.tree_id"),
+            # Rows that lost their link to this tree.
+            _search_upsert(
+                "nti.tree_common_name = OLD.Common_name "
+                "AND (OLD.Common_name IS NOT NEW.Common_name OR OLD.tree_id IS NOT NEW.tree_id)"
+            ),
+        ],
+    ),
+    "search_trees_delete": (
+        "AFTER DELETE ON Trees",
+        [
+            LINK_INVENTORY.format("tree_id = OLD.tree_id") + ";",
+            _search_upsert("nti.tree_common_name = OLD.Common_name"),
+        ],
+    ),
+    "search_nurseries_insert": (
+        "AFTER INSERT ON Nurseries",
+        [
+            "UPDATE Nursery_Tree_Inventory SET nursery_id = NEW.nursery_id "
+            "WHERE nursery_name = NEW.Nursery_name AND (nursery_id IS NULL OR nursery_id > NEW.nursery_id);",
+            _search_upsert("nti.nursery_id = NEW.nursery_id"),
+        ],
+    ),
+    "search_nurseries_update": (
+        "AFTER UPDATE ON Nurseries",
+        [
+            LINK_INVENTORY.format(
+                "nursery_name IN (OLD.Nursery_name, NEW.Nursery_name) "
+                "AND (OLD.Nursery_name IS NOT NEW.Nursery_name OR OLD.nursery_id IS NOT NEW.nursery_id)"
+            ) + ";",
+            _search_upsert("nti.nursery_id = NEW.nursery_id"),
+            _search_upsert(
+                "nti.nursery_name = OLD.Nursery_name "
+                "AND (OLD.Nursery_name IS NOT NEW.Nursery_name OR OLD.nursery_id IS NOT NEW.nursery_id)"
+            ),
+        ],
+    ),
+    "search_nurseries_delete": (
+        "AFTER DELETE ON Nurseries",
+        [
+            LINK_INVENTORY.format("nursery_id = OLD.nursery_id") + ";",
+            _search_upsert("nti.nursery_name = OLD.Nursery_name"),
+        ],
+    ),
+}
+
+# --------------------------------
+# Search as of schema version 1
+# --------------------------------
+# Matched to Trees and Nurseries by name, keyed by a unique index.
+# Migration 1 still builds exactly this; migration 3 replaces it.
+_V1_SEARCH_COLUMNS = SEARCH_COLUMNS[:18]
+
+_V1_SEARCH_SELECT = """
+    SELECT
+        nti.tree_common_name,
+        nti.Quantity_in_stock,
+        nti.Min_height,
+        nti.Max_height,
+        nti.Packaging_type,
+        nti.Price,
+        t.Scientific_name,
+        t.Growth_rate,
+        t.Watering_demand,
+        t.shape,
+        t.Care_instructions,
+        t.Main_Photo_url,
+        t.Origin,
+        t.Soil_type,
+        t.Root_type,
+        t.Leaf_Type,
+        n.Address,
+        nti.tree_inventory_id
+    FROM Nursery_Tree_Inventory nti
+    LEFT JOIN Trees t
+        ON t.tree_id = (SELECT MIN(tree_id) FROM Trees
+                        WHERE Common_name = nti.tree_common_name)
+    LEFT JOIN Nurseries n
+        ON n.nursery_id = (SELECT MIN(nursery_id) FROM Nurseries
+                           WHERE Nursery_name = nti.nursery_name)
+"""
+
+
+def _v1_search_insert(where):
+    return "INSERT INTO Search ({}) {} WHERE {};".format(
+        ", ".join(_V1_SEARCH_COLUMNS), _V1_SEARCH_SELECT, where
+    )
+
+
+def _v1_search_delete(where):
+    return (
+        "DELETE FROM Search WHERE tree_inventory_id IN "
+        "(SELECT tree_inventory_id FROM Nursery_Tree_Inventory nti WHERE {});"
+    ).format(where)
+
+
+_V1_SEARCH_TRIGGERS = {
+    "search_inventory_insert": (
+        "AFTER INSERT ON Nursery_Tree_Inventory",
+        [_v1_search_insert("nti.tree_inventory_id = NEW.tree_inventory_id")],
+    ),
+    "search_inventory_update": (
+        "AFTER UPDATE ON Nursery_Tree_Inventory",
+        [
+            "DELETE FROM Search WHERE tree_inventory_id = OLD.tree_inventory_id;",
+            _v1_search_insert("nti.tree_inventory_id = NEW.tree_inventory_id"),
+        ],
+    ),
+    "search_inventory_delete": (
+        "AFTER DELETE ON Nursery_Tree_Inventory",
+        ["DELETE FROM Search WHERE tree_inventory_id = OLD.tree_inventory_id;"],
+    ),
+    "search_trees_insert": (
+        "AFTER INSERT ON Trees",
+        [
+            _v1_search_delete("nti.tree_common_name = NEW.Common_name"),
+            _v1_search_insert("nti.tree_common_name = NEW.Common_name"),
+        ],
+    ),
+    "search_trees_update": (
+        "AFTER UPDATE ON Trees",
+        [
+            _v1_search_delete("nti.tree_common_name IN (OLD.Common_name, NEW.Common_name)"),
+            _v1_search_insert("nti.tree_common_name IN (OLD.Common_name, NEW.Common_name)"),
+        ],
+    ),
+    "search_trees_delete": (
+        "AFTER DELETE ON Trees",
+        [
+            _v1_search_delete("nti.tree_common_name = OLD.Common_name"),
+            _v1_search_insert("nti.tree_common_name = OLD.Common_name"),
+        ],
+    ),
+    "search_nurseries_insert": (
+        "AFTER INSERT ON Nurseries",
+        [
+            _v1_search_delete("nti.nursery_name = NEW.Nursery_name"),
+            _v1_search_insert("nti.nursery_name = NEW.Nursery_name"),
+        ],
+    ),
+    "search_nurseries_update": (
+        "AFTER UPDATE ON Nurseries",
+        [
+            _v1_search_delete("nti.nursery_name IN (OLD.Nursery_name, NEW.Nursery_name)"),
+            _v1_search_insert("nti.nursery_name IN (OLD.Nursery_name, NEW.Nursery_name)"),
+        ],
+    ),
+    "search_nurseries_delete": (
+        "AFTER DELETE ON Nurseries",
+        [
+            _v1_search_delete("nti.nursery_name = OLD.Nursery_name"),
+            _v1_search_insert("nti.nursery_name = OLD.Nursery_name"),
+        ],
+    ),
+}
+
+# --------------------------------
+# Order tables and indexes
+# --------------------------------
+# Tables the storefront (app.py) writes orders to.
+ORDER_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Customers (
+        customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Quantity INTEGER,
+        Username TEXT,
+        Customer_full_Name TEXT,
+        Address TEXT,
+        "Whatsapp Number" TEXT,
+        Email TEXT,
+        price REAL,  -- IQD
+        "Payment Preferences" TEXT,
+        tree_inventory_id INTEGER  -- Nursery_Tree_Inventory row ordered
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS status (
+        status_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Username TEXT,
+        Email TEXT,
+        Status TEXT,
+        Note TEXT
+    )
+    """,
+]
+
+# One row per CSV import, keyed by a hash of the file's contents, so the
+# same upload is never imported twice. Version 7 adds rows_committed,
+# the rows of the file committed so far (an import resumes after them).
+IMPORT_LEDGER = """
+    CREATE TABLE IF NOT EXISTS Import_Ledger (
+        table_name TEXT,
+        content_hash TEXT,  -- SHA-256 of the uploaded bytes
+        file_name TEXT,
+        status TEXT,  -- running, done or failed
+        rows_read INTEGER,
+        inserted INTEGER,
+        updated INTEGER,
+        rejected INTEGER,
+        started_at TEXT,
+        finished_at TEXT,
+        PRIMARY KEY (table_name, content_hash)
+    )
+"""
+
+# Indexes on every join and filter column of the hot queries.
+INDEXES = {
+    "idx_inventory_tree": "Nursery_Tree_Inventory(tree_common_name)",
+    "idx_inventory_nursery": "Nursery_Tree_Inventory(nursery_name)",
+    "idx_trees_common_name": "Trees(Common_name)",
+    "idx_nurseries_name": "Nurseries(Nursery_name)",
+    "idx_nurseries_registration": "Nurseries(Registration_code)",
+    "idx_inventory_key": "Nursery_Tree_Inventory(nursery_name, tree_common_name, Packaging_type)",
+    "idx_status_email": "status(Email)",
+    "idx_search_tree": "Search(tree_common_name)",
+    "idx_search_packaging": "Search(Packaging_type)",
+    "idx_search_shape": "Search(shape)",
+}
+
+# Indexes on the integer keys (schema version 3). They cover the
+# storefront join (tree, then price order) and the trigger lookups.
+KEY_INDEXES = {
+    "idx_inventory_tree_id": "Nursery_Tree_Inventory(tree_id, Price)",
+    "idx_inventory_nursery_id": "Nursery_Tree_Inventory(nursery_id)",
+}
+
+# Dropped by schema version 3: idx_inventory_key starts with the same
+# column, so this one only slowed down writes.
+REDUNDANT_INDEXES = ["idx_inventory_nursery"]
+
+# --------------------------------
+# Full-text search over Trees
+# --------------------------------
+# Both indexes are external-content FTS5 tables: they store only the
+# index and read the text back from Trees. 'Trees_fts' serves word and
+# prefix queries; 'Trees_trigram' is the fallback for misspelled names.
+FTS_TABLES = {
+    "Trees_fts": (
+        ["Common_name", "Scientific_name", "Care_instructions", "Origin"],
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    ),
+    "Trees_trigram": (
+        ["Common_name", "Scientific_name"],
+        "tokenize='trigram'",
+    ),
+}
+
+
+def _fts_triggers(table, columns):
+    """
+    Returns the triggers that mirror writes on Trees into the
+    external-content FTS5 table 'table'.
+    """
+    names = ", ".join(columns)
+    new = ", ".join("NEW." + column for column in columns)
+    old = ", ".join("OLD." + column for column in columns)
+    add = "INSERT INTO {0} (rowid, {1}) VALUES (NEW.tree_id, {2});".format(table, names, new)
+    remove = "INSERT INTO {0} ({0}, rowid, {1}) VALUES ('delete', OLD.tree_id, {2});".format(
+        table, names, old
+    )
+    return {
+        table.lower() + "_insert": ("AFTER INSERT ON Trees", [add]),
+        table.lower() + "_update": ("AFTER UPDATE ON Trees", [remove, add]),
+        table.lower() + "_delete": ("AFTER DELETE ON Trees", [remove]),
+    }
+
+
+# --------------------------------
+# Table versions
+# --------------------------------
+# Every write to these tables bumps its counter in Table_Versions, so
+# readers can cache results until the data they depend on changes.
+VERSIONED_TABLES = [
+    "Nurseries",
+    "Trees",
+    "Nursery_Tree_Inventory",
+    "Search",
+    "Customers",
+    "status",
+]
+
+TABLE_VERSIONS = """
+    CREATE TABLE IF NOT EXISTS Table_Versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+VERSION_BUMP = (
+    "INSERT INTO Table_Versions (table_name, version) VALUES ('{0}', 1) "
+    "ON CONFLICT(table_name) DO UPDATE SET version = version + 1;"
+)
+
+# Since schema version 2 the bump also records when the table last
+# changed (unix seconds), for HTTP Last-Modified headers.
+STAMPED_VERSION_BUMP = (
+    "INSERT INTO Table_Versions (table_name, version, updated_at) "
+    "VALUES ('{0}', 1, CAST(strftime('%s', 'now') AS INTEGER)) "
+    "ON CONFLICT(table_name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;"
+)
+
+
+def _version_triggers(table, bump=VERSION_BUMP):
+    """
+    Returns the triggers bumping the version of 'table' on any write.
+    """
+    bump = bump.format(table)
+    return {
+        "version_{}_{}".format(table.lower(), event.lower()): ("AFTER {} ON {}".format(event, table), [bump])
+        for event in ("INSERT", "UPDATE", "DELETE")
+    }
+
+
+def _create_triggers(conn, triggers):
+    """
+    Creates each trigger of a {name: (event, statements)} mapping
+    unless it already exists.
+    """
+    for name, (event, statements) in triggers.items():
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS {} {} FOR EACH ROW BEGIN\n{}\nEND".format(
+                name, event, "\n".join(statements)
+            )
+        )
+
+
+# --------------------------------
+# Facet counts
+# --------------------------------
+# Number of Search rows per value of each facet column, and per bucket
+# of each histogram, kept current by triggers on Search so that the
+# unfiltered counts are an index read instead of a scan. Values whose
+# count dropped to 0 stay until the next rebuild.
+FACET_COLUMNS = [
+    "tree_common_name",
+    "Packaging_type",
+    "shape",
+    "Leaf_Type",
+    "Soil_type",
+    "Watering_demand",
+    "Origin",
+]
+
+# Histogram name: (Search column, bucket width). A bucket is named by
+# its lower bound.
+HISTOGRAMS = {
+    "height": ("Min_height", 50),
+    "price": ("Price", 25000),
+    "growth_rate": ("Growth_rate", 10),
+}
+
+# The histograms of schema version 4, which migration 4 still counts.
+_V4_HISTOGRAMS = {
+    "height": ("Min_height", 50),
+    "price": ("Price", 25000),
+}
+
+FACET_COUNTS = """
+    CREATE TABLE IF NOT EXISTS Facet_Counts (
+        facet TEXT NOT NULL,  -- Search column or 'histogram:<name>'
+        value NOT NULL,  -- column value or bucket lower bound
+        count INTEGER NOT NULL,
+        PRIMARY KEY (facet, value)
+    ) WITHOUT ROWID
+"""
+
+
+def bucket(column, width):
+    """
+    Returns the SQL expression for the histogram bucket of 'column'.
+    """
+    return "CAST({0} / {1} AS INTEGER) * {1}".format(column, width)
+
+
+def _facet_expressions(row, histograms=HISTOGRAMS):
+    """
+    Returns [(facet name, value expression)] for a row alias (NEW, OLD
+    or a table name).
+    """
+    expressions = [(column, "{}.{}".format(row, column)) for column in FACET_COLUMNS]
+    for name, (column, width) in histograms.items():
+        expressions.append(("histogram:" + name, bucket("{}.{}".format(row, column), width)))
+    return expressions
+
+
+def _facet_add(facet, value, delta, condition="1"):
+    return (
+        "INSERT INTO Facet_Counts (facet, value, count) SELECT '{0}', {1}, {2} "
+        "WHERE {1} IS NOT NULL AND {3} "
+        "ON CONFLICT(facet, value) DO UPDATE SET count = count + {2};"
+    ).format(facet, value, delta, condition)
+
+
+def _facet_triggers(histograms=HISTOGRAMS):
+    """
+    Returns the triggers mirroring Search writes into Facet_Counts.
+    """
+    new = _facet_expressions("NEW", histograms)
+    old = _facet_expressions("OLD", histograms)
+    changed = ["{} IS NOT {}".format(o, n) for (_, o), (_, n) in zip(old, new)]
+    return {
+        "facets_search_insert": ("AFTER INSERT ON Search", [_facet_add(f, n, 1) for f, n in new]),
+        "facets_search_delete": ("AFTER DELETE ON Search", [_facet_add(f, o, -1) for f, o in old]),
+        "facets_search_update": (
+            "AFTER UPDATE ON Search",
+            [
+                statement
+                for (facet, o), (_, n), condition in zip(old, new, changed)
+                for statement in (_facet_add(facet, o, -1, condition), _facet_add(facet, n, 1, condition))
+            ],
+        ),
+    }
+
+
+FACET_TRIGGERS = _facet_triggers()
+
+
+def _rebuild_facet_counts(conn, histograms=HISTOGRAMS):
+    """
+    Recounts every facet and histogram from Search, without committing.
+    """
+    conn.execute("DELETE FROM Facet_Counts")
+    for facet, value in _facet_expressions("Search", histograms):
+        conn.execute(
+            "INSERT INTO Facet_Counts (facet, value, count) "
+            "SELECT '{0}', {1}, COUNT(*) FROM Search WHERE {1} IS NOT NULL GROUP BY {1}".format(facet, value)
+        )
+
+
+# --------------------------------
+# Range filters
+# --------------------------------
+# B-tree indexes for the height, price and growth rate range filters
+# (schema version 5). Min_height comes first so that the "fits within"
+# filter reads Max_height from the index too.
+RANGE_INDEXES = {
+    "idx_search_height": "Search(Min_height, Max_height)",
+    "idx_search_price": "Search(Price)",
+    "idx_search_growth_rate": "Search(Growth_rate)",
+}
+
+# The height range of every Search row with both heights set, as an
+# R*Tree for "overlaps" queries: a B-tree can only bound one end of an
+# interval. The R*Tree stores 32-bit floats rounded outwards, so it
+# returns a superset that callers re-check against Search.
+SEARCH_HEIGHTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS Search_heights USING rtree(
+        id,  -- Search.tree_inventory_id
+        min_height, max_height
+    )
+"""
+
+
+def _height_insert(row):
+    return (
+        "INSERT INTO Search_heights (id, min_height, max_height) "
+        "SELECT {0}.tree_inventory_id, MIN({0}.Min_height, {0}.Max_height), MAX({0}.Min_height, {0}.Max_height) "
+        "WHERE {0}.Min_height IS NOT NULL AND {0}.Max_height IS NOT NULL;"
+    ).format(row)
+
+
+HEIGHT_TRIGGERS = {
+    "heights_search_insert": ("AFTER INSERT ON Search", [_height_insert("NEW")]),
+    "heights_search_delete": (
+        "AFTER DELETE ON Search",
+        ["DELETE FROM Search_heights WHERE id = OLD.tree_inventory_id;"],
+    ),
+    "heights_search_update": (
+        "AFTER UPDATE OF tree_inventory_id, Min_height, Max_height ON Search",
+        ["DELETE FROM Search_heights WHERE id = OLD.tree_inventory_id;", _height_insert("NEW")],
+    ),
+}
+
+
+def _rebuild_height_index(conn):
+    """
+    Refills Search_heights from Search, without committing.
+    """
+    # Recreating the R*Tree is much faster than deleting its entries.
+    conn.execute("DROP TABLE IF EXISTS Search_heights")
+    conn.execute(SEARCH_HEIGHTS)
+    conn.execute(
+        """
+        INSERT INTO Search_heights (id, min_height, max_height)
+        SELECT tree_inventory_id, MIN(Min_height, Max_height), MAX(Min_height, Max_height)
+        FROM Search WHERE Min_height IS NOT NULL AND Max_height IS NOT NULL
+        """
+    )
+
+
+# Tables derived from Search by triggers: (triggers, refill function).
+# A full rebuild drops the triggers and refills each table once.
+SEARCH_DERIVED = [
+    (FACET_TRIGGERS, _rebuild_facet_counts),
+    (HEIGHT_TRIGGERS, _rebuild_height_index),
+]
+
+
+# --------------------------------
+# Order history
+# --------------------------------
+# An order (schema version 6) links the Customers row holding the
+# buyer's details to the inventory item bought. Its statuses are an
+# append-only event log; Order_Latest_Status holds the newest event of
+# each order, kept by a trigger, so an order summary is a join on
+# primary keys. The 'status' table of earlier versions is kept but no
+# longer written.
+NOW = "((julianday('now') - 2440587.5) * 86400.0)"  # unix seconds
+
+ORDER_HISTORY_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Orders (
+        order_id INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL REFERENCES Customers(customer_id),
+        tree_inventory_id INTEGER REFERENCES Nursery_Tree_Inventory(tree_inventory_id),
+        Quantity INTEGER NOT NULL,
+        price REAL,  -- IQD, for the whole order
+        placed_at REAL  -- unix seconds; NULL if placed before version 6
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Order_Status_Events (
+        event_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES Orders(order_id),
+        ts REAL NOT NULL DEFAULT {},  -- unix seconds; 0 if recorded before version 6
+        Status TEXT NOT NULL,
+        Note TEXT
+    )
+    """.format(NOW),
+    """
+    CREATE TABLE IF NOT EXISTS Order_Latest_Status (
+        order_id INTEGER PRIMARY KEY REFERENCES Orders(order_id),
+        event_id INTEGER NOT NULL,
+        ts REAL NOT NULL,
+        Status TEXT NOT NULL,
+        Note TEXT
+    )
+    """,
+]
+
+ORDER_HISTORY_INDEXES = {
+    "idx_order_events": "Order_Status_Events(order_id, ts)",
+    "idx_orders_customer": "Orders(customer_id)",
+    "idx_customers_email": "Customers(Email)",
+}
+
+ORDER_HISTORY_VERSIONED = ["Orders", "Order_Status_Events", "Order_Latest_Status"]
+
+ORDER_HISTORY_TRIGGERS = {
+    "order_events_no_update": (
+        "BEFORE UPDATE ON Order_Status_Events",
+        ["SELECT RAISE(ABORT, 'Order_Status_Events is append-only');"],
+    ),
+    "order_events_no_delete": (
+        "BEFORE DELETE ON Order_Status_Events",
+        ["SELECT RAISE(ABORT, 'Order_Status_Events is append-only');"],
+    ),
+    "order_latest_status": (
+        "AFTER INSERT ON Order_Status_Events",
+        [
+            "INSERT INTO Order_Latest_Status (order_id, event_id, ts, Status, Note) "
+            "VALUES (NEW.order_id, NEW.event_id, NEW.ts, NEW.Status, NEW.Note) "
+            "ON CONFLICT(order_id) DO UPDATE SET event_id = excluded.event_id, ts = excluded.ts, "
+            "Status = excluded.Status, Note = excluded.Note "
+            "WHERE (excluded.ts, excluded.event_id) > (Order_Latest_Status.ts, Order_Latest_Status.event_id);"
+        ],
+    ),
+}
+
+
+def _backfill_order_history(conn):
+    """
+    Creates an order for every Customers row (same id) and turns the
+    old status rows into events. Status rows only carry an email, so
+    the n-th status row of an email is matched to its n-th order, as
+    place_order wrote them in pairs; unmatched ones stay in 'status'.
+    """
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO Orders (order_id, customer_id, tree_inventory_id, Quantity, price)
+        SELECT customer_id, customer_id, tree_inventory_id, COALESCE(Quantity, 0), price FROM Customers
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO Order_Status_Events (order_id, ts, Status, Note)
+        WITH s AS (
+            SELECT status_id, Email, Status, Note,
+                   ROW_NUMBER() OVER (PARTITION BY Email ORDER BY status_id) AS n
+            FROM status WHERE Email IS NOT NULL
+        ), c AS (
+            SELECT customer_id, Email,
+                   ROW_NUMBER() OVER (PARTITION BY Email ORDER BY customer_id) AS n
+            FROM Customers WHERE Email IS NOT NULL
+        )
+        SELECT c.customer_id, 0, COALESCE(s.Status, 'Order Placed'), s.Note
+        FROM s JOIN c ON c.Email = s.Email AND c.n = s.n
+        ORDER BY s.status_id
+        """
+    )
+
+
+# --------------------------------
+# Migrations
+# --------------------------------
+def _column_names(conn, table):
+    """
+    Returns the column names of a table.
+    """
+    return [row[1] for row in conn.execute("PRAGMA table_info({})".format(table))]
+
+
+def _migrate_base_schema(conn):
+    """
+    Version 1: catalog, order and ledger tables; indexes; the Search key
+    and the triggers maintaining Search; table version counters; the
+    full-text indexes over Trees. Every step checks what exists, so
+    databases prepared before versioning migrate cleanly.
+    """
+    for statement in BASE_TABLES + ORDER_TABLES:
+        conn.execute(statement)
+    conn.execute(IMPORT_LEDGER)
+    if "tree_inventory_id" not in _column_names(conn, "Customers"):
+        conn.execute("ALTER TABLE Customers ADD COLUMN tree_inventory_id INTEGER")
+    for name, target in INDEXES.items():
+        conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}".format(name, target))
+
+    added_key = "tree_inventory_id" not in _column_names(conn, "Search")
+    if added_key:
+        conn.execute("ALTER TABLE Search ADD COLUMN tree_inventory_id INTEGER")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_search_inventory "
+        "ON Search(tree_inventory_id)"
+    )
+
+    _create_triggers(conn, _V1_SEARCH_TRIGGERS)
+
+    conn.execute(TABLE_VERSIONS)
+    for table in VERSIONED_TABLES:
+        _create_triggers(conn, _version_triggers(table))
+
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    for table, (columns, options) in FTS_TABLES.items():
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, "
+            "content='Trees', content_rowid='tree_id', {})".format(
+                table, ", ".join(columns), options
+            )
+        )
+        _create_triggers(conn, _fts_triggers(table, columns))
+        if table not in existing:
+            # Index the trees that were there before the table.
+            conn.execute("INSERT INTO {0} ({0}) VALUES ('rebuild')".format(table))
+
+    if added_key:
+        # Rows built before the key existed cannot be matched to
+        # their inventory rows, so rebuild them once.
+        _rebuild_search_rows(conn, _V1_SEARCH_COLUMNS, _V1_SEARCH_SELECT)
+
+
+def _migrate_version_timestamps(conn):
+    """
+    Version 2: Table_Versions.updated_at, set by the version triggers
+    on every write. Tables written before have no timestamp until
+    their next write.
+    """
+    if "updated_at" not in _column_names(conn, "Table_Versions"):
+        conn.execute("ALTER TABLE Table_Versions ADD COLUMN updated_at INTEGER")
+    for table in VERSIONED_TABLES:
+        triggers = _version_triggers(table, STAMPED_VERSION_BUMP)
+        for name in triggers:
+            conn.execute("DROP TRIGGER IF EXISTS {}".format(name))
+        _create_triggers(conn, triggers)
+
+
+def _migrate_integer_keys(conn):
+    """
+    Version 3: integer tree_id / nursery_id keys on the inventory,
+    derived from the names and backfilled; Search rebuilt as a table
+    keyed by tree_inventory_id that is joined through those keys.
+    """
+    for name in _V1_SEARCH_TRIGGERS:
+        conn.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    columns = _column_names(conn, "Nursery_Tree_Inventory")
+    if "tree_id" not in columns:
+        conn.execute("ALTER TABLE Nursery_Tree_Inventory ADD COLUMN tree_id INTEGER REFERENCES Trees(tree_id)")
+    if "nursery_id" not in columns:
+        conn.execute("ALTER TABLE Nursery_Tree_Inventory ADD COLUMN nursery_id INTEGER REFERENCES Nurseries(nursery_id)")
+    conn.execute(LINK_INVENTORY.format("1"))
+
+    # Dropping Search also drops its indexes and version triggers.
+    conn.execute("DROP TABLE IF EXISTS Search")
+    conn.execute(SEARCH_TABLE)
+    for name, target in INDEXES.items():
+        if target.startswith("Search("):
+            conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}".format(name, target))
+    for name, target in KEY_INDEXES.items():
+        conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}".format(name, target))
+    for name in REDUNDANT_INDEXES:
+        conn.execute("DROP INDEX IF EXISTS {}".format(name))
+    _create_triggers(conn, _version_triggers("Search", STAMPED_VERSION_BUMP))
+    _create_triggers(conn, SEARCH_TRIGGERS)
+    _rebuild_search_rows(conn)
+
+
+def _migrate_facet_counts(conn):
+    """
+    Version 4: Facet_Counts and the Search triggers maintaining it.
+    The Search triggers are recreated to update rows in place, which
+    the facet triggers rely on.
+    """
+    for name in SEARCH_TRIGGERS:
+        conn.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    _create_triggers(conn, SEARCH_TRIGGERS)
+    conn.execute(FACET_COUNTS)
+    _create_triggers(conn, _facet_triggers(_V4_HISTOGRAMS))
+    _rebuild_facet_counts(conn, _V4_HISTOGRAMS)
+
+
+def _migrate_range_filters(conn):
+    """
+    Version 5: indexes for the range filters, the Search_heights R*Tree
+    and the growth rate histogram.
+    """
+    for name, target in RANGE_INDEXES.items():
+        conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}".format(name, target))
+    _rebuild_height_index(conn)
+    _create_triggers(conn, HEIGHT_TRIGGERS)
+    for name in FACET_TRIGGERS:
+        conn.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    _create_triggers(conn, FACET_TRIGGERS)
+    _rebuild_facet_counts(conn)
+
+
+def _migrate_order_history(conn):
+    """
+    Version 6: Orders, the append-only Order_Status_Events log and the
+    Order_Latest_Status table, filled from Customers and 'status'.
+    """
+    for statement in ORDER_HISTORY_TABLES:
+        conn.execute(statement)
+    for name, target in ORDER_HISTORY_INDEXES.items():
+        conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}".format(name, target))
+    _create_triggers(conn, ORDER_HISTORY_TRIGGERS)
+    for table in ORDER_HISTORY_VERSIONED:
+        _create_triggers(conn, _version_triggers(table, STAMPED_VERSION_BUMP))
+    _backfill_order_history(conn)
+
+
+def _migrate_import_progress(conn):
+    """
+    Version 7: Import_Ledger.rows_committed, so an import committed
+    chunk by chunk can resume where it stopped.
+    """
+    if "rows_committed" not in _column_names(conn, "Import_Ledger"):
+        conn.execute("ALTER TABLE Import_Ledger ADD COLUMN rows_committed INTEGER NOT NULL DEFAULT 0")
+
+
+# Applied in order; a database at PRAGMA user_version N has run the
+# first N. Append new migrations, never edit or reorder shipped ones.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_version_timestamps,
+    _migrate_integer_keys,
+    _migrate_facet_counts,
+    _migrate_range_filters,
+    _migrate_order_history,
+    _migrate_import_progress,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def bootstrap(conn):
+    """
+    Brings a database up to SCHEMA_VERSION: switches it to WAL mode and
+    runs the pending migrations in one BEGIN IMMEDIATE transaction,
+    recording progress in PRAGMA user_version. Idempotent, and cheap
+    (one PRAGMA read) once the database is current.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    # journal_mode is persistent but cannot change inside a transaction.
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock: another process may have migrated.
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version, SCHEMA_VERSION):
+            MIGRATIONS[number](conn)
+            conn.execute("PRAGMA user_version = {}".format(number + 1))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# --------------------------------
+# Full rebuild and verification
+# --------------------------------
+def rebuild_search_table(conn):
+    """
+    Re-derives the inventory keys, re-populates the whole 'Search'
+    table from the source tables and refills the tables derived from it
+    (SEARCH_DERIVED) in a single transaction. Readers keep seeing the
+    previous contents until the commit.
+    """
+    conn.execute(LINK_INVENTORY.format("1"))
+    # Refill the derived tables once instead of row by row.
+    for triggers, _ in SEARCH_DERIVED:
+        for name in triggers:
+            conn.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    _rebuild_search_rows(conn)
+    for triggers, refill in SEARCH_DERIVED:
+        _create_triggers(conn, triggers)
+        refill(conn)
+    conn.commit()
+
+
+def _rebuild_search_rows(conn, columns=SEARCH_COLUMNS, select=SEARCH_SELECT):
+    """
+    Replaces every Search row, without committing.
+    """
+    conn.execute("DELETE FROM Search")
+    conn.execute("INSERT INTO Search ({}) {}".format(", ".join(columns), select))
+
+
+def verify_search_table(conn):
+    """
+    Diffs the incrementally maintained 'Search' table against what a
+    full rebuild would produce, without modifying anything.
+
+    Returns a dict with:
+        'missing'  - rows a rebuild would add (absent or outdated in Search)
+        'stale'    - rows present in Search that a rebuild would drop
+        'unlinked' - (tree_inventory_id, nursery_name, tree_common_name)
+                     of inventory rows whose tree or nursery name
+                     matches no row, e.g. because of a typo
+        'facets'   - (facet, value, stored count, actual count) of
+                     Facet_Counts entries that disagree with Search
+        'heights'  - ids of Search rows missing from Search_heights,
+                     or left there after the row went away
+    """
+    columns = ", ".join(SEARCH_COLUMNS)
+    current = "SELECT {} FROM Search".format(columns)
+    # What a rebuild would produce, keys re-derived from the names.
+    rebuilt = SEARCH_SELECT.replace("nti.tree_id", TREE_ID_FOR.format("nti.tree_common_name")).replace(
+        "nti.nursery_id", NURSERY_ID_FOR.format("nti.nursery_name")
+    )
+    missing = conn.execute(
+        "{} EXCEPT {}".format(rebuilt, current)
+    ).fetchall()
+    stale = conn.execute(
+        "{} EXCEPT {}".format(current, rebuilt)
+    ).fetchall()
+    unlinked = conn.execute(
+        """
+        SELECT tree_inventory_id, nursery_name, tree_common_name
+        FROM Nursery_Tree_Inventory
+        WHERE tree_id IS NULL OR nursery_id IS NULL
+        ORDER BY tree_inventory_id
+        """
+    ).fetchall()
+    facets = []
+    for facet, value in _facet_expressions("Search"):
+        stored = dict(conn.execute(
+            "SELECT value, count FROM Facet_Counts WHERE facet = ? AND count != 0", (facet,)
+        ).fetchall())
+        actual = dict(conn.execute(
+            "SELECT {0}, COUNT(*) FROM Search WHERE {0} IS NOT NULL GROUP BY {0}".format(value)
+        ).fetchall())
+        facets += [
+            (facet, key, stored.get(key, 0), actual.get(key, 0))
+            for key in sorted(stored.keys() | actual.keys(), key=repr)
+            if stored.get(key, 0) != actual.get(key, 0)
+        ]
+    with_heights = "SELECT tree_inventory_id FROM Search WHERE Min_height IS NOT NULL AND Max_height IS NOT NULL"
+    heights = conn.execute(
+        "SELECT * FROM ({0} EXCEPT SELECT id FROM Search_heights) "
+        "UNION ALL SELECT * FROM (SELECT id FROM Search_heights EXCEPT {0})".format(with_heights)
+    ).fetchall()
+    return {"missing": missing, "stale": stale, "unlinked": unlinked, "facets": facets,
+            "heights": [row[0] for row in heights]}
+
+
+# --------------------------------
+# Query plan checks
+# --------------------------------
+# Hot queries of the app with sample parameters, and the scans each one
+# is allowed: a table alias it may scan in full, or a whole plan line.
+# Anything else must be answered through an index. The db queries are
+# built by the db functions' own builders, so the check sees the SQL
+# the app runs.
+
+# A Search page whose filter matches many rows walks the result order
+# index and stops at the page's LIMIT, rather than sorting every match.
+ORDERED_WALK = "SCAN Search USING INDEX idx_search_tree"
+
+
+def hot_queries(conn):
+    """
+    Returns {name: (sql, params, allowed full scans)} of the hot
+    queries, built for the database of 'conn' (an overlap filter's
+    clause depends on its R*Tree).
+    """
+    import db  # db imports this module
+
+    def search_page(after=None, allowed=(), **filters):
+        where, params = db.build_search_filter(conn=conn, **filters)
+        return db.build_search_query(where, params, db.PAGE_SIZE + 1, after) + (set(allowed),)
+
+    def filtered(**filters):
+        where, params = db.build_search_filter(conn=conn, **filters)
+        return where, params
+
+    narrow = {"min_height": 150.0, "max_height": 160.0, "height_mode": db.HEIGHT_OVERLAPS}
+    wide = {"min_height": 0.0, "max_height": 10000.0, "height_mode": db.HEIGHT_OVERLAPS}
+    queries = {
+        "db.search_tree": (db.ranked_query("Trees_fts"), ('"oak"*', db.RESULTS_PER_PAGE + 1, 0), set()),
+        "db.search_tree.fuzzy": (db.ranked_query("Trees_trigram"), ('"map" OR "ape"', 11, 0), set()),
+        "db.search_tree_ranked": (db.ranked_query("Trees_fts", with_rank=True), ('"oak"*', 11, 0), set()),
+        "db.search_page_rows": search_page(tree_choice="Oak", min_height=0.0, max_height=1000.0),
+        "db.search_page_rows.after": search_page(("Oak", 10), tree_choice="Oak"),
+        "db.search_page_rows.after_null_name": search_page((None, 10), [ORDERED_WALK], packaging_choice="Potted"),
+        "db.search_page_rows.height_overlap": search_page(**narrow),
+        "db.search_page_rows.height_overlap_wide": search_page(allowed=[ORDERED_WALK], **wide),
+        "db.get_order_status": (db.ORDER_STATUS_QUERY, ("someone@example.com", 1700000000.0, 100, 21), set()),
+        "db.get_order_events": (db.ORDER_EVENTS_QUERY, (1,), set()),
+        "db.browse_table": (db.browse_query("Nursery_Tree_Inventory"), (100, 51), set()),
+        "db.get_tree_details": (db.TREE_DETAILS_QUERY, (1,), set()),
+        "db.get_facet_counts": (db.STORED_COUNTS_QUERY, ("Packaging_type",), set()),
+    }
+    for name, filters in (("price_range", {"min_price": 1000.0, "max_price": 50000.0}),
+                          ("height_overlap", narrow)):
+        where, params = filtered(**filters)
+        queries[f"db.count_search_rows.{name}"] = (db.COUNT_SEARCH_QUERY.format(where), params, set())
+        queries[f"db.get_facet_counts.{name}"] = (db.counts_query("Packaging_type", where), params, set())
+    queries.update({
+        "schema.search_rows_for_tree": (SEARCH_SELECT + " WHERE nti.tree_id = ?", (1,), set()),
+        "schema.search_rows_for_nursery": (SEARCH_SELECT + " WHERE nti.nursery_id = ?", (1,), set()),
+        "schema.search_rows_for_tree_name": (SEARCH_SELECT + " WHERE nti.tree_common_name = ?", ("Oak",), set()),
+        "schema.search_rows_for_nursery_name": (
+            SEARCH_SELECT + " WHERE nti.nursery_name = ?", ("Green Garden Nursery",), set()
+        ),
+        "schema.link_inventory_by_name": (
+            "SELECT tree_inventory_id FROM Nursery_Tree_Inventory WHERE tree_common_name = ? AND tree_id > ?",
+            ("Oak", 1),
+            set(),
+        ),
+    })
+    return queries
+
+
+def explain(conn, sql, params=()):
+    """
+    Returns the 'EXPLAIN QUERY PLAN' detail lines of a statement.
+    """
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(conn):
+    """
+    Runs EXPLAIN QUERY PLAN on every query of hot_queries(conn) and
+    returns a list of (query name, plan line) for each unexpected full
+    scan. An empty list means every lookup is served by an index.
+    """
+    problems = []
+    for name, (sql, params, allowed) in hot_queries(conn).items():
+        for detail in explain(conn, sql, params):
+            words = detail.split()
+            if words[0] != "SCAN" or words[1] == "CONSTANT":
+                continue
+            if "VIRTUAL TABLE" in detail:
+                # Full-text and other virtual tables answer through
+                # their own index; the plan always reports a SCAN.
+                continue
+            if words[1] not in allowed and detail not in allowed:
+                problems.append((name, detail))
+    return problems
+
+
+if __name__ == "__main__":
+    # Usage: python schema.py [path/to/database.db]
+    # Prints the hot queries that fall back to a full table scan and
+    # exits non-zero if there are any. Checks a freshly bootstrapped
+    # database, or the given one as it is (opened read-only, never
+    # migrated). The test suite runs the same check
+    # (tests/test_query_plans.py).
+    import pathlib
+    import sqlite3
+    import sys
+
+    if len(sys.argv) > 1:
+        conn = sqlite3.connect(pathlib.Path(sys.argv[1]).absolute().as_uri() + "?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(":memory:")
+        bootstrap(conn)
+    problems = check_query_plans(conn)
+    for name, detail in problems:
+        print("{}: {}".format(name, detail))
+    conn.close()
+    sys.exit(1 if problems else 0)
@@ -1,12 +1,77 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
+import db
+import pagination
+import perf
+import service
+from db import PAGE_SIZE
 
-def get_connection():
+# Facet dropdowns: (Search column, label, build_search_filter argument).
+FACET_WIDGETS = [
+    ("tree_common_name", "Tree Name", "tree_choice"),
+    ("Packaging_type", "Packaging Type", "packaging_choice"),
+    ("shape", "Shape", "shape_choice"),
+    ("Leaf_Type", "Leaf Type", "leaf_type"),
+    ("Soil_type", "Soil Type", "soil_type"),
+    ("Watering_demand", "Watering Demand", "watering_demand"),
+    ("Origin", "Origin", "origin"),
+]
+
+# Range inputs: (label, build_search_filter arguments of its bounds).
+# An empty input means no bound.
+RANGE_WIDGETS = {
+    "height": ("Height (m)", "min_height", "max_height"),
+    "growth_rate": ("Growth Rate", "min_growth_rate", "max_growth_rate"),
+    "price": ("Price", "min_price", "max_price"),
+}
+
+HEIGHT_MODES = {db.HEIGHT_WITHIN: "Fits within the range", db.HEIGHT_OVERLAPS: "Overlaps the range"}
+
+
+def current_filters():
     """
-    Returns a connection object to the SQLite database.
+    Returns the build_search_filter arguments of the filter widgets as
+    they were left by the user. Read before the widgets are drawn, so
+    the facet counts can be narrowed by the current selection.
     """
-    return sqlite3.connect("mydatabase.db")
+    state = st.session_state
+    filters = {arg: state.get("search_" + arg, "All") for _, _, arg in FACET_WIDGETS}
+    for _, low, high in RANGE_WIDGETS.values():
+        filters[low] = state.get("search_" + low)
+        filters[high] = state.get("search_" + high)
+    filters["height_mode"] = state.get("search_height_mode", db.HEIGHT_WITHIN)
+    return filters
+
+
+def range_inputs(name):
+    """
+    Draws the lower and upper bound inputs of a range filter side by side.
+    """
+    label, low, high = RANGE_WIDGETS[name]
+    left, right = st.columns(2)
+    left.number_input(f"Minimum {label}", value=None, min_value=0.0, step=0.1,
+                      placeholder="Any", key="search_" + low)
+    right.number_input(f"Maximum {label}", value=None, min_value=0.0, step=0.1,
+                       placeholder="Any", key="search_" + high)
+
+
+def facet_selectbox(label, key, counts):
+    """
+    Draws a dropdown whose choices show how many rows they match,
+    e.g. "Potted (124)". The current choice stays available even if the
+    other filters leave it no rows.
+    """
+    counts = {entry["value"]: entry["count"] for entry in counts}
+    options = ["All"] + list(counts)
+    selected = st.session_state.get(key, "All")
+    if selected not in counts and selected != "All":
+        options.append(selected)
+    return st.selectbox(
+        label,
+        options,
+        key=key,
+        format_func=lambda value: value if value == "All" else f"{value} ({counts.get(value, 0)})",
+    )
+
 
 def show_search_page():
     """
@@ -14,72 +79,70 @@ def show_search_page():
     allowing users to filter on several fields.
     """
     st.title("Search Trees")
-    
-    # --- Read all data from the 'Search' table
-    conn = get_connection()
-    df_search = pd.read_sql_query("SELECT * FROM Search", conn)
-    conn.close()
 
     # If the table is empty, inform the user
-    if df_search.empty:
+    if not service.facet_options("tree_common_name"):
         st.write("No data in 'Search' table. Please go to 'Data Entry Page' to add or refresh.")
         return
 
+    # --- Facet counts: precomputed when nothing is filtered, otherwise
+    # counted over the matching rows; cached until Search changes
+    with perf.timed("search_page.facets"):
+        facets = service.facets(current_filters())
+
     # ----------------------
     # Filter Widgets
     # ----------------------
+    def facet(index):
+        column, label, arg = FACET_WIDGETS[index]
+        facet_selectbox(label, "search_" + arg, facets["counts"][column])
+
     # 1) Tree Name
-    tree_options = sorted(df_search["tree_common_name"].dropna().unique())
-    tree_choice = st.selectbox("Tree Name", ["All"] + tree_options)
+    facet(0)
 
-    # 2) Min Height & Max Height
-    #    - We'll let the user specify numeric values for filtering
-    min_height_input = st.number_input("Minimum Height (m)", value=0.0, step=0.1)
-    max_height_input = st.number_input("Maximum Height (m)", value=1000.0, step=0.1)
+    # 2) Height range: an item comes in heights from Min_height to
+    #    Max_height, which either has to fit within the range or only
+    #    overlap it
+    range_inputs("height")
+    st.radio("Height match", list(HEIGHT_MODES), format_func=HEIGHT_MODES.get,
+             horizontal=True, key="search_height_mode")
 
     # 3) Packaging Type
-    packaging_options = sorted(df_search["Packaging_type"].dropna().unique())
-    packaging_choice = st.selectbox("Packaging Type", ["All"] + packaging_options)
+    facet(1)
+
+    # 4) Growth Rate and Price ranges
+    range_inputs("growth_rate")
+    range_inputs("price")
 
-    # 4) Growth Rate
-    #    - If you want an exact match, you can do so with a numeric input.
-    #    - Alternatively, you might want to store a range or do ">= growth_rate", etc.
-    growth_rate_input = st.number_input("Growth Rate (exact match)", value=0.0, step=0.1)
+    # 5) Shape, then the tree attributes
+    for index in range(2, len(FACET_WIDGETS)):
+        facet(index)
 
-    # 5) Shape
-    shape_options = sorted(df_search["shape"].dropna().unique())
-    shape_choice = st.selectbox("Shape", ["All"] + shape_options)
+    import pandas as pd  # loaded on first use; only this page needs it
+    with perf.timed("search_page.histograms"):
+        for name, title in (("height", "Minimum height (m)"), ("growth_rate", "Growth rate"), ("price", "Price")):
+            histogram = facets["histograms"][name]
+            if histogram["buckets"]:
+                st.caption(f"{title}, in steps of {histogram['width']:,}")
+                st.bar_chart(pd.DataFrame(histogram["buckets"]).set_index("from"))
 
     # ----------------------
-    # Filtering the Data
+    # Filtering in SQL
     # ----------------------
-    df_filtered = df_search.copy()
-
-    # Tree Name filter
-    if tree_choice != "All":
-        df_filtered = df_filtered[df_filtered["tree_common_name"] == tree_choice]
-
-    # Min/Max Height filter
-    df_filtered = df_filtered[df_filtered["Min_height"] >= min_height_input]
-    df_filtered = df_filtered[df_filtered["Max_height"] <= max_height_input]
-
-    # Packaging Type filter
-    if packaging_choice != "All":
-        df_filtered = df_filtered[df_filtered["Packaging_type"] == packaging_choice]
-
-    # Growth Rate filter
-    # If growth_rate_input is > 0, we'll filter for an exact match
-    # Adjust logic if you prefer a range-based filter
-    if growth_rate_input > 0:
-        df_filtered = df_filtered[df_filtered["Growth_rate"] == growth_rate_input]
-
-    # Shape filter
-    if shape_choice != "All":
-        df_filtered = df_filtered[df_filtered["shape"] == shape_choice]
+    # Only the visible page is fetched (keyset pagination); the total
+    # comes from a count cached until Search changes.
+    filters = current_filters()
+    page_size = pagination.page_size_select("search_results", PAGE_SIZE)
+    after = pagination.current_cursor("search_results", (filters, page_size))
+    with perf.timed("search_page.rows"):
+        found = service.search_inventory(filters, after, page_size)
+    with perf.timed("search_page.dataframe"):
+        df_filtered = pd.DataFrame(found["rows"], columns=db.RESULT_COLUMNS)
 
     # ----------------------
     # Display Results
     # ----------------------
     st.subheader("Search Results")
-    st.write(f"Showing {len(df_filtered)} result(s):")
-    st.dataframe(df_filtered)
+    with perf.timed("search_page.render"):
+        st.dataframe(df_filtered)
+    pagination.pager("search_results", found["next"], len(df_filtered), found["total"], page_size)
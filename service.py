@@ -0,0 +1,292 @@
+import base64
+import hashlib
+import json
+import math
+
+import catalog
+import db
+import shards
+
+# Where the reads and orders below go: the one database, or with
+# HASAR_SHARDS set, every nursery shard (see shards.py).
+store = shards if shards.ENABLED else db
+
+# Reads answered from the in-memory catalog when HASAR_CATALOG is set
+# (see catalog.py).
+CATALOG_READS = ("tree_details", "search_inventory", "count_inventory", "facets")
+
+# --------------------------------
+# Cache validators
+# --------------------------------
+# Tables each service read depends on. A response stays valid until
+# one of them is written, so the API derives ETag and Last-Modified
+# from their versions.
+DEPENDS = {
+    "search_trees": ("Trees", "Nursery_Tree_Inventory"),
+    "tree_details": ("Trees", "Nursery_Tree_Inventory"),
+    "search_inventory": ("Search",),
+    "count_inventory": ("Search",),
+    "facets": ("Search",),
+    "order_status": db.ORDER_SUMMARY_TABLES,
+}
+
+
+def validators(name, key=""):
+    """
+    Returns (etag, last_modified) for the result of service read 'name'
+    called with arguments 'key' (any string identifying them).
+    'last_modified' is unix seconds or None.
+    """
+    tables = DEPENDS[name]
+    state = [name, key]
+    snapshot = catalog.current() if name in CATALOG_READS else None
+    if snapshot is not None:
+        # What the catalog was built from, not what the database holds
+        # now: the response does not change before the catalog does.
+        state += [f"{path}={versions}" for path, versions in snapshot.state]
+        etag = '"{}"'.format(hashlib.sha1("|".join(state).encode()).hexdigest()[:20])
+        return etag, snapshot.last_modified
+    modified = []
+    for path in shards.databases():
+        with db.using(path):
+            versions = db.table_versions()
+            state += [path] + [f"{table}={versions.get(table, 0)}" for table in tables]
+            modified.append(db.last_modified(tables))
+    etag = '"{}"'.format(hashlib.sha1("|".join(state).encode()).hexdigest()[:20])
+    return etag, max((ts for ts in modified if ts is not None), default=None)
+
+
+# --------------------------------
+# Page cursors
+# --------------------------------
+# Listings are paged by key (see db.search_page_rows): a page ends with
+# an opaque cursor naming its last row, which fetches the next page.
+def encode_cursor(key):
+    """
+    Returns a URL-safe cursor string for a db 'next' key, or None.
+    """
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Returns the db key of a cursor from encode_cursor, or None for an
+    empty cursor. Raises ValueError for anything else.
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("invalid cursor")
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and abs(value) <= db.MAX_INTEGER
+
+
+def _search_key(cursor):
+    key = decode_cursor(cursor)
+    if key is not None and not (
+        isinstance(key, tuple) and len(key) == 2 and isinstance(key[0], (str, type(None))) and _is_id(key[1])
+    ):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def _order_key(cursor):
+    key = decode_cursor(cursor)
+    if key is not None and not (
+        isinstance(key, tuple) and len(key) == 2
+        and (_is_id(key[0]) or isinstance(key[0], float) and math.isfinite(key[0])) and _is_id(key[1])
+    ):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def _filter(filters):
+    """
+    Returns the arguments the store's Search reads take for 'filters'
+    (keyword arguments of db.build_search_filter): (where, params), or
+    with shards the filters themselves, built on each shard.
+    """
+    if store is shards:
+        return (filters,)
+    where, params = db.build_search_filter(**filters)
+    return where, tuple(params)
+
+
+# --------------------------------
+# Storefront
+# --------------------------------
+def tree_from_row(row):
+    """
+    Maps a search-result row (db.TREE_RESULT_COLUMNS) to a dict.
+    """
+    return {
+        "tree_id": row[0],
+        "common_name": row[1],
+        "scientific_name": row[2],
+        "growth_rate": row[3],
+        "watering_demand": row[4],
+        "shape": row[5],
+        "care_instructions": row[6],
+        "main_photo_url": row[7],
+        "origin": row[8],
+        "soil_type": row[9],
+        "root_type": row[10],
+        "leaf_type": row[11],
+        "price": row[12],
+        "packaging_type": row[13],
+        "nursery_name": row[14],
+        "available_quantity": row[15],
+        "tree_inventory_id": row[16]
+    }
+
+
+def search_trees(query, page=0, per_page=db.RESULTS_PER_PAGE):
+    """
+    Ranked tree search (see db.search_tree). Returns a dict with the
+    page's 'results' (tree dicts), 'fuzzy' and 'has_next'.
+    """
+    rows, fuzzy = store.search_tree(query, page, per_page)
+    return {
+        "query": query,
+        "page": page,
+        "per_page": per_page,
+        "fuzzy": fuzzy,
+        "has_next": len(rows) > per_page,
+        "results": [tree_from_row(row) for row in rows[:per_page]],
+    }
+
+
+def tree_details(tree_inventory_id):
+    """
+    Returns the tree dict of one inventory item, or None.
+    """
+    snapshot = catalog.current()
+    row = snapshot.tree_details(tree_inventory_id) if snapshot is not None else None
+    if row is None:
+        # not in the catalog (yet)
+        row = store.get_tree_details(tree_inventory_id)
+    return tree_from_row(row) if row else None
+
+
+# --------------------------------
+# Search page
+# --------------------------------
+def search_inventory(filters, after=None, page_size=db.PAGE_SIZE):
+    """
+    Filters the Search table. 'filters' holds any keyword arguments of
+    db.build_search_filter; 'after' is the 'next' cursor of the previous
+    page (None for the first). Returns a dict with the cached 'total',
+    the page's 'rows' ({column: value}) and the 'next' cursor (None on
+    the last page). Raises ValueError for an invalid cursor.
+    """
+    after = _search_key(after)
+    snapshot = catalog.current()
+    if snapshot is not None:
+        rows, following = snapshot.search_page_rows(filters, page_size, after)
+    else:
+        rows, following = store.search_page_rows(*_filter(filters), page_size, after)
+    return {
+        "total": count_inventory(filters),
+        "page_size": page_size,
+        "rows": [dict(zip(db.RESULT_COLUMNS, row)) for row in rows],
+        "next": encode_cursor(following),
+    }
+
+
+def count_inventory(filters):
+    """
+    Returns how many Search rows match 'filters' (see search_inventory).
+    """
+    snapshot = catalog.current()
+    if snapshot is not None:
+        return snapshot.count(filters)
+    return store.count_search_rows(*_filter(filters))
+
+
+def facets(filters=None):
+    """
+    Returns the facet counts for the filter widgets:
+        'counts'     - {column: [{"value", "count"}]}
+        'histograms' - {name: {"width", "buckets": [{"from", "count"}]}}
+    Each facet is narrowed by every filter except its own, so the
+    choices still show what selecting them instead would match.
+    """
+    filters = filters or {}
+    snapshot = catalog.current()
+
+    def without(*names):
+        return {k: v for k, v in filters.items() if k not in names}
+
+    def facet_counts(column, narrowed):
+        if snapshot is not None:
+            return snapshot.facet_counts(column, narrowed)
+        return store.get_facet_counts(column, *_filter(narrowed))
+
+    def histogram(name, narrowed):
+        if snapshot is not None:
+            return snapshot.histogram(name, narrowed)
+        return store.get_histogram(name, *_filter(narrowed))
+
+    counts = {
+        column: [{"value": value, "count": count}
+                 for value, count in facet_counts(column, without(db.FACET_FILTERS[column]))]
+        for column in db.FACET_COLUMNS
+    }
+    histograms = {
+        name: {
+            "width": db.HISTOGRAMS[name][1],
+            "buckets": [{"from": start, "count": count}
+                        for start, count in histogram(name, without(*db.HISTOGRAM_FILTERS[name]))],
+        }
+        for name in db.HISTOGRAMS
+    }
+    return {"counts": counts, "histograms": histograms}
+
+
+def facet_options(column):
+    """
+    Returns the sorted distinct values of a facet column.
+    """
+    snapshot = catalog.current()
+    if snapshot is not None:
+        return snapshot.facet_options(column)
+    return store.get_facet_options(column)
+
+
+# --------------------------------
+# Orders
+# --------------------------------
+def order_status(email, after=None, page_size=db.ORDERS_PAGE_SIZE):
+    """
+    Returns one page of an email's orders, newest first: a dict with
+    the cached 'total', the 'orders' (db.ORDER_SUMMARY_COLUMNS dicts,
+    with the current status) and the 'next' cursor (see
+    search_inventory).
+    """
+    rows, following = store.get_order_status(email, page_size, _order_key(after))
+    return {
+        "total": store.count_orders(email),
+        "page_size": page_size,
+        "orders": [dict(zip(db.ORDER_SUMMARY_COLUMNS, row)) for row in rows],
+        "next": encode_cursor(following),
+    }
+
+
+def place_order(tree_inventory_id, quantity, username="", customer_full_name="", address="",
+                whatsapp_number="", email="", payment_preferences=""):
+    """
+    Validates and places an order (see db.place_order).
+    Raises ValueError for an invalid item id or quantity.
+    """
+    if not _is_id(tree_inventory_id):
+        raise ValueError("tree_inventory_id must be an integer")
+    db.check_order_quantity(quantity)
+    return store.place_order(tree_inventory_id, quantity, username, customer_full_name,
+                          address, whatsapp_number, email, payment_preferences)
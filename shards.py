@@ -0,0 +1,533 @@
+"""
+Optional partitioning of the nursery data by nursery ("shards"), so
+that writes for different nurseries no longer contend on one SQLite
+lock.
+
+Sharding is off unless HASAR_SHARDS names a shard map (JSON); shard
+paths are relative to the map:
+
+    {"shards": [
+        {"name": "north", "path": "north.db", "nurseries": ["Green Hills", "Zagros Trees"]},
+        {"name": "south", "path": "south.db", "nurseries": ["Basra Palms"]}
+    ]}
+
+Every shard is a complete hasar database holding its nurseries, their
+inventory and the orders for it, plus a copy of the whole Trees
+catalog (so search ranks agree across shards). Nurseries the map does
+not list belong to the first shard.
+
+The functions below mirror the db reads the storefront and the API use
+(service.store picks this module when sharding is on): lookups by id
+go to the one shard holding the row, listings and searches fan out
+over all shards on a thread pool and merge the results in the order
+one database would have returned them.
+
+    python shards.py split mydatabase.db     # partition an existing database
+    python shards.py replicate --every 5     # refresh the read replicas (db.READ_REPLICA)
+    python shards.py sync-trees              # repair the Trees copies (see transaction_all)
+"""
+import argparse
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import db
+
+# --------------------------------
+# Shard map
+# --------------------------------
+SHARD_MAP_PATH = os.environ.get("HASAR_SHARDS")
+
+# Inventory, customer and order ids created in the i-th shard start at
+# i * ID_BLOCK, so they stay unique across shards and name their shard.
+# Ids below ID_BLOCK predate the split (or belong to the first shard)
+# and are looked up.
+ID_BLOCK = 2 ** 40
+
+# Tables whose AUTOINCREMENT ids are used outside their shard (orders
+# take their customer row's id).
+ID_TABLES = ["Nursery_Tree_Inventory", "Customers"]
+
+
+def load_shard_map(path):
+    """
+    Reads a shard map file. Returns the shards, in order, as dicts with
+    'name', 'path' and 'nurseries'. Raises ValueError for a malformed
+    map.
+    """
+    with open(path) as f:
+        entries = json.load(f).get("shards")
+    if not entries or not isinstance(entries, list):
+        raise ValueError("a shard map needs a non-empty 'shards' list")
+    base = os.path.dirname(os.path.abspath(path))
+    shards = []
+    owners = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("name") or not entry.get("path"):
+            raise ValueError("every shard needs a 'name' and a 'path'")
+        for nursery in entry.get("nurseries", []):
+            if nursery in owners:
+                raise ValueError(f"Nursery {nursery!r} is in shards {owners[nursery]!r} and {entry['name']!r}")
+            owners[nursery] = entry["name"]
+        shards.append({
+            "name": entry["name"],
+            "path": os.path.join(base, entry["path"]),
+            "nurseries": list(entry.get("nurseries", [])),
+        })
+    if len({shard["name"] for shard in shards}) < len(shards):
+        raise ValueError("shard names must be unique")
+    return shards
+
+
+SHARDS = load_shard_map(SHARD_MAP_PATH) if SHARD_MAP_PATH else []
+ENABLED = bool(SHARDS)
+
+
+def names():
+    return [shard["name"] for shard in SHARDS]
+
+
+def path_of(name):
+    """
+    Returns the database file of the shard called 'name'.
+    """
+    for shard in SHARDS:
+        if shard["name"] == name:
+            return shard["path"]
+    raise ValueError(f"Unknown shard: {name}")
+
+
+def _owner(nursery_name, shards):
+    for shard in shards:
+        if nursery_name in shard["nurseries"]:
+            return shard
+    return shards[0]
+
+
+# --------------------------------
+# Routing
+# --------------------------------
+_prepared = False
+_prepare_lock = threading.Lock()
+
+
+def prepare(shards=None):
+    """
+    Brings every shard up to the current schema and moves its id
+    sequences into its id block. Idempotent; run once per process
+    before the shards are first used.
+    """
+    for number, shard in enumerate(shards or SHARDS):
+        with db.using(shard["path"]), db.transaction() as conn:
+            for table in ID_TABLES:
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT ?, 0 "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+                    (table, table),
+                )
+                conn.execute(
+                    "UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?",
+                    (number * ID_BLOCK, table, number * ID_BLOCK),
+                )
+
+
+def databases():
+    """
+    Returns the database files holding nursery data: every shard's, or
+    this thread's database when sharding is off.
+    """
+    global _prepared
+    if not ENABLED:
+        return [db.database_path()]
+    if not _prepared:
+        with _prepare_lock:
+            if not _prepared:
+                prepare()
+                _prepared = True
+    return [shard["path"] for shard in SHARDS]
+
+
+def nursery_database(nursery_name):
+    """
+    Returns the database file a nursery's rows are written to.
+    """
+    if not ENABLED:
+        return db.database_path()
+    databases()
+    return _owner(nursery_name, SHARDS)["path"]
+
+
+@contextmanager
+def transaction_all(paths=None):
+    """
+    Context manager for one write transaction (db.transaction) on each
+    of the database files 'paths' (default: databases()), for writes
+    that should land in all of them:
+
+        with shards.transaction_all() as conns:
+            for conn in conns.values():
+                conn.execute(...)
+
+    Yields {path: connection}; the block should use these rather than
+    db.get_connection(). An error in the block rolls back every
+    transaction. Once it succeeds the transactions commit one by one in
+    'paths' order; SQLite has no two-phase commit, so a commit failing
+    (disk full, I/O error) leaves the earlier databases committed and
+    the rest rolled back. Callers must be able to repair that: see
+    sync_trees and the importer's resumable ledger. Write locks are
+    taken in databases() order, so concurrent callers cannot deadlock.
+    """
+    conns = {}
+    with ExitStack() as stack:
+        for path in paths or databases():
+            stack.enter_context(db.using(path))
+            conns[path] = stack.enter_context(db.transaction())
+        yield conns
+        # The first database first: it is the one the others are repaired from.
+        for conn in conns.values():
+            conn.commit()
+
+
+def sync_trees(paths=None):
+    """
+    Copies the Trees rows of the first database of 'paths' (default:
+    databases()) to the others wherever a row with that tree_id is
+    missing or differs, e.g. after a transaction_all whose commit
+    failed part way. Rows only the other databases have are left alone.
+    Returns {path: rows written}.
+    """
+    paths = list(paths or databases())
+    with db.using(paths[0]):
+        conn = db.get_connection(write=True)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(Trees)")]
+        select = "SELECT {} FROM Trees".format(", ".join(f'"{column}"' for column in columns))
+        rows = set(conn.execute(select).fetchall())
+    upsert = "INSERT INTO Trees ({}) VALUES ({}) ON CONFLICT (tree_id) DO UPDATE SET {}".format(
+        ", ".join(f'"{column}"' for column in columns),
+        ", ".join("?" for _ in columns),
+        ", ".join(f'"{column}" = excluded."{column}"' for column in columns if column != "tree_id"),
+    )
+    written = {}
+    for path in paths[1:]:
+        with db.using(path), db.transaction() as conn:
+            stale = sorted(rows - set(conn.execute(select).fetchall()), key=lambda row: row[0])
+            conn.executemany(upsert, stale)
+        written[path] = len(stale)
+    return written
+
+
+# Threads shard queries run on. SQLite releases the GIL while a query
+# runs, so up to one per CPU run at once; on one CPU the shards are
+# queried in turn on the calling thread.
+FAN_OUT_THREADS = min(32, os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def fan_out(func, *args):
+    """
+    Calls func(*args) against every database of databases(), in
+    parallel on a thread pool, each call pointed at its shard (pool
+    threads keep their own connections). Returns the results in shard
+    order.
+    """
+    global _pool
+    paths = databases()
+
+    def call(path):
+        with db.using(path):
+            return func(*args)
+
+    if len(paths) == 1 or FAN_OUT_THREADS == 1:
+        return [call(path) for path in paths]
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=min(FAN_OUT_THREADS, len(SHARDS)), thread_name_prefix="shard")
+    return list(_pool.map(call, paths))
+
+
+def _has_row(table, key, value):
+    return db.get_connection().execute(
+        f'SELECT 1 FROM "{table}" WHERE "{key}" = ?', (value,)
+    ).fetchone() is not None
+
+
+# Where ids below ID_BLOCK were found. Rows never move between shards
+# and ids are never reused, so a hit stays true (a row deleted since
+# is not found in its shard either).
+_located = {}
+LOCATED_MAX = 100000
+
+
+def _locate(table, key, value):
+    """
+    Returns the database file holding row 'value' of 'table', or None.
+    """
+    paths = databases()
+    number = value // ID_BLOCK
+    if 0 < number < len(paths):
+        return paths[number]
+    path = _located.get((table, value))
+    if path is not None:
+        return path
+    for path, found in zip(paths, fan_out(_has_row, table, key, value)):
+        if found:
+            if len(_located) < LOCATED_MAX:
+                _located[(table, value)] = path
+            return path
+    return None
+
+
+def item_database(tree_inventory_id):
+    """
+    Returns the database file holding an inventory item, or None.
+    """
+    return _locate("Nursery_Tree_Inventory", "tree_inventory_id", tree_inventory_id)
+
+
+def order_database(order_id):
+    """
+    Returns the database file holding an order, or None.
+    """
+    return _locate("Orders", "order_id", order_id)
+
+
+# --------------------------------
+# Merged reads (the db functions of the same name, over all shards).
+# The Search reads take build_search_filter arguments instead of
+# (where, params): the filter is built on each shard, since an overlap
+# filter's clause depends on that shard's R*Tree.
+# --------------------------------
+def _sql_order(value):
+    """
+    Sort key ordering Python values as SQLite orders them: NULL, then
+    numbers, then text, then blobs.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value) if isinstance(value, str) else (3, value)
+
+
+def _merge_counts(results):
+    totals = {}
+    for rows in results:
+        for value, count in rows:
+            totals[value] = totals.get(value, 0) + count
+    return sorted(totals.items(), key=lambda item: _sql_order(item[0]))
+
+
+def search_tree(search_query, page=0, per_page=db.RESULTS_PER_PAGE):
+    """
+    db.search_tree over all shards: every shard returns its best rows up
+    to the end of the page, ranked the same way, and the page is cut
+    from their merge. Trigram matches only count if no shard has
+    prefix matches.
+    """
+    limit = (page + 1) * per_page + 1
+    results = fan_out(db.search_tree_ranked, search_query, limit)
+    fuzzy = all(found_fuzzy for _, found_fuzzy in results)
+    rows = [row for found, found_fuzzy in results if found_fuzzy == fuzzy for row in found]
+    # ORDER BY rank, Price, tree_inventory_id; the rank is the last column
+    rows.sort(key=lambda row: (row[-1], _sql_order(row[12]), row[16]))
+    start = page * per_page
+    return [tuple(row[:-1]) for row in rows[start:start + per_page + 1]], fuzzy
+
+
+def get_tree_details(tree_inventory_id):
+    path = item_database(tree_inventory_id)
+    if path is None:
+        return None
+    with db.using(path):
+        return db.get_tree_details(tree_inventory_id)
+
+
+def get_facet_options(column):
+    return sorted(set().union(*fan_out(db.get_facet_options, column)), key=_sql_order)
+
+
+def _filtered(read, filters):
+    """
+    Calls read(where, params) on every shard with 'filters' (keyword
+    arguments of db.build_search_filter) built on that shard. Returns
+    the results in shard order.
+    """
+    def call():
+        where, params = db.build_search_filter(**filters)
+        return read(where, tuple(params))
+    return fan_out(call)
+
+
+def get_facet_counts(column, filters=None):
+    return _merge_counts(_filtered(functools.partial(db.get_facet_counts, column), filters or {}))
+
+
+def get_histogram(name, filters=None):
+    return _merge_counts(_filtered(functools.partial(db.get_histogram, name), filters or {}))
+
+
+def count_search_rows(filters):
+    return sum(_filtered(db.count_search_rows, filters))
+
+
+def _search_page(where, params, limit, after):
+    sql, page_params = db.build_search_query(where, params, limit, after)
+    return db.get_connection().execute(sql, page_params).fetchall()
+
+
+def search_page_rows(filters, limit=db.PAGE_SIZE, after=None):
+    """
+    db.search_page_rows over all shards: each shard returns its page
+    after the same key, and the first 'limit' rows of their merge in
+    (tree_common_name, tree_inventory_id) order are the page.
+    """
+    found = _filtered(lambda where, params: _search_page(where, params, limit + 1, after), filters)
+    rows = [row for page in found for row in page]
+    rows.sort(key=lambda row: (_sql_order(row[0]), row[-1]))
+    following = (rows[limit - 1][0], rows[limit - 1][-1]) if len(rows) > limit else None
+    return [tuple(row[:-1]) for row in rows[:limit]], following
+
+
+def get_order_status(email, limit=db.ORDERS_PAGE_SIZE, after=None):
+    """
+    db.get_order_status over all shards, merged newest first by the
+    same (placed_at, order_id) key.
+    """
+    def key(row):
+        return (row[1] or 0, row[0])
+
+    results = fan_out(db.get_order_status, email, limit, after)
+    rows = sorted((row for found, _ in results for row in found), key=key, reverse=True)
+    more = len(rows) > limit or any(following is not None for _, following in results)
+    return rows[:limit], key(rows[limit - 1]) if more else None
+
+
+def count_orders(email):
+    return sum(fan_out(db.count_orders, email))
+
+
+def place_order(tree_inventory_id, quantity, *customer):
+    """
+    db.place_order on the shard holding the item. An unknown item is
+    sold out, as it is without shards.
+    """
+    db.check_order_quantity(quantity)
+    path = item_database(tree_inventory_id)
+    if path is None:
+        return {"status": db.SOLD_OUT, "available": 0}
+    with db.using(path):
+        return db.place_order(tree_inventory_id, quantity, *customer)
+
+
+# --------------------------------
+# Splitting a database into shards
+# --------------------------------
+def _temp_ids(conn, table, rows):
+    conn.execute(f"CREATE TEMP TABLE {table} (value PRIMARY KEY)")
+    conn.executemany(f"INSERT OR IGNORE INTO temp.{table} VALUES (?)", rows)
+
+
+def split(source, shards=None):
+    """
+    Partitions database 'source' into the shard files, which must not
+    exist yet. Each shard starts as a copy of the source (backup API)
+    and keeps only its nurseries, their inventory, the orders for that
+    inventory and the whole Trees catalog; orders for items that no
+    longer exist stay with the first shard. Returns {shard name:
+    (inventory rows, orders)}.
+    """
+    shards = shards or SHARDS
+    if not shards:
+        raise ValueError("no shards configured (set HASAR_SHARDS)")
+    for shard in shards:
+        if os.path.exists(shard["path"]):
+            raise ValueError(f"Shard file already exists: {shard['path']}")
+    with db.using(source):
+        source_conn = db.get_connection(write=True)
+    nursery_names = [row[0] for row in source_conn.execute(
+        "SELECT Nursery_name FROM Nurseries UNION SELECT nursery_name FROM Nursery_Tree_Inventory"
+    )]
+
+    sizes = {}
+    for number, shard in enumerate(shards):
+        elsewhere = [(name,) for name in nursery_names if name is not None and _owner(name, shards) is not shard]
+        conn = sqlite3.connect(shard["path"])
+        source_conn.backup(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        _temp_ids(conn, "elsewhere", elsewhere)
+        _temp_ids(conn, "other_items", conn.execute(
+            "SELECT tree_inventory_id FROM Nursery_Tree_Inventory WHERE nursery_name IN temp.elsewhere"
+        ).fetchall())
+        conn.execute("DELETE FROM Nursery_Tree_Inventory WHERE tree_inventory_id IN temp.other_items")
+        conn.execute("DELETE FROM Nurseries WHERE Nursery_name IN temp.elsewhere")
+
+        # Orders for another shard's items (and, past the first shard,
+        # for items that no longer exist). The event log is append-only
+        # except here.
+        if number == 0:
+            condition = "tree_inventory_id IN temp.other_items"
+        else:
+            condition = ("tree_inventory_id IS NULL OR tree_inventory_id NOT IN "
+                         "(SELECT tree_inventory_id FROM Nursery_Tree_Inventory)")
+        _temp_ids(conn, "other_orders", conn.execute(f"SELECT order_id FROM Orders WHERE {condition}").fetchall())
+        guard = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'order_events_no_delete'").fetchone()[0]
+        conn.execute("DROP TRIGGER order_events_no_delete")
+        conn.execute("DELETE FROM Order_Status_Events WHERE order_id IN temp.other_orders")
+        conn.execute(guard)
+        conn.execute("DELETE FROM Order_Latest_Status WHERE order_id IN temp.other_orders")
+        conn.execute("DELETE FROM Orders WHERE order_id IN temp.other_orders")
+        conn.execute(f"DELETE FROM Customers WHERE {condition}")
+        if number:
+            conn.execute("DELETE FROM status")  # legacy rows, already in the event log
+        for table in ("elsewhere", "other_items", "other_orders"):
+            conn.execute(f"DROP TABLE temp.{table}")
+        conn.commit()
+        conn.execute("VACUUM")
+        sizes[shard["name"]] = (
+            conn.execute("SELECT COUNT(*) FROM Nursery_Tree_Inventory").fetchone()[0],
+            conn.execute("SELECT COUNT(*) FROM Orders").fetchone()[0],
+        )
+        conn.close()
+    prepare(shards)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nursery shards and read replicas.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split_parser = commands.add_parser("split", help="partition a database into the shards of HASAR_SHARDS")
+    split_parser.add_argument("source")
+    replicate_parser = commands.add_parser("replicate", help="refresh the read replica of every database")
+    replicate_parser.add_argument("--every", type=float, default=0, help="repeat every N seconds")
+    commands.add_parser("sync-trees", help="copy the first shard's Trees catalog to the other shards")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        for name, (items, orders) in split(args.source).items():
+            print(f"{name}: {items} inventory rows, {orders} orders")
+        return
+    if args.command == "sync-trees":
+        for path, written in sync_trees().items():
+            print(f"{path}: {written} tree row(s) written")
+        return
+    while True:
+        start = time.perf_counter()
+        for path in databases():
+            db.refresh_replica(path)
+        print(f"Refreshed {len(databases())} replica(s) in {time.perf_counter() - start:.2f}s")
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+api.app: invalid requests are answered with 4xx, never 500.
+"""
+import asyncio
+import json
+
+import pytest
+
+import api
+import db
+from bench import datagen
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path):
+    path = str(tmp_path / "api.db")
+    datagen.generate(path, 50)
+    previous = db.DB_PATH
+    db.configure(path)
+    yield path
+    db.configure(previous)
+
+
+def request(method, path, query="", body=None):
+    """
+    Calls the ASGI app once. Returns (status, decoded JSON body).
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": [], "query_string": query.encode()}
+    asyncio.run(api.app(scope, receive, send))
+    return messages[0]["status"], json.loads(messages[1]["body"] or b"null")
+
+
+def test_tree_details():
+    status, body = request("GET", "/api/trees/1")
+    assert status == 200 and body["tree_inventory_id"] == 1
+
+
+@pytest.mark.parametrize("item", ["0", str(2 ** 63), "9" * 40])
+def test_unknown_or_out_of_range_tree_is_404(item):
+    assert request("GET", f"/api/trees/{item}")[0] == 404
+
+
+@pytest.mark.parametrize("query", ["min_price=nan", "max_price=inf", "min_height=-inf", "max_growth_rate=NaN",
+                                   "page_size=" + "9" * 30])
+def test_invalid_numbers_are_400(query):
+    assert request("GET", "/api/inventory", query)[0] == 400
+
+
+@pytest.mark.parametrize("query", ["page=" + str(2 ** 63), "page=" + str(2 ** 62)])
+def test_out_of_range_search_page_is_400(query):
+    assert request("GET", "/api/search", "q=maple&" + query)[0] == 400
+
+
+@pytest.mark.parametrize("payload", [
+    {"tree_inventory_id": 1, "quantity": 1, "email": {"a": 1}},
+    {"tree_inventory_id": 1, "quantity": 1, "address": ["x"]},
+    {"tree_inventory_id": 2 ** 63, "quantity": 1},
+    {"tree_inventory_id": 1, "quantity": 2 ** 63},
+    {"tree_inventory_id": 1, "quantity": -5},
+])
+def test_invalid_orders_are_400(payload):
+    assert request("POST", "/api/orders", body=payload)[0] == 400
+
+
+def test_order_is_placed():
+    status, body = request("POST", "/api/orders", body={"tree_inventory_id": 1, "quantity": 1, "email": "a@b.c"})
+    assert status in (201, 409) and body["status"] in (db.ORDER_PLACED, db.SOLD_OUT)
@@ -0,0 +1,91 @@
+"""
+export.export: a failed run leaves the export directory as it was.
+"""
+import os
+import sqlite3
+
+import pytest
+
+import export
+import schema
+from bench import datagen
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    datagen.generate(path, 50)
+    return path
+
+
+def _files(out_dir):
+    return sorted(os.path.relpath(os.path.join(root, name), out_dir)
+                  for root, _, names in os.walk(out_dir) for name in names)
+
+
+def test_export_writes_parts_and_drops_snapshot(source, tmp_path):
+    out_dir = str(tmp_path / "out")
+    manifest = export.export(out_dir, source, fmt="csv")
+    assert manifest["run"] == 1
+    assert not any(name.startswith("snapshot-") for name in _files(out_dir))
+
+
+@pytest.mark.parametrize("keep_snapshot", [False, True])
+def test_failed_export_removes_its_parts(source, tmp_path, monkeypatch, keep_snapshot):
+    out_dir = str(tmp_path / "out")
+    export.export(out_dir, source, fmt="csv", full=True)
+    before = _files(out_dir)
+    write_part = export.write_part
+
+    def failing(path, fmt, types, chunks):
+        write_part(path, fmt, types, chunks)
+        if "Search" in path:
+            raise OSError("disk full")
+        return 0
+
+    monkeypatch.setattr(export, "write_part", failing)
+    with pytest.raises(OSError):
+        export.export(out_dir, source, fmt="csv", full=True, keep_snapshot=keep_snapshot)
+    snapshot = ["snapshot-00002.db"] if keep_snapshot else []
+    assert _files(out_dir) == sorted(before + snapshot)
+    assert export.load_manifest(out_dir)["run"] == 1
+
+
+def _add_customer(path, quantity):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO Customers (Quantity, Email) VALUES (?, 'export@example.com')", (quantity,))
+    conn.close()
+
+
+def test_appended_parts_keep_the_first_parts_types(source, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out_dir = str(tmp_path / "out")
+    _add_customer(source, 2.5)  # Quantity holds integers and a real: float64
+    export.export(out_dir, source, tables=["Customers"])
+    _add_customer(source, 3)  # only integers in the new part
+    manifest = export.export(out_dir, source, tables=["Customers"])
+    parts = [pq.read_schema(os.path.join(out_dir, part["file"])) for part in manifest["tables"]["Customers"]["files"]]
+    assert len(parts) == 2
+    assert parts[0] == parts[1]
+    assert str(parts[1].field("Quantity").type) == "double"
+
+
+def test_appended_part_that_does_not_fit_fails(source, tmp_path):
+    pytest.importorskip("pyarrow")
+    out_dir = str(tmp_path / "out")
+    export.export(out_dir, source, tables=["Customers"])
+    _add_customer(source, 2.5)
+    with pytest.raises(ValueError, match="--full"):
+        export.export(out_dir, source, tables=["Customers"])
+    assert export.load_manifest(out_dir)["run"] == 1
+
+
+def test_export_does_not_migrate_the_source(source, tmp_path):
+    conn = sqlite3.connect(source)
+    conn.execute(f"PRAGMA user_version = {schema.SCHEMA_VERSION - 1}")
+    conn.close()
+    export.export(str(tmp_path / "out"), source, fmt="csv")
+    conn = sqlite3.connect(source)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == schema.SCHEMA_VERSION - 1
+    conn.close()
@@ -0,0 +1,82 @@
+"""
+importer: chunked CSV imports, their ledger and concurrent orders.
+"""
+import io
+import threading
+
+import pytest
+
+import db
+import importer
+from bench import datagen
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "import.db")
+    datagen.generate(path, 50)
+    with db.using(path):
+        yield path
+
+
+def _inventory_csv(rows):
+    lines = ["nursery_name,tree_common_name,Packaging_type,Quantity_in_stock,Price"]
+    lines += [f"Import Nursery,Tree {n},Potted,5,{n}" for n in range(rows)]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def _imported():
+    return db.get_connection().execute(
+        "SELECT COUNT(*) FROM Nursery_Tree_Inventory WHERE nursery_name = 'Import Nursery'"
+    ).fetchone()[0]
+
+
+def test_order_is_placed_while_an_import_runs(database):
+    item = db.get_connection().execute("SELECT MIN(tree_inventory_id) FROM Nursery_Tree_Inventory").fetchone()[0]
+    with db.transaction() as conn:
+        conn.execute("UPDATE Nursery_Tree_Inventory SET Quantity_in_stock = 10 WHERE tree_inventory_id = ?", (item,))
+    results = []
+
+    def order():
+        with db.using(database):
+            results.append(db.place_order(item, 1, "test", "Test", "Test St", "0", "test@example.com", "Cash"))
+
+    def on_chunk(rows_read):
+        if rows_read == 100:
+            # The import is half done; the order must not wait for it.
+            buyer = threading.Thread(target=order)
+            buyer.start()
+            buyer.join(timeout=5)
+            assert not buyer.is_alive()
+
+    report = importer.import_csv("Nursery_Tree_Inventory", _inventory_csv(200), chunk_rows=100, on_chunk=on_chunk)
+    assert report["inserted"] == 200
+    assert results and results[0]["status"] == db.ORDER_PLACED
+
+
+def test_interrupted_import_resumes_after_committed_chunks(database):
+    data = _inventory_csv(250).getvalue()
+    digest = importer.content_hash(data)
+    importer._start_ledger([database], "Nursery_Tree_Inventory", digest, "inventory.csv")
+
+    def interrupt(rows_read):
+        if rows_read == 200:
+            raise RuntimeError("worker stopped")
+
+    with pytest.raises(RuntimeError):
+        importer.import_csv("Nursery_Tree_Inventory", io.BytesIO(data), chunk_rows=100, on_chunk=interrupt,
+                            digest=digest)
+    assert _imported() == 200
+
+    report = importer.import_csv("Nursery_Tree_Inventory", io.BytesIO(data), chunk_rows=100, digest=digest)
+    assert (report["resumed"], report["rows_read"], report["inserted"]) == (200, 250, 250)
+    assert _imported() == 250
+
+
+@pytest.mark.parametrize("price", ["nan", "inf", "-inf", "NaN"])
+def test_non_finite_price_is_rejected(price):
+    header = ["nursery_name", "tree_common_name", "Packaging_type", "Price"]
+    mapping, _ = importer.map_columns("Nursery_Tree_Inventory", header)
+    row = {"nursery_name": "Import Nursery", "tree_common_name": "Tree 1", "Packaging_type": "Potted", "Price": price}
+    with pytest.raises(ValueError, match="Price"):
+        importer.validate_row("Nursery_Tree_Inventory", row, mapping)
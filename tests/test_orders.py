@@ -0,0 +1,46 @@
+"""
+db.place_order: stock reservation and argument checks.
+"""
+import pytest
+
+import db
+from bench import datagen
+
+
+@pytest.fixture
+def item(tmp_path):
+    path = str(tmp_path / "orders.db")
+    datagen.generate(path, 50)
+    with db.using(path):
+        with db.transaction() as conn:
+            item = conn.execute("SELECT MIN(tree_inventory_id) FROM Nursery_Tree_Inventory").fetchone()[0]
+            conn.execute("UPDATE Nursery_Tree_Inventory SET Quantity_in_stock = 10 WHERE tree_inventory_id = ?",
+                         (item,))
+        yield item
+
+
+def _stock(item):
+    return db.get_connection().execute(
+        "SELECT Quantity_in_stock FROM Nursery_Tree_Inventory WHERE tree_inventory_id = ?", (item,)
+    ).fetchone()[0]
+
+
+def _order(item, quantity):
+    return db.place_order(item, quantity, "test", "Test", "Test St", "0", "test@example.com", "Cash on Delivery")
+
+
+def test_order_reserves_stock(item):
+    assert _order(item, 3)["status"] == db.ORDER_PLACED
+    assert _stock(item) == 7
+
+
+def test_order_beyond_stock_is_sold_out(item):
+    assert _order(item, 11) == {"status": db.SOLD_OUT, "available": 10}
+    assert _stock(item) == 10
+
+
+@pytest.mark.parametrize("quantity", [0, -5, 2.0, "3", True, None])
+def test_invalid_quantity_is_rejected(item, quantity):
+    with pytest.raises(ValueError):
+        _order(item, quantity)
+    assert _stock(item) == 10
@@ -0,0 +1,59 @@
+"""
+perf.InstrumentedCursor: statement timings include fetching the rows.
+"""
+import logging
+import sqlite3
+import time
+
+import pytest
+
+import perf
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    perf.reset()
+    monkeypatch.setattr(perf, "SLOW_QUERY_MS", 20.0)
+    conn = sqlite3.connect(":memory:", factory=perf.InstrumentedConnection)
+
+    def slow(value):
+        time.sleep(0.001)
+        return value
+
+    conn.create_function("slow", 1, slow)
+    conn.execute("CREATE TABLE t (value INTEGER)")
+    yield conn
+    conn.close()
+    perf.reset()
+
+
+SLOW_SELECT = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 50) SELECT slow(x) FROM n"
+
+
+def _stats(sql):
+    return perf.snapshot()["queries"][perf.fingerprint(sql)]
+
+
+def test_streamed_select_is_timed_until_exhausted(conn, caplog):
+    with caplog.at_level(logging.WARNING, logger="hasar.perf"):
+        rows = [row for row in conn.execute(SLOW_SELECT)]
+    stats = _stats(SLOW_SELECT)
+    assert len(rows) == 50
+    assert stats["count"] == 1 and stats["rows"] == 50
+    assert stats["total_ms"] >= 45
+    assert "slow query" in caplog.text
+
+
+def test_partly_fetched_select_is_recorded_when_dropped(conn):
+    assert conn.execute(SLOW_SELECT).fetchone() == (1,)
+    stats = _stats(SLOW_SELECT)
+    assert stats["count"] == 1 and stats["rows"] == 1
+
+
+def test_slow_executemany_is_logged(conn, caplog):
+    sql = "INSERT INTO t VALUES (slow(?))"
+    with caplog.at_level(logging.WARNING, logger="hasar.perf"):
+        conn.executemany(sql, ((n,) for n in range(40)))
+    stats = _stats(sql)
+    assert stats["count"] == 1 and stats["rows"] == 40
+    assert "slow query" in caplog.text
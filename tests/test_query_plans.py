@@ -0,0 +1,38 @@
+"""
+Every hot query (schema.hot_queries) must be served by an index: a
+plan falling back to a full table scan fails the suite.
+"""
+import sqlite3
+
+import pytest
+
+import schema
+from bench import datagen
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    schema.bootstrap(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def populated_db(tmp_path):
+    path = str(tmp_path / "plans.db")
+    datagen.generate(path, 2000)
+    conn = sqlite3.connect(path)
+    schema.bootstrap(conn)
+    conn.execute("ANALYZE")
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_use_indexes(empty_db):
+    assert schema.check_query_plans(empty_db) == []
+
+
+def test_hot_queries_use_indexes_with_statistics(populated_db):
+    # With sqlite_stat1 filled in, the planner weighs real row counts.
+    assert schema.check_query_plans(populated_db) == []
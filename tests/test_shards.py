@@ -0,0 +1,131 @@
+"""
+shards: writes that span shards (CSV imports, transaction_all).
+"""
+import io
+
+import pytest
+
+import db
+import importer
+import shards
+
+
+@pytest.fixture
+def two_shards(tmp_path, monkeypatch):
+    entries = [
+        {"name": "north", "path": str(tmp_path / "north.db"), "nurseries": ["Green Hills"]},
+        {"name": "south", "path": str(tmp_path / "south.db"), "nurseries": ["Basra Palms"]},
+    ]
+    monkeypatch.setattr(shards, "SHARDS", entries)
+    monkeypatch.setattr(shards, "ENABLED", True)
+    monkeypatch.setattr(shards, "_prepared", False)
+    return [entry["path"] for entry in entries]
+
+
+def _rows(path, sql):
+    with db.using(path):
+        return db.get_connection().execute(sql).fetchall()
+
+
+def _csv(text):
+    return io.BytesIO(text.encode())
+
+
+def test_trees_import_goes_to_every_shard(two_shards):
+    report = importer.import_csv("Trees", _csv("Common_name,Origin\nOak,Local\nPine,Imported\n"))
+    assert (report["inserted"], report["updated"]) == (2, 0)
+    for path in two_shards:
+        assert _rows(path, "SELECT tree_id, Common_name FROM Trees ORDER BY tree_id") == [(1, "Oak"), (2, "Pine")]
+
+
+def test_inventory_import_goes_to_each_nursery_shard(two_shards):
+    report = importer.import_csv("Nursery_Tree_Inventory", _csv(
+        "nursery_name,tree_common_name,Packaging_type,Price\n"
+        "Green Hills,Oak,Potted,10\nBasra Palms,Oak,Potted,12\nElsewhere,Pine,Bare root,5\n"
+    ))
+    assert report["inserted"] == 3
+    sql = "SELECT nursery_name FROM Nursery_Tree_Inventory ORDER BY nursery_name"
+    assert _rows(two_shards[0], sql) == [("Elsewhere",), ("Green Hills",)]
+    assert _rows(two_shards[1], sql) == [("Basra Palms",)]
+
+
+def test_import_without_route_column_is_refused(two_shards):
+    with pytest.raises(ValueError, match="shard"):
+        importer.import_csv("Nurseries", _csv("Registration_code,Address\nR1,Erbil\n"))
+
+
+def test_transaction_all_rolls_back_every_shard(two_shards):
+    with pytest.raises(RuntimeError):
+        with shards.transaction_all() as conns:
+            for conn in conns.values():
+                conn.execute("INSERT INTO Trees (Common_name) VALUES ('Oak')")
+            raise RuntimeError("second write failed")
+    for path in two_shards:
+        assert _rows(path, "SELECT COUNT(*) FROM Trees") == [(0,)]
+
+
+def test_submitted_import_is_ledgered_in_every_shard(two_shards):
+    data = b"Common_name\nOak\n"
+    job = importer.submit_import("Trees", "trees.csv", data)
+    importer._executor.submit(lambda: None).result()  # wait for the worker
+    assert job.done and job.error is None
+    for path in two_shards:
+        assert _rows(path, "SELECT status FROM Import_Ledger") == [("done",)]
+    importer._jobs.clear()
+    assert importer.submit_import("Trees", "trees.csv", data).skipped
+
+
+def test_order_status_merges_shards_by_placement_time(two_shards):
+    # Later shards hand out higher ids, whenever their orders were placed
+    placed = {two_shards[0]: [(1, 300.0), (2, 100.0), (3, None)],
+              two_shards[1]: [(shards.ID_BLOCK + 1, 200.0), (shards.ID_BLOCK + 2, 300.0)]}
+    for path, orders in placed.items():
+        with db.using(path), db.transaction() as conn:
+            for order_id, placed_at in orders:
+                conn.execute("INSERT INTO Customers (customer_id, Email) VALUES (?, 'a@example.com')", (order_id,))
+                conn.execute("INSERT INTO Orders (order_id, customer_id, Quantity, placed_at) VALUES (?, ?, 1, ?)",
+                             (order_id, order_id, placed_at))
+    seen, after = [], None
+    while True:
+        rows, after = shards.get_order_status("a@example.com", 2, after)
+        seen += [row[0] for row in rows]
+        if after is None:
+            break
+    assert seen == [shards.ID_BLOCK + 2, 1, shards.ID_BLOCK + 1, 2, 3]
+
+
+def test_overlap_filter_is_built_on_each_shard(two_shards, tmp_path):
+    importer.import_csv("Trees", _csv("Common_name\nOak\n"))
+    importer.import_csv("Nursery_Tree_Inventory", _csv(
+        "nursery_name,tree_common_name,Packaging_type,Min_height,Max_height\n"
+        "Green Hills,Oak,Potted,100,150\nBasra Palms,Oak,Potted,140,200\nBasra Palms,Oak,Bare root,300,400\n"
+    ))
+    filters = {"min_height": 145.0, "max_height": 160.0, "height_mode": db.HEIGHT_OVERLAPS}
+    elsewhere = tmp_path / "elsewhere.db"
+    with db.using(str(elsewhere)):
+        assert shards.count_search_rows(filters) == 2
+        rows, _ = shards.search_page_rows(filters)
+    assert len(rows) == 2
+    assert not elsewhere.exists()
+
+
+def test_sync_trees_repairs_a_shard_left_behind(two_shards):
+    importer.import_csv("Trees", _csv("Common_name,Origin\nOak,Local\nPine,Imported\n"))
+    with db.using(two_shards[1]), db.transaction() as conn:
+        conn.execute("DELETE FROM Trees WHERE Common_name = 'Pine'")
+        conn.execute("UPDATE Trees SET Origin = 'Elsewhere' WHERE Common_name = 'Oak'")
+    assert shards.sync_trees() == {two_shards[1]: 2}
+    sql = "SELECT tree_id, Common_name, Origin FROM Trees ORDER BY tree_id"
+    assert _rows(two_shards[1], sql) == _rows(two_shards[0], sql)
+    assert shards.sync_trees() == {two_shards[1]: 0}
+
+
+def test_transaction_all_commits_the_first_database_first(two_shards):
+    committed = []
+    with shards.transaction_all() as conns:
+        for path, conn in conns.items():
+            conn.execute("INSERT INTO Trees (Common_name) VALUES ('Oak')")
+            conn.set_trace_callback(lambda sql, path=path: sql == "COMMIT" and committed.append(path))
+    for conn in conns.values():
+        conn.set_trace_callback(None)
+    assert committed == two_shards